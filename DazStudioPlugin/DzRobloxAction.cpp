@@ -334,7 +334,7 @@ void DzRobloxAction::executeAction()
 
 		// 2. attempt copy to plugindata folder, if already exist, use as override
         // search for override files in folder with DLL and copy over extracted files
-		QStringList aOverrideFilenameList = (QStringList() << "blender_tools.py" << "NodeArrange.py" << "blender_dtu_to_roblox_blend.py");
+		QStringList aOverrideFilenameList = (QStringList() << "blender_tools.py" << "NodeArrange.py" << "blender_dtu_to_roblox_blend.py" << "blender_retarget_tools.py" << "G9_R15_bone_mapping.json" << "G8_R15_bone_mapping.json" << "blender_weight_tools.py" << "blender_cage_tools.py" << "blender_preflight_tools.py" << "blender_uv_tools.py" << "blender_texture_tools.py" << "genesis9_torso_modesty_overlay_d.png" << "genesis9_torso_modesty_overlay_d_M.png" << "genesis9_torso_modesty_overlay_nm.png" << "genesis9_torso_modesty_overlay_r.png" << "blender_shape_key_tools.py" << "blender_mesh_tools.py" << "blender_scene_tools.py" << "blender_array_tools.py" << "blender_variant_tools.py" << "blender_clothing_tools.py" << "blender_collision_tools.py" << "blender_metrics_tools.py" << "blender_estimate_tools.py" << "blender_fbx_tools.py" << "blender_mode_tools.py" << "blender_decimate_tools.py" << "blender_segmentation_tools.py" << "blender_facs_tools.py" << "G9_FACS_mapping.json" << "blender_verify_tools.py");
 		if (sPluginFolder.isEmpty() == false)
 		{
 			foreach(QString filename, aOverrideFilenameList)
@@ -0,0 +1,326 @@
+"""Blender Array Tools module
+
+Blender python module for a bulk-array intermediate format, used as a faster
+alternative to importing the Daz Studio FBX export. The file is a NumPy .npz
+container holding the DTU, a small JSON scene description and, per object, flat
+arrays for vertices, polygons, loops, UV layers, material indices, vertex
+group weights (COO), shape keys and armature rest bones. The Blender importer
+builds each mesh with a handful of foreach_set() calls.
+
+The writer and reader only need NumPy, so archives can be produced, verified
+and benchmarked outside of Blender. export_scene_to_array_archive() writes the
+current Blender scene, e.g. right after an FBX import, stamped with the size
+and modification time of that FBX so a re-exported FBX is not shadowed by an
+old archive.
+
+Requirements:
+    - Python 3+
+    - NumPy
+    - Blender 3.6+ for the importer and scene exporter
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_array_tools.log"
+
+## Do not modify below
+import sys, os, json, time
+import numpy as np
+try:
+    import bpy
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+try:
+    import blender_weight_tools
+except:
+    sys.path.append(script_dir)
+    import blender_weight_tools
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+ARRAY_ARCHIVE_VERSION = 1
+ARRAY_ARCHIVE_SUFFIX = "_arrays.npz"
+
+# per object array names and dtypes, keys in the archive are "<object index>_<array name>"
+MESH_ARRAY_DTYPES = {
+    "co": np.float32,
+    "loop_vertex": np.int32,
+    "polygon_loop_start": np.int32,
+    "polygon_loop_total": np.int32,
+    "polygon_material": np.int32,
+    "polygon_smooth": np.bool_,
+    "weight_vertex": np.int32,
+    "weight_group": np.int32,
+    "weight_value": np.float32,
+}
+
+
+## Pure python writer and reader
+def get_source_stamp(source_path):
+    # size and modification time of the file an archive was made from
+    file_stat = os.stat(source_path)
+    return {"bytes": int(file_stat.st_size), "mtime_ns": int(file_stat.st_mtime_ns)}
+
+def write_array_archive(archive_path, dtu_dict, object_list, compress=False, source_stamp=None):
+    # object_list: [{"name", "type", "parent", "matrix_world", ...metadata, "arrays": {name: ndarray}}]
+    # metadata lists: "materials", "uv_layers", "vertex_groups", "shape_keys", "bones"
+    # source_stamp: get_source_stamp() of the fbx the scene was imported from
+    scene_list = []
+    arrays = {}
+    for obj_index, obj_dict in enumerate(object_list):
+        scene_list.append(dict((key, value) for key, value in obj_dict.items() if key != "arrays"))
+        for array_name, array in obj_dict.get("arrays", {}).items():
+            arrays[str(obj_index) + "_" + array_name] = np.ascontiguousarray(array)
+    arrays["version"] = np.array([ARRAY_ARCHIVE_VERSION], dtype=np.int32)
+    arrays["dtu_json"] = np.frombuffer(json.dumps(dtu_dict).encode("utf-8"), dtype=np.uint8)
+    arrays["scene_json"] = np.frombuffer(json.dumps(scene_list).encode("utf-8"), dtype=np.uint8)
+    if source_stamp is not None:
+        arrays["source_json"] = np.frombuffer(json.dumps(source_stamp).encode("utf-8"), dtype=np.uint8)
+    if compress:
+        np.savez_compressed(archive_path, **arrays)
+    else:
+        np.savez(archive_path, **arrays)
+
+def read_array_archive(archive_path):
+    # returns (dtu_dict, object_list) in the same layout as write_array_archive()
+    with np.load(archive_path, allow_pickle=False) as archive:
+        version = int(archive["version"][0])
+        if version != ARRAY_ARCHIVE_VERSION:
+            raise ValueError("unsupported array archive version: " + str(version))
+        dtu_dict = json.loads(archive["dtu_json"].tobytes().decode("utf-8"))
+        scene_list = json.loads(archive["scene_json"].tobytes().decode("utf-8"))
+        object_list = []
+        for obj_index, obj_dict in enumerate(scene_list):
+            prefix = str(obj_index) + "_"
+            obj_dict["arrays"] = dict((key[len(prefix):], archive[key]) for key in archive.files if key.startswith(prefix))
+            object_list.append(obj_dict)
+    return dtu_dict, object_list
+
+def is_array_archive_current(archive_path, source_path):
+    # True when archive_path was written from source_path as it is now, archives without a stamp count as stale
+    try:
+        with np.load(archive_path, allow_pickle=False) as archive:
+            if "source_json" not in archive.files:
+                return False
+            source_stamp = json.loads(archive["source_json"].tobytes().decode("utf-8"))
+    except Exception as e:
+        _add_to_log("ERROR: is_array_archive_current(): unable to read archive: " + archive_path + ", " + str(e))
+        return False
+    return os.path.exists(source_path) and source_stamp == get_source_stamp(source_path)
+
+def verify_array_archive(object_list):
+    # returns list of error strings for inconsistent mesh arrays
+    errors = []
+    for obj_dict in object_list:
+        if obj_dict["type"] != "MESH":
+            continue
+        arrays = obj_dict["arrays"]
+        name = obj_dict["name"]
+        num_vertices = len(arrays["co"])
+        num_loops = len(arrays["loop_vertex"])
+        if num_loops > 0 and (arrays["loop_vertex"].min() < 0 or arrays["loop_vertex"].max() >= num_vertices):
+            errors.append(name + ": loop vertex index out of range")
+        if int(arrays["polygon_loop_total"].sum()) != num_loops:
+            errors.append(name + ": polygon loop totals do not add up to the loop count")
+        if len(arrays["polygon_material"]) > 0 and arrays["polygon_material"].max() >= max(1, len(obj_dict["materials"])):
+            errors.append(name + ": material index out of range")
+        for uv_index in range(len(obj_dict["uv_layers"])):
+            if arrays["uv_" + str(uv_index)].shape != (num_loops, 2):
+                errors.append(name + ": uv layer " + str(uv_index) + " does not match loop count")
+        for key_index in range(len(obj_dict["shape_keys"])):
+            if arrays["shape_key_" + str(key_index)].shape != (num_vertices, 3):
+                errors.append(name + ": shape key " + str(key_index) + " does not match vertex count")
+        if len(arrays["weight_group"]) > 0 and arrays["weight_group"].max() >= len(obj_dict["vertex_groups"]):
+            errors.append(name + ": vertex group index out of range")
+    return errors
+
+
+## Blender scene -> arrays
+def read_mesh_arrays(mesh_obj):
+    mesh = mesh_obj.data
+    num_vertices = len(mesh.vertices)
+    num_loops = len(mesh.loops)
+    num_polygons = len(mesh.polygons)
+    arrays = {}
+    for array_name, collection, attribute, size in [
+        ("co", mesh.vertices, "co", num_vertices * 3),
+        ("loop_vertex", mesh.loops, "vertex_index", num_loops),
+        ("polygon_loop_start", mesh.polygons, "loop_start", num_polygons),
+        ("polygon_loop_total", mesh.polygons, "loop_total", num_polygons),
+        ("polygon_material", mesh.polygons, "material_index", num_polygons),
+        ("polygon_smooth", mesh.polygons, "use_smooth", num_polygons),
+    ]:
+        array = np.empty(size, dtype=MESH_ARRAY_DTYPES[array_name])
+        collection.foreach_get(attribute, array)
+        arrays[array_name] = array
+    arrays["co"] = arrays["co"].reshape(-1, 3)
+    for uv_index, uv_layer in enumerate(mesh.uv_layers):
+        uv = np.empty(num_loops * 2, dtype=np.float32)
+        uv_layer.data.foreach_get("uv", uv)
+        arrays["uv_" + str(uv_index)] = uv.reshape(-1, 2)
+    vertex_indices, group_indices, weights = blender_weight_tools.read_vertex_group_weights(mesh_obj)
+    arrays["weight_vertex"] = vertex_indices.astype(np.int32)
+    arrays["weight_group"] = group_indices.astype(np.int32)
+    arrays["weight_value"] = weights.astype(np.float32)
+    shape_key_names = []
+    if mesh.shape_keys is not None:
+        for key_index, key_block in enumerate(mesh.shape_keys.key_blocks):
+            coords = np.empty(num_vertices * 3, dtype=np.float32)
+            key_block.data.foreach_get("co", coords)
+            arrays["shape_key_" + str(key_index)] = coords.reshape(-1, 3)
+            shape_key_names.append(key_block.name)
+    metadata = {
+        "materials": [mat.name if mat is not None else None for mat in mesh.materials],
+        "uv_layers": [uv_layer.name for uv_layer in mesh.uv_layers],
+        "active_uv_layer": mesh.uv_layers.active_index,
+        "vertex_groups": [vertex_group.name for vertex_group in mesh_obj.vertex_groups],
+        "shape_keys": shape_key_names,
+    }
+    return metadata, arrays
+
+def read_armature_arrays(armature_obj):
+    bones = armature_obj.data.bones
+    bone_names = [bone.name for bone in bones]
+    bone_index = dict((name, index) for index, name in enumerate(bone_names))
+    arrays = {
+        "bone_parent": np.array([bone_index[bone.parent.name] if bone.parent is not None else -1 for bone in bones], dtype=np.int32),
+        "bone_head": np.array([bone.head_local[:] for bone in bones], dtype=np.float32).reshape(-1, 3),
+        "bone_tail": np.array([bone.tail_local[:] for bone in bones], dtype=np.float32).reshape(-1, 3),
+        "bone_z_axis": np.array([bone.matrix_local.col[2][:3] for bone in bones], dtype=np.float32).reshape(-1, 3),
+    }
+    return {"bones": bone_names}, arrays
+
+def export_scene_to_array_archive(archive_path, dtu_dict, compress=False, source_path=None):
+    # write mesh, armature and empty objects of the current scene, source_path is the fbx they were imported from
+    start_time = time.perf_counter()
+    object_list = []
+    for obj in bpy.data.objects:
+        if obj.type not in ["MESH", "ARMATURE", "EMPTY"]:
+            continue
+        obj_dict = {
+            "name": obj.name,
+            "type": obj.type,
+            "parent": obj.parent.name if obj.parent is not None else None,
+            "matrix_world": [list(row) for row in obj.matrix_world],
+            "armature": None,
+        }
+        arrays = {}
+        if obj.type == "MESH":
+            metadata, arrays = read_mesh_arrays(obj)
+            obj_dict.update(metadata)
+            for mod in obj.modifiers:
+                if mod.type == "ARMATURE" and mod.object is not None:
+                    obj_dict["armature"] = mod.object.name
+                    break
+        elif obj.type == "ARMATURE":
+            metadata, arrays = read_armature_arrays(obj)
+            obj_dict.update(metadata)
+        obj_dict["arrays"] = arrays
+        object_list.append(obj_dict)
+    source_stamp = get_source_stamp(source_path) if source_path is not None else None
+    write_array_archive(archive_path, dtu_dict, object_list, compress, source_stamp)
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: export_scene_to_array_archive(): wrote " + str(len(object_list)) + " objects to " + archive_path + " in " + str(round(elapsed_time, 3)) + " seconds")
+
+
+## arrays -> Blender scene
+def get_or_create_material(material_name):
+    mat = bpy.data.materials.get(material_name)
+    if mat is None:
+        mat = bpy.data.materials.new(material_name)
+        mat.use_nodes = True
+    return mat
+
+def build_mesh_object(obj_dict):
+    arrays = obj_dict["arrays"]
+    mesh = bpy.data.meshes.new(obj_dict["name"])
+    mesh.vertices.add(len(arrays["co"]))
+    mesh.loops.add(len(arrays["loop_vertex"]))
+    mesh.polygons.add(len(arrays["polygon_loop_start"]))
+    mesh.vertices.foreach_set("co", arrays["co"].ravel())
+    mesh.loops.foreach_set("vertex_index", arrays["loop_vertex"])
+    mesh.polygons.foreach_set("loop_start", arrays["polygon_loop_start"])
+    mesh.polygons.foreach_set("loop_total", arrays["polygon_loop_total"])
+    mesh.polygons.foreach_set("material_index", arrays["polygon_material"])
+    mesh.polygons.foreach_set("use_smooth", arrays["polygon_smooth"])
+    for uv_index, uv_name in enumerate(obj_dict["uv_layers"]):
+        uv_layer = mesh.uv_layers.new(name=uv_name)
+        uv_layer.data.foreach_set("uv", arrays["uv_" + str(uv_index)].ravel())
+    if len(obj_dict["uv_layers"]) > 0:
+        mesh.uv_layers.active_index = obj_dict["active_uv_layer"]
+    for material_name in obj_dict["materials"]:
+        mesh.materials.append(get_or_create_material(material_name) if material_name is not None else None)
+    mesh.update(calc_edges=True)
+    mesh.validate()
+
+    obj = bpy.data.objects.new(obj_dict["name"], mesh)
+    vertex_groups = [obj.vertex_groups.new(name=group_name) for group_name in obj_dict["vertex_groups"]]
+    group_indices = arrays["weight_group"]
+    order = np.argsort(group_indices, kind="stable")
+    split_points = np.cumsum(np.bincount(group_indices, minlength=len(vertex_groups)))[:-1]
+    for vertex_group, block in zip(vertex_groups, np.split(order, split_points)):
+        if len(block) > 0:
+            blender_weight_tools.write_vertex_group_weights(vertex_group, arrays["weight_vertex"][block], arrays["weight_value"][block])
+    for key_index, key_name in enumerate(obj_dict["shape_keys"]):
+        key_block = obj.shape_key_add(name=key_name, from_mix=False)
+        key_block.data.foreach_set("co", arrays["shape_key_" + str(key_index)].ravel())
+    return obj
+
+def build_armature_object(obj_dict):
+    arrays = obj_dict["arrays"]
+    armature = bpy.data.armatures.new(obj_dict["name"])
+    obj = bpy.data.objects.new(obj_dict["name"], armature)
+    bpy.context.scene.collection.objects.link(obj)
+    bpy.context.view_layer.objects.active = obj
+    bpy.ops.object.mode_set(mode="EDIT")
+    edit_bones = [armature.edit_bones.new(bone_name) for bone_name in obj_dict["bones"]]
+    for bone_index, edit_bone in enumerate(edit_bones):
+        edit_bone.head = arrays["bone_head"][bone_index].tolist()
+        edit_bone.tail = arrays["bone_tail"][bone_index].tolist()
+        edit_bone.align_roll(arrays["bone_z_axis"][bone_index].tolist())
+        parent_index = int(arrays["bone_parent"][bone_index])
+        if parent_index >= 0:
+            edit_bone.parent = edit_bones[parent_index]
+    bpy.ops.object.mode_set(mode="OBJECT")
+    return obj
+
+def import_array_archive(archive_path):
+    # build the scene stored in archive_path, returns the DTU dict
+    start_time = time.perf_counter()
+    dtu_dict, object_list = read_array_archive(archive_path)
+    if dtu_dict.get("Has Animation", False):
+        # animation curves are not stored in the archive, use the fbx
+        _add_to_log("DEBUG: import_array_archive(): DTU has animation, skipping archive: " + archive_path)
+        return None
+    errors = verify_array_archive(object_list)
+    if len(errors) > 0:
+        _add_to_log("ERROR: import_array_archive(): invalid archive: " + json.dumps(errors))
+        return None
+    created = {}
+    for obj_dict in object_list:
+        if obj_dict["type"] == "ARMATURE":
+            obj = build_armature_object(obj_dict)
+        elif obj_dict["type"] == "MESH":
+            obj = build_mesh_object(obj_dict)
+            bpy.context.scene.collection.objects.link(obj)
+        else:
+            obj = bpy.data.objects.new(obj_dict["name"], None)
+            bpy.context.scene.collection.objects.link(obj)
+        created[obj_dict["name"]] = obj
+    for obj_dict in object_list:
+        obj = created[obj_dict["name"]]
+        if obj_dict["parent"] in created:
+            obj.parent = created[obj_dict["parent"]]
+        obj.matrix_world = obj_dict["matrix_world"]
+        if obj_dict["armature"] in created:
+            mod = obj.modifiers.new(name="Armature", type="ARMATURE")
+            mod.object = created[obj_dict["armature"]]
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: import_array_archive(): imported " + str(len(created)) + " objects from " + archive_path + " in " + str(round(elapsed_time, 3)) + " seconds")
+    return dtu_dict
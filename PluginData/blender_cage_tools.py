@@ -0,0 +1,202 @@
+"""Blender Cage Tools module
+
+Blender python module to wrap the Roblox "CageMeshes" template from the UGC dev
+kit onto the converted character. A mathutils BVH tree is built over the
+triangles of the character's evaluated skinned meshes from bulk foreach_get()
+arrays, every cage vertex is matched to its nearest point on that surface, then
+all cage vertices are pushed out along the interpolated surface normal in one
+vectorized NumPy pass. Outer cages of layered clothing are then pushed out
+along their normals past the clothing item with BVH ray casts. Only vertex
+positions are written back, so the cage vertex order and UVs Roblox relies on
+are kept.
+
+Requirements:
+    - Python 3+
+    - Blender 3.6+ (uses the NumPy bundled with Blender)
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_cage_tools.log"
+
+## Do not modify below
+import sys, os, time
+import numpy as np
+try:
+    import bpy
+    import mathutils
+    from mathutils.bvhtree import BVHTree
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+# cage offset from the character surface, as a ratio of the character height
+CAGE_OFFSET_RATIO = 0.005
+# outer cage vertices only look for the item this far out along their normal, as a ratio of the character height
+CAGE_MAX_ITEM_DISTANCE_RATIO = 0.1
+# ray casts per outer cage vertex, each one continues behind the previous hit to get past every item layer
+CAGE_MAX_ITEM_LAYERS = 4
+
+
+def read_world_vertices(mesh_obj):
+    # returns world space (N,3) coordinates and (N,3) unit normals of mesh_obj
+    mesh = mesh_obj.data
+    num_vertices = len(mesh.vertices)
+    coords = np.empty(num_vertices * 3, dtype=np.float32)
+    normals = np.empty(num_vertices * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", coords)
+    mesh.vertices.foreach_get("normal", normals)
+    matrix_world = np.array(mesh_obj.matrix_world, dtype=np.float64)
+    coords = coords.reshape(-1, 3) @ matrix_world[:3,:3].T + matrix_world[:3,3]
+    # normals transform with the inverse transpose of the object matrix
+    normals = normals.reshape(-1, 3) @ np.linalg.inv(matrix_world[:3,:3])
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True).clip(1e-12)
+    return coords, normals
+
+def get_character_mesh_objects():
+    # skinned meshes which make up the character, excluding cages and attachments
+    character_objs = []
+    for obj in bpy.data.objects:
+        if obj.type != 'MESH' or "Cage" in obj.name or "Attachment" in obj.name:
+            continue
+        for mod in obj.modifiers:
+            if mod.type == "ARMATURE":
+                character_objs.append(obj)
+                break
+    return character_objs
+
+def read_surface_arrays(obj_list):
+    # world space coordinates, vertex normals and triangles of the evaluated meshes of obj_list, joined into one surface
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    coords_list = []
+    normals_list = []
+    triangles_list = []
+    vertex_offset = 0
+    for obj in obj_list:
+        eval_obj = obj.evaluated_get(depsgraph)
+        mesh = eval_obj.to_mesh()
+        mesh.calc_loop_triangles()
+        num_vertices = len(mesh.vertices)
+        coords = np.empty(num_vertices * 3, dtype=np.float32)
+        normals = np.empty(num_vertices * 3, dtype=np.float32)
+        triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+        mesh.vertices.foreach_get("co", coords)
+        mesh.vertices.foreach_get("normal", normals)
+        mesh.loop_triangles.foreach_get("vertices", triangles)
+        eval_obj.to_mesh_clear()
+        matrix_world = np.array(obj.matrix_world, dtype=np.float64)
+        coords_list.append(coords.reshape(-1, 3) @ matrix_world[:3,:3].T + matrix_world[:3,3])
+        normals = normals.reshape(-1, 3) @ np.linalg.inv(matrix_world[:3,:3])
+        normals_list.append(normals / np.linalg.norm(normals, axis=1, keepdims=True).clip(1e-12))
+        triangles_list.append(triangles.reshape(-1, 3) + vertex_offset)
+        vertex_offset += num_vertices
+    return np.concatenate(coords_list), np.concatenate(normals_list), np.concatenate(triangles_list)
+
+def find_nearest_surface_points(surface_coords, surface_triangles, query_coords):
+    # nearest point on the surface triangles and its triangle index for every query point, -1 without a hit
+    bvh = BVHTree.FromPolygons(surface_coords.tolist(), surface_triangles.tolist(), all_triangles=True)
+    nearest_coords = np.array(query_coords, dtype=np.float64)
+    nearest_triangles = np.full(len(query_coords), -1, dtype=np.int64)
+    for index, (location, normal, triangle_index, distance) in enumerate(map(bvh.find_nearest, query_coords.tolist())):
+        if triangle_index is not None:
+            nearest_coords[index] = location
+            nearest_triangles[index] = triangle_index
+    return nearest_coords, nearest_triangles
+
+def interpolate_surface_normals(points, triangle_indices, surface_coords, surface_normals, surface_triangles):
+    # barycentric interpolation of the vertex normals at points on their triangles, smooth across triangle edges
+    corners = surface_triangles[triangle_indices]
+    a, b, c = surface_coords[corners[:,0]], surface_coords[corners[:,1]], surface_coords[corners[:,2]]
+    v0, v1, v2 = b - a, c - a, points - a
+    d00 = np.einsum("ij,ij->i", v0, v0)
+    d01 = np.einsum("ij,ij->i", v0, v1)
+    d11 = np.einsum("ij,ij->i", v1, v1)
+    d20 = np.einsum("ij,ij->i", v2, v0)
+    d21 = np.einsum("ij,ij->i", v2, v1)
+    denominator = d00 * d11 - d01 * d01
+    denominator[np.abs(denominator) < 1e-20] = 1e-20
+    weight_b = ((d11 * d20 - d01 * d21) / denominator).clip(0.0, 1.0)
+    weight_c = ((d00 * d21 - d01 * d20) / denominator).clip(0.0, 1.0)
+    weight_a = (1.0 - weight_b - weight_c).clip(0.0, 1.0)
+    normals = surface_normals[corners[:,0]] * weight_a[:,None] + surface_normals[corners[:,1]] * weight_b[:,None] + surface_normals[corners[:,2]] * weight_c[:,None]
+    return normals / np.linalg.norm(normals, axis=1, keepdims=True).clip(1e-12)
+
+def fit_points_to_surface(query_coords, surface_coords, surface_normals, surface_triangles, offset_distance):
+    # nearest surface point of every query point pushed out along the surface normal, points without a hit are kept
+    nearest_coords, nearest_triangles = find_nearest_surface_points(surface_coords, surface_triangles, query_coords)
+    hit = nearest_triangles >= 0
+    fitted_coords = np.array(query_coords, dtype=np.float64)
+    fitted_coords[hit] = nearest_coords[hit] + interpolate_surface_normals(nearest_coords[hit], nearest_triangles[hit], surface_coords, surface_normals, surface_triangles) * offset_distance
+    return fitted_coords
+
+def push_points_outside_surface(query_coords, directions, surface_coords, surface_triangles, offset_distance, max_distance):
+    # move every query point along its direction to offset_distance past the farthest surface hit within max_distance, points without a hit are kept
+    bvh = BVHTree.FromPolygons(surface_coords.tolist(), surface_triangles.tolist(), all_triangles=True)
+    pushed_coords = np.array(query_coords, dtype=np.float64)
+    num_pushed = 0
+    for index, (origin, direction) in enumerate(zip(query_coords.tolist(), directions.tolist())):
+        origin = mathutils.Vector(origin)
+        direction = mathutils.Vector(direction)
+        travelled = 0.0
+        farthest = None
+        for layer in range(CAGE_MAX_ITEM_LAYERS):
+            location, normal, triangle_index, distance = bvh.ray_cast(origin + direction * travelled, direction, max_distance - travelled)
+            if location is None:
+                break
+            travelled += distance + 1e-5
+            farthest = travelled
+        if farthest is not None:
+            pushed_coords[index] = np.array(origin + direction * (farthest + offset_distance))
+            num_pushed += 1
+    return pushed_coords, num_pushed
+
+def read_object_world_coords(obj):
+    mesh = obj.data
+    local_coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", local_coords)
+    matrix_world = np.array(obj.matrix_world, dtype=np.float64)
+    return local_coords.reshape(-1, 3) @ matrix_world[:3,:3].T + matrix_world[:3,3]
+
+def write_object_world_coords(obj, world_coords):
+    inverse_matrix = np.linalg.inv(np.array(obj.matrix_world, dtype=np.float64))
+    local_coords = world_coords @ inverse_matrix[:3,:3].T + inverse_matrix[:3,3]
+    obj.data.vertices.foreach_set("co", local_coords.astype(np.float32).ravel())
+    obj.data.update()
+
+def push_outer_cage_outside_item(cage_obj, item_objs, offset_distance, max_distance):
+    # push the vertices of a body fitted cage along their normals until the cage encloses item_objs, keeping vertex order
+    start_time = time.perf_counter()
+    cage_world, cage_normals = read_world_vertices(cage_obj)
+    item_coords, item_normals, item_triangles = read_surface_arrays(item_objs)
+    pushed_coords, num_pushed = push_points_outside_surface(cage_world, cage_normals, item_coords, item_triangles, offset_distance, max_distance)
+    write_object_world_coords(cage_obj, pushed_coords)
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: push_outer_cage_outside_item(): pushed " + str(num_pushed) + " of " + str(len(cage_world)) + " cage vertices past " + str(len(item_triangles)) + " item triangles in " + str(round(elapsed_time, 3)) + " seconds")
+
+def fit_cage_mesh_to_character(cage_obj, character_objs=None, offset_distance=None, surface_arrays=None):
+    # wrap cage_obj onto the surface of character_objs, keeping vertex order
+    # surface_arrays: read_surface_arrays() result of character_objs, when already read for several cages
+    start_time = time.perf_counter()
+    if surface_arrays is None:
+        if character_objs is None:
+            character_objs = get_character_mesh_objects()
+        if len(character_objs) == 0:
+            _add_to_log("ERROR: fit_cage_mesh_to_character(): no character meshes found, skipping...")
+            return
+        surface_arrays = read_surface_arrays(character_objs)
+    surface_coords, surface_normals, surface_triangles = surface_arrays
+    if offset_distance is None:
+        character_height = surface_coords[:,2].max() - surface_coords[:,2].min()
+        offset_distance = character_height * CAGE_OFFSET_RATIO
+
+    cage_world = read_object_world_coords(cage_obj)
+    num_cage_vertices = len(cage_world)
+    write_object_world_coords(cage_obj, fit_points_to_surface(cage_world, surface_coords, surface_normals, surface_triangles, offset_distance))
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: fit_cage_mesh_to_character(): fitted " + str(num_cage_vertices) + " cage vertices to " + str(len(surface_triangles)) + " surface triangles in " + str(round(elapsed_time, 3)) + " seconds")
@@ -0,0 +1,364 @@
+"""Blender Clothing Tools module
+
+Blender python module to convert clothing and hair items of the Daz outfit into
+separate Roblox layered clothing and accessory FBX files. A mesh object is an
+item when all of its materials belong to DTU wardrobe, hair or prop nodes, the
+figure and its geografts and attachments stay in the body. An item is removed
+from the body pipeline,
+written to its own .blend, and processed by a background Blender worker which
+joins, decimates, downscales textures and exports. Layered clothing gets inner
+and outer cages from the "CageMeshes" template of the UGC dev kit, keeping the
+template vertex order and UVs Roblox validates and deforms with: the inner
+cage is fitted to the body surface, the outer cage is pushed out from there
+until it encloses the item. Cages are fitted before the item leaves the body
+scene. Item outputs are cached by a hash of the item geometry, textures,
+settings, body and cage template, so an outfit change only re-processes the
+items that changed.
+
+Worker usage:
+
+    blender.exe --background --factory-startup --python blender_clothing_tools.py -- <item json>
+
+Requirements:
+    - Python 3+
+    - Blender 3.6+ (uses the NumPy bundled with Blender)
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_clothing_tools.log"
+
+## Do not modify below
+import sys, os, re, json, time, shutil, hashlib, subprocess
+import numpy as np
+try:
+    import bpy
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+try:
+    import blender_tools
+except:
+    sys.path.append(script_dir)
+    import blender_tools
+
+try:
+    import blender_cage_tools
+except:
+    sys.path.append(script_dir)
+    import blender_cage_tools
+
+try:
+    import blender_variant_tools
+except:
+    sys.path.append(script_dir)
+    import blender_variant_tools
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+# items whose object or material names match are rigid accessories, everything else is layered clothing
+ACCESSORY_NAME_RULE = r"hair|scalp|brow|beard|mustache|fibermesh|hat|helmet|glasses"
+# DTU material "Value" presentation types of item nodes, "Actor/..." figures and "Follower/Attachment/..." geografts are not items
+ITEM_NODE_TYPES = ("Follower/Wardrobe", "Follower/Hair", "Follower/Accessory", "Prop")
+# Roblox UGC limits per item
+ITEM_TYPE_SETTINGS = {
+    "layered_clothing": {"triangle_budget": 4000, "texture_size": 1024, "use_cages": True},
+    "accessory": {"triangle_budget": 4000, "texture_size": 1024, "use_cages": False},
+}
+# bump when the worker output changes, invalidates cached items
+ITEM_CACHE_VERSION = 3
+# body roles whose meshes make up the surface the inner cages are fitted to
+CAGE_BODY_ROLES = ["head", "arms", "legs"]
+CAGE_SUFFIXES = ("_InnerCage", "_OuterCage")
+# UGC dev kit template with the "CageMeshes" object, used when no template file is given
+DEFAULT_CAGE_TEMPLATE_FILE = os.path.join(os.path.dirname(script_dir), "UgcDevKit", "Daz_Cage_Att_Template.blend").replace("\\","/")
+
+
+def get_item_name(obj):
+    # object names may carry Blender duplicate suffixes, e.g. "Dress.001"
+    return re.sub(r"[^A-Za-z0-9_]", "", re.sub(r"\.\d+$", "", obj.name))
+
+def get_material_base_name(material_name):
+    # imported material names may carry Blender duplicate suffixes
+    return re.sub(r"\.\d+$", "", material_name)
+
+def build_material_node_table(dtu_dict):
+    # {material name: [(DTU node asset name, presentation type)]}, names can repeat across nodes
+    material_nodes = {}
+    for mat in dtu_dict.get("Materials", []):
+        material_nodes.setdefault(mat.get("Material Name", ""), []).append((mat.get("Asset Name", ""), str(mat.get("Value", ""))))
+    return material_nodes
+
+def get_object_nodes(obj, material_nodes):
+    node_list = []
+    for mat in obj.data.materials:
+        if mat is not None:
+            node_list += material_nodes.get(get_material_base_name(mat.name), [])
+    return node_list
+
+def is_item_object(obj, material_nodes, figure_name):
+    # every material must come from a wardrobe, hair or prop node, unknown or shared materials stay in the body
+    node_list = get_object_nodes(obj, material_nodes)
+    if len(node_list) == 0:
+        return False
+    return all(asset_name != figure_name and node_type.startswith(ITEM_NODE_TYPES) for asset_name, node_type in node_list)
+
+def get_item_type(obj, material_nodes):
+    if any(node_type.startswith("Follower/Hair") for asset_name, node_type in get_object_nodes(obj, material_nodes)):
+        return "accessory"
+    names = [obj.name] + [mat.name for mat in obj.data.materials if mat is not None]
+    for name in names:
+        if re.search(ACCESSORY_NAME_RULE, name, re.IGNORECASE):
+            return "accessory"
+    return "layered_clothing"
+
+def find_clothing_items(scene_index, dtu_dict):
+    # returns list of item dicts {name, type, objects}, one per mesh object of a DTU wardrobe, hair or prop node
+    material_nodes = build_material_node_table(dtu_dict)
+    figure_name = dtu_dict.get("Asset Name", "")
+    item_list = []
+    for obj in scene_index.mesh_objects():
+        if "Cage" in obj.name or "Attachment" in obj.name:
+            continue
+        if len(obj.data.polygons) == 0 or not is_item_object(obj, material_nodes, figure_name):
+            continue
+        item_list.append({"name": get_item_name(obj), "type": get_item_type(obj, material_nodes), "objects": [obj]})
+    return item_list
+
+def compute_item_cache_key(item, settings, body_hash, cage_template_hash):
+    # hash of world space geometry, topology, materials, texture files, settings, the body the cages are fitted to and the cage template
+    hasher = hashlib.sha1()
+    hasher.update(json.dumps([ITEM_CACHE_VERSION, item["type"], settings], sort_keys=True).encode("utf-8"))
+    if settings["use_cages"]:
+        hasher.update(body_hash.encode("utf-8"))
+        hasher.update(cage_template_hash.encode("utf-8"))
+    for obj in item["objects"]:
+        mesh = obj.data
+        coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", coords)
+        loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get("vertex_index", loop_vertices)
+        hasher.update(np.array(obj.matrix_world, dtype=np.float32).tobytes())
+        hasher.update(coords.tobytes())
+        hasher.update(loop_vertices.tobytes())
+        for mat in mesh.materials:
+            if mat is None:
+                continue
+            hasher.update(mat.name.encode("utf-8"))
+            if mat.node_tree is None:
+                continue
+            for node in mat.node_tree.nodes:
+                if node.type != 'TEX_IMAGE' or node.image is None:
+                    continue
+                image_path = bpy.path.abspath(node.image.filepath)
+                if os.path.exists(image_path):
+                    hasher.update(blender_tools.get_file_hash(image_path).encode("utf-8"))
+                else:
+                    hasher.update(node.image.name.encode("utf-8"))
+    return hasher.hexdigest()
+
+def get_item_output_path(item, output_folder, fbx_base_name):
+    return os.path.join(output_folder, fbx_base_name.replace(".fbx", "_" + item["name"] + "_roblox.fbx")).replace("\\","/")
+
+def get_body_surface(scene_index, item_list):
+    # evaluated body surface arrays and their hash, None when the scene has no body meshes
+    item_objs = set(obj for item in item_list for obj in item["objects"])
+    body_objs = [obj for obj in scene_index.mesh_objects() if obj not in item_objs and any(role in CAGE_BODY_ROLES for role in scene_index.get_roles(obj))]
+    if len(body_objs) == 0:
+        return None, ""
+    body_surface = blender_cage_tools.read_surface_arrays(body_objs)
+    hasher = hashlib.sha1()
+    for array in body_surface:
+        hasher.update(np.ascontiguousarray(array).tobytes())
+    return body_surface, hasher.hexdigest()
+
+def append_template_cage(cage_template_path, cage_name):
+    # append and join the template "CageMeshes", same as load_and_merge_cage_meshes_from_template_file(), vertex order and UVs are left as they are
+    existing_objs = set(bpy.data.objects)
+    bpy.ops.wm.append(filename="CageMeshes", directory=cage_template_path + "/Object/")
+    cage_list = [obj for obj in bpy.data.objects if obj not in existing_objs and obj.type == 'MESH' and "CageMesh" in obj.name]
+    if len(cage_list) == 0:
+        _add_to_log("ERROR: append_template_cage(): no cage meshes found in: " + cage_template_path)
+        return None
+    cage_obj = join_item_meshes(cage_list)
+    cage_obj.name = cage_name
+    cage_obj.data.materials.clear()
+    return cage_obj
+
+def add_item_cages(item, body_surface, cage_template_path):
+    # inner cage fitted to the body surface, outer cage pushed out from it until it encloses the item, both from the same template
+    if body_surface is None:
+        _add_to_log("ERROR: add_item_cages(): no body meshes found, skipping cages for: " + item["name"])
+        return []
+    if not os.path.exists(cage_template_path):
+        _add_to_log("ERROR: add_item_cages(): cage template not found, skipping cages for " + item["name"] + ": " + cage_template_path)
+        return []
+    body_coords = body_surface[0]
+    character_height = body_coords[:,2].max() - body_coords[:,2].min()
+    offset_distance = character_height * blender_cage_tools.CAGE_OFFSET_RATIO
+    inner_cage = append_template_cage(cage_template_path, item["name"] + "_InnerCage")
+    if inner_cage is None:
+        return []
+    blender_cage_tools.fit_cage_mesh_to_character(inner_cage, offset_distance=offset_distance, surface_arrays=body_surface)
+    outer_cage = inner_cage.copy()
+    outer_cage.data = inner_cage.data.copy()
+    outer_cage.name = item["name"] + "_OuterCage"
+    bpy.context.scene.collection.objects.link(outer_cage)
+    blender_cage_tools.push_outer_cage_outside_item(outer_cage, item["objects"], offset_distance, character_height * blender_cage_tools.CAGE_MAX_ITEM_DISTANCE_RATIO)
+    return [inner_cage, outer_cage]
+
+def write_item_blend(item, armature_list, item_blend_path):
+    # item meshes, cages, the armature and their materials and images, without the body
+    data_blocks = set(item["objects"]) | set(item.get("cages", [])) | set(armature_list)
+    bpy.data.libraries.write(item_blend_path, data_blocks, fake_user=True)
+
+def remove_item_objects(item_list, scene_index):
+    removed_names = []
+    for item in item_list:
+        for obj in item["objects"] + item.get("cages", []):
+            removed_names.append(obj.name)
+            bpy.data.objects.remove(obj, do_unlink=True)
+    scene_index.remove_objects(removed_names)
+
+def extract_clothing_items(scene_index, dtu_dict, work_folder, output_folder, fbx_base_name, cage_template_path=None):
+    # split items out of the body scene, returns list of worker jobs and list of cache hits
+    if cage_template_path is None or cage_template_path == "":
+        cage_template_path = DEFAULT_CAGE_TEMPLATE_FILE
+    start_time = time.perf_counter()
+    item_list = find_clothing_items(scene_index, dtu_dict)
+    if len(item_list) == 0:
+        return [], []
+    if not os.path.exists(work_folder):
+        os.makedirs(work_folder)
+    cache_folder = blender_tools.get_cache_folder("clothing_items")
+    armature_list = scene_index.objects_of_type('ARMATURE')
+    body_surface, body_hash = get_body_surface(scene_index, item_list)
+    cage_template_hash = blender_tools.get_file_hash(cage_template_path) if os.path.exists(cage_template_path) else ""
+    job_list = []
+    cached_list = []
+    for item in item_list:
+        settings = ITEM_TYPE_SETTINGS[item["type"]]
+        cache_key = compute_item_cache_key(item, settings, body_hash, cage_template_hash)
+        cache_path = os.path.join(cache_folder, cache_key + ".fbx").replace("\\","/")
+        output_path = get_item_output_path(item, output_folder, fbx_base_name)
+        if os.path.exists(cache_path):
+            shutil.copyfile(cache_path, output_path)
+            cached_list.append(output_path)
+            _add_to_log("DEBUG: extract_clothing_items(): using cached " + item["type"] + ": " + item["name"])
+            continue
+        if settings["use_cages"]:
+            item["cages"] = add_item_cages(item, body_surface, cage_template_path)
+        item_blend_path = os.path.join(work_folder, item["name"] + ".blend").replace("\\","/")
+        write_item_blend(item, armature_list, item_blend_path)
+        job_list.append({
+            "name": item["name"],
+            "type": item["type"],
+            "settings": settings,
+            "item_blend": item_blend_path,
+            "output_path": output_path,
+            "cache_path": cache_path,
+        })
+    remove_item_objects(item_list, scene_index)
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: extract_clothing_items(): extracted " + str(len(item_list)) + " items, " + str(len(cached_list)) + " cached, in " + str(round(elapsed_time, 3)) + " seconds")
+    return job_list, cached_list
+
+
+def append_item_objects(item_blend_path):
+    with bpy.data.libraries.load(item_blend_path, link=False) as (data_from, data_to):
+        data_to.objects = data_from.objects
+    for obj in data_to.objects:
+        if obj is not None:
+            bpy.context.scene.collection.objects.link(obj)
+    return [obj for obj in data_to.objects if obj is not None]
+
+def join_item_meshes(mesh_list):
+    bpy.ops.object.select_all(action="DESELECT")
+    for obj in mesh_list:
+        obj.select_set(True)
+    bpy.context.view_layer.objects.active = mesh_list[0]
+    if len(mesh_list) > 1:
+        bpy.ops.object.join()
+    return bpy.context.view_layer.objects.active
+
+def apply_item_triangle_budget(item_obj, triangle_budget):
+    num_triangles = sum(len(poly.vertices) - 2 for poly in item_obj.data.polygons)
+    if num_triangles <= triangle_budget:
+        return
+    mod = item_obj.modifiers.new(name="ItemDecimate", type="DECIMATE")
+    mod.ratio = triangle_budget / num_triangles
+    _add_to_log("DEBUG: apply_item_triangle_budget(): " + item_obj.name + ": " + str(num_triangles) + " triangles, ratio=" + str(round(mod.ratio, 3)))
+
+def process_item(job):
+    # worker side, runs in a factory startup Blender
+    start_time = time.perf_counter()
+    blender_tools.delete_all_items()
+    obj_list = append_item_objects(job["item_blend"])
+    # cages were fitted in the body scene and are exported as they are
+    mesh_list = [obj for obj in obj_list if obj.type == 'MESH' and not obj.name.endswith(CAGE_SUFFIXES)]
+    if len(mesh_list) == 0:
+        _add_to_log("ERROR: process_item(): no meshes in item: " + job["item_blend"])
+        return False
+    item_obj = join_item_meshes(mesh_list)
+    item_obj.name = job["name"]
+    settings = job["settings"]
+    apply_item_triangle_budget(item_obj, settings["triangle_budget"])
+    # pack first, apply_texture_size() re-packs the scaled pixels so the fbx embeds them instead of the source files
+    bpy.ops.file.pack_all()
+    blender_variant_tools.apply_texture_size(settings["texture_size"])
+    bpy.ops.object.select_all(action="SELECT")
+    bpy.ops.export_scene.fbx(filepath=job["output_path"], **blender_variant_tools.ROBLOX_FBX_EXPORT_SETTINGS)
+    shutil.copyfile(job["output_path"], job["cache_path"])
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: process_item(): exported " + job["type"] + " " + job["name"] + " to " + job["output_path"] + " in " + str(round(elapsed_time, 3)) + " seconds")
+    return True
+
+
+def start_item_worker(job):
+    command = [bpy.app.binary_path, "--background", "--factory-startup", "--python", os.path.join(script_dir, "blender_clothing_tools.py"), "--", json.dumps(job)]
+    return subprocess.Popen(command)
+
+def start_item_workers(job_list, max_workers=None):
+    # launch the first batch of workers so items convert while the body pipeline runs, returns pool state for wait_for_item_workers()
+    if max_workers is None:
+        max_workers = max(1, (os.cpu_count() or 2) // 2)
+    pending = list(job_list)
+    running = []
+    while len(pending) > 0 and len(running) < max_workers:
+        job = pending.pop(0)
+        running.append((job, start_item_worker(job)))
+    return {"pending": pending, "running": running, "max_workers": max_workers, "start_time": time.perf_counter()}
+
+def wait_for_item_workers(worker_pool):
+    # returns list of (item name, return code)
+    pending = worker_pool["pending"]
+    running = worker_pool["running"]
+    results = []
+    while len(pending) > 0 or len(running) > 0:
+        job, process = running.pop(0)
+        return_code = process.wait()
+        if return_code != 0:
+            _add_to_log("ERROR: wait_for_item_workers(): item " + job["name"] + " failed with return code " + str(return_code))
+        results.append((job["name"], return_code))
+        while len(pending) > 0 and len(running) < worker_pool["max_workers"]:
+            next_job = pending.pop(0)
+            running.append((next_job, start_item_worker(next_job)))
+    elapsed_time = time.perf_counter() - worker_pool["start_time"]
+    _add_to_log("DEBUG: wait_for_item_workers(): processed " + str(len(results)) + " items in " + str(round(elapsed_time, 3)) + " seconds")
+    return results
+
+
+# Execute worker
+if __name__=='__main__':
+    worker_args = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    if len(worker_args) < 1:
+        print("\nUSAGE: blender.exe --background --factory-startup --python blender_clothing_tools.py -- <item json>\n")
+        exit(1)
+    if not process_item(json.loads(worker_args[0])):
+        exit(1)
+    exit(0)
@@ -0,0 +1,122 @@
+"""Blender Collision Tools module
+
+Blender python module to compute bounds and a simplified collision hull for
+each separated Roblox part. Tight axis-aligned and principal-axis oriented
+bounds are computed in NumPy, and the hull is approximated by support points:
+the most extreme part vertex along each of a fixed set of evenly spread
+directions, found in one matrix product, so the hull vertex count is capped by
+the number of directions. Blender's convex hull operator only triangulates the
+few support points. Results are written as a metadata report next to the fbx.
+
+Requirements:
+    - Python 3+
+    - Blender 3.6+ (uses the NumPy bundled with Blender)
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_collision_tools.log"
+
+## Do not modify below
+import sys, os, json, time
+import numpy as np
+try:
+    import bpy
+    import bmesh
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+try:
+    import blender_cage_tools
+except:
+    sys.path.append(script_dir)
+    import blender_cage_tools
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+# upper limit of hull vertices per part
+COLLISION_HULL_MAX_VERTICES = 64
+
+
+def get_support_directions(num_directions):
+    # evenly spread unit directions on a Fibonacci sphere, (K,3)
+    indices = np.arange(num_directions, dtype=np.float64) + 0.5
+    z = 1.0 - 2.0 * indices / num_directions
+    radius = np.sqrt(1.0 - z * z)
+    angle = np.pi * (3.0 - np.sqrt(5.0)) * indices
+    return np.stack([radius * np.cos(angle), radius * np.sin(angle), z], axis=1)
+
+def compute_aabb(coords):
+    bounds_min = coords.min(axis=0)
+    bounds_max = coords.max(axis=0)
+    return {"min": bounds_min.tolist(), "max": bounds_max.tolist(), "size": (bounds_max - bounds_min).tolist()}
+
+def compute_oriented_bounds(coords):
+    # box aligned to the principal axes of the vertices, tighter than the aabb for slanted parts
+    center = coords.mean(axis=0)
+    covariance = np.cov((coords - center).T)
+    eigenvalues, axes = np.linalg.eigh(covariance)
+    local = (coords - center) @ axes
+    local_min = local.min(axis=0)
+    local_max = local.max(axis=0)
+    box_center = center + axes @ ((local_min + local_max) * 0.5)
+    return {"center": box_center.tolist(), "axes": axes.T.tolist(), "size": (local_max - local_min).tolist()}
+
+def compute_support_points(coords, max_vertices=COLLISION_HULL_MAX_VERTICES):
+    # indices of the most extreme vertex along each support direction, at most max_vertices
+    directions = get_support_directions(max_vertices)
+    support_indices = np.argmax(coords @ directions.T, axis=0)
+    return np.unique(support_indices)
+
+def build_hull_triangles(hull_coords):
+    # triangulated convex hull of the support points, returns (M,3) indices into hull_coords
+    bm = bmesh.new()
+    vertex_list = [bm.verts.new(co) for co in hull_coords.tolist()]
+    bm.verts.index_update()
+    bmesh.ops.convex_hull(bm, input=vertex_list, use_existing_faces=False)
+    bmesh.ops.triangulate(bm, faces=bm.faces[:])
+    # interior support points are left unconnected by the hull operator
+    triangles = np.array([[vert.index for vert in face.verts] for face in bm.faces], dtype=np.int64).reshape(-1, 3)
+    bm.free()
+    return triangles
+
+def compute_part_collision(mesh_obj, max_vertices=COLLISION_HULL_MAX_VERTICES):
+    # returns report dict with bounds and hull of mesh_obj in world space scene units
+    start_time = time.perf_counter()
+    coords, normals = blender_cage_tools.read_world_vertices(mesh_obj)
+    report = {"vertices": len(coords)}
+    if len(coords) == 0:
+        return report
+    report["aabb"] = compute_aabb(coords)
+    report["obb"] = compute_oriented_bounds(coords) if len(coords) >= 3 else None
+    hull_coords = coords[compute_support_points(coords, max_vertices)]
+    hull_triangles = build_hull_triangles(hull_coords) if len(hull_coords) >= 4 else np.empty((0, 3), dtype=np.int64)
+    # keep only the support points used by the hull, and remap triangle indices
+    used_indices, hull_triangles = np.unique(hull_triangles, return_inverse=True)
+    report["hull_vertices"] = hull_coords[used_indices].round(6).tolist()
+    report["hull_triangles"] = hull_triangles.reshape(-1, 3).tolist()
+    report["seconds"] = round(time.perf_counter() - start_time, 3)
+    return report
+
+def compute_collision_data(mesh_obj_list, max_vertices=COLLISION_HULL_MAX_VERTICES):
+    # returns {part_name: report}
+    start_time = time.perf_counter()
+    collision_report = {}
+    for obj in mesh_obj_list:
+        report = compute_part_collision(obj, max_vertices)
+        collision_report[obj.name] = report
+        if "hull_vertices" in report:
+            _add_to_log("DEBUG: compute_collision_data(): " + obj.name + ": " + str(report["vertices"]) + " vertices -> " + str(len(report["hull_vertices"])) + " hull vertices, " + str(len(report["hull_triangles"])) + " hull triangles in " + str(report["seconds"]) + " seconds")
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: compute_collision_data(): computed " + str(len(collision_report)) + " part hulls in " + str(round(elapsed_time, 3)) + " seconds")
+    return collision_report
+
+def write_collision_report(collision_report, report_path):
+    with open(report_path, "w") as file:
+        json.dump(collision_report, file, indent=2)
+    _add_to_log("DEBUG: write_collision_report(): wrote collision report: " + report_path)
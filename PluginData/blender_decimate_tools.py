@@ -0,0 +1,326 @@
+"""Blender Decimate Tools module
+
+Blender python module with a quadric error metric decimator (Garland and
+Heckbert 1997) weighted by per-vertex importance. Every vertex gets an
+importance from UV seams, part boundaries, sharp silhouette features and face
+and finger regions read from its vertex groups, and the cost of removing a
+vertex is its quadric error times its importance, so triangles are taken from
+flat low-importance regions first. Collapses are half-edge collapses onto an
+existing vertex, applied in passes: edge costs, quadric updates and face flip
+checks are vectorized, and each pass takes the cheapest edges whose one-rings
+do not overlap. The core works on NumPy arrays without Blender; inside Blender
+the result is applied with a bmesh weld, so UVs, vertex groups and shape keys
+of the kept vertices are preserved.
+
+Requirements:
+    - Python 3+
+    - NumPy
+    - Blender 3.6+ (optional, for decimating mesh objects)
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_decimate_tools.log"
+
+## Do not modify below
+import sys, os, re, json, time
+import numpy as np
+try:
+    import bpy
+    import bmesh
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+# importance multipliers, a vertex collapse costs its quadric error times its importance
+SEAM_IMPORTANCE = 8.0
+# part boundary vertices are shared with the neighboring part, collapsing them opens cracks
+LOCK_BOUNDARY_VERTICES = True
+BOUNDARY_IMPORTANCE = 100.0
+# added per unit of (1 - cos) between the vertex normal and its sharpest adjacent face
+SILHOUETTE_IMPORTANCE = 4.0
+# (vertex group regex, importance per unit of vertex weight), case-insensitive
+REGION_IMPORTANCE_RULES = [
+    (r"eye|lid|brow|lash", 8.0),
+    (r"lip|mouth|jaw|tongue|teeth|nose|nostril", 8.0),
+    (r"thumb|index|mid|ring|pinky|finger|carpal", 4.0),
+]
+# collapses which turn an adjacent face by more than this are rejected, cosine of the angle
+FLIP_COSINE = 0.2
+# small edge length term so flat regions collapse their shortest edges first
+EDGE_LENGTH_COST = 1e-6
+UV_SEAM_TOLERANCE = 1e-5
+
+
+## Array operations
+def compute_face_planes(coords, triangles):
+    # (T,4) unit plane equations and (T,) areas
+    corners = coords[triangles]
+    normals = np.cross(corners[:,1] - corners[:,0], corners[:,2] - corners[:,0])
+    doubled_area = np.linalg.norm(normals, axis=1)
+    unit_normals = normals / doubled_area.clip(1e-20)[:,None]
+    offsets = -np.einsum("ij,ij->i", unit_normals, corners[:,0])
+    return np.hstack([unit_normals, offsets[:,None]]), doubled_area * 0.5
+
+def compute_vertex_quadrics(coords, triangles):
+    # (N,4,4) area weighted sum of the plane quadrics of the faces around each vertex
+    planes, areas = compute_face_planes(coords, triangles)
+    face_quadrics = planes[:,:,None] * planes[:,None,:] * areas[:,None,None]
+    vertex_quadrics = np.zeros((len(coords), 4, 4), dtype=np.float64)
+    for corner in range(3):
+        np.add.at(vertex_quadrics, triangles[:,corner], face_quadrics)
+    return vertex_quadrics
+
+def get_unique_edges(triangles, num_vertices):
+    # (E,2) edges with a < b, and (E,) number of triangles using each edge
+    edges = np.sort(triangles[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    keys, counts = np.unique(edges[:,0] * num_vertices + edges[:,1], return_counts=True)
+    return np.stack([keys // num_vertices, keys % num_vertices], axis=1), counts
+
+def find_boundary_vertices(triangles, num_vertices):
+    edges, counts = get_unique_edges(triangles, num_vertices)
+    boundary = np.zeros(num_vertices, dtype=bool)
+    boundary[edges[counts == 1].ravel()] = True
+    return boundary
+
+def find_uv_seam_vertices(loop_vertices, loop_uvs, num_vertices, tolerance=UV_SEAM_TOLERANCE):
+    # vertices whose face corners use more than one UV coordinate
+    uv_min = np.full((num_vertices, 2), np.inf)
+    uv_max = np.full((num_vertices, 2), -np.inf)
+    np.minimum.at(uv_min, loop_vertices, loop_uvs)
+    np.maximum.at(uv_max, loop_vertices, loop_uvs)
+    return ((uv_max - uv_min) > tolerance).any(axis=1) & np.isfinite(uv_min).all(axis=1)
+
+def compute_silhouette_features(coords, triangles):
+    # (N,) 1 - cos between each vertex normal and its most deviating adjacent face, 0 on flat regions
+    planes, areas = compute_face_planes(coords, triangles)
+    face_normals = planes[:,:3]
+    vertex_normals = np.zeros((len(coords), 3), dtype=np.float64)
+    for corner in range(3):
+        np.add.at(vertex_normals, triangles[:,corner], face_normals * areas[:,None])
+    vertex_normals /= np.linalg.norm(vertex_normals, axis=1).clip(1e-20)[:,None]
+    features = np.zeros(len(coords), dtype=np.float64)
+    for corner in range(3):
+        deviation = 1.0 - np.einsum("ij,ij->i", vertex_normals[triangles[:,corner]], face_normals)
+        np.maximum.at(features, triangles[:,corner], deviation)
+    return features
+
+def compute_vertex_importance(coords, triangles, seam_vertices=None, region_weights=None):
+    # (N,) importance >= 1 and (N,) locked mask
+    num_vertices = len(coords)
+    importance = np.ones(num_vertices, dtype=np.float64)
+    importance += SILHOUETTE_IMPORTANCE * compute_silhouette_features(coords, triangles)
+    if seam_vertices is not None:
+        importance[seam_vertices] *= SEAM_IMPORTANCE
+    if region_weights is not None:
+        importance *= 1.0 + region_weights
+    boundary = find_boundary_vertices(triangles, num_vertices)
+    if LOCK_BOUNDARY_VERTICES:
+        return importance, boundary
+    importance[boundary] *= BOUNDARY_IMPORTANCE
+    return importance, np.zeros(num_vertices, dtype=bool)
+
+def evaluate_quadrics(quadrics, positions):
+    homogeneous = np.hstack([positions, np.ones((len(positions), 1))])
+    return np.einsum("ei,eij,ej->e", homogeneous, quadrics, homogeneous)
+
+def select_collapses(coords, triangles, sources, targets, costs, max_collapses):
+    # indices of up to max_collapses cheap collapses with disjoint one-rings which flip no face
+    num_vertices = len(coords)
+    candidates = np.flatnonzero(np.isfinite(costs))
+    if len(candidates) == 0:
+        return candidates
+    order = candidates[np.argsort(costs[candidates], kind="stable")]
+    # greedy in cost order, a collapse blocks every vertex of the triangles around both of its vertices
+    flat = triangles.ravel()
+    vertex_triangles = (np.argsort(flat, kind="stable") // 3).tolist()
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(flat, minlength=num_vertices))]).tolist()
+    triangle_list = triangles.tolist()
+    source_list = sources.tolist()
+    target_list = targets.tolist()
+    blocked = bytearray(num_vertices)
+    selected = []
+    for edge in order.tolist():
+        source = source_list[edge]
+        target = target_list[edge]
+        if blocked[source] or blocked[target]:
+            continue
+        selected.append(edge)
+        if len(selected) >= max_collapses:
+            break
+        for vertex in (source, target):
+            for triangle in vertex_triangles[offsets[vertex]:offsets[vertex + 1]]:
+                for neighbor in triangle_list[triangle]:
+                    blocked[neighbor] = 1
+    selected = np.array(selected, dtype=np.int64)
+
+    # drop collapses which turn an adjacent face over
+    remap = np.arange(num_vertices)
+    remap[sources[selected]] = targets[selected]
+    new_triangles = remap[triangles]
+    changed = (new_triangles != triangles).any(axis=1)
+    changed &= (new_triangles[:,0] != new_triangles[:,1]) & (new_triangles[:,1] != new_triangles[:,2]) & (new_triangles[:,0] != new_triangles[:,2])
+    old_planes = compute_face_planes(coords, triangles[changed])[0]
+    new_planes, new_areas = compute_face_planes(coords, new_triangles[changed])
+    flipped = np.einsum("ij,ij->i", old_planes[:,:3], new_planes[:,:3]) < FLIP_COSINE
+    flipped |= new_areas <= 0.0
+    involved = np.full(num_vertices, -1, dtype=np.int64)
+    involved[sources[selected]] = selected
+    flipped_edges = involved[triangles[changed][flipped]]
+    keep = ~np.isin(selected, flipped_edges[flipped_edges >= 0])
+    return selected[keep]
+
+def decimate_quadric(coords, triangles, target_triangles, importance=None, locked=None):
+    # returns (N,) vertex_map onto the kept vertices and the (T',3) decimated triangles in original vertex numbering
+    coords = np.asarray(coords, dtype=np.float64)
+    triangles = np.asarray(triangles, dtype=np.int64)
+    num_vertices = len(coords)
+    if importance is None:
+        importance, locked = compute_vertex_importance(coords, triangles)
+    importance = importance.astype(np.float64).copy()
+    if locked is None:
+        locked = np.zeros(num_vertices, dtype=bool)
+    quadrics = compute_vertex_quadrics(coords, triangles)
+    vertex_map = np.arange(num_vertices)
+    num_passes = 0
+    while len(triangles) > target_triangles:
+        edges, counts = get_unique_edges(triangles, num_vertices)
+        # cheaper direction of each edge, the removed vertex is the source
+        edge_quadrics = quadrics[edges[:,0]] + quadrics[edges[:,1]]
+        edge_length = np.einsum("ij,ij->i", coords[edges[:,0]] - coords[edges[:,1]], coords[edges[:,0]] - coords[edges[:,1]]) * EDGE_LENGTH_COST
+        cost_remove_first = importance[edges[:,0]] * (np.abs(evaluate_quadrics(edge_quadrics, coords[edges[:,1]])) + edge_length)
+        cost_remove_second = importance[edges[:,1]] * (np.abs(evaluate_quadrics(edge_quadrics, coords[edges[:,0]])) + edge_length)
+        cost_remove_first[locked[edges[:,0]]] = np.inf
+        cost_remove_second[locked[edges[:,1]]] = np.inf
+        remove_first = cost_remove_first <= cost_remove_second
+        sources = np.where(remove_first, edges[:,0], edges[:,1])
+        targets = np.where(remove_first, edges[:,1], edges[:,0])
+        costs = np.minimum(cost_remove_first, cost_remove_second)
+
+        # each collapse removes about two triangles, do not overshoot the target
+        selected = select_collapses(coords, triangles, sources, targets, costs, max(1, (len(triangles) - target_triangles + 1) // 2))
+        if len(selected) == 0:
+            break
+
+        remap = np.arange(num_vertices)
+        remap[sources[selected]] = targets[selected]
+        vertex_map = remap[vertex_map]
+        triangles = remap[triangles]
+        triangles = triangles[(triangles[:,0] != triangles[:,1]) & (triangles[:,1] != triangles[:,2]) & (triangles[:,0] != triangles[:,2])]
+        np.add.at(quadrics, targets[selected], quadrics[sources[selected]])
+        np.maximum.at(importance, targets[selected], importance[sources[selected]])
+        num_passes += 1
+    return vertex_map, triangles
+
+def compact_mesh(coords, triangles, vertex_map):
+    # drop removed vertices, returns (coords, triangles, kept vertex indices) for use outside Blender
+    kept = np.flatnonzero(vertex_map == np.arange(len(vertex_map)))
+    new_index = np.full(len(vertex_map), -1, dtype=np.int64)
+    new_index[kept] = np.arange(len(kept))
+    return coords[kept], new_index[triangles], kept
+
+
+## Mesh level
+def read_loop_uvs(mesh):
+    # (L,) loop vertex indices and (L,2) coordinates of the active UV map, None without UVs
+    loop_vertices = np.empty(len(mesh.loops), dtype=np.int64)
+    mesh.loops.foreach_get("vertex_index", loop_vertices)
+    if mesh.uv_layers.active is None:
+        return loop_vertices, None
+    loop_uvs = np.empty(len(mesh.loops) * 2, dtype=np.float64)
+    mesh.uv_layers.active.data.foreach_get("uv", loop_uvs)
+    return loop_vertices, loop_uvs.reshape(-1, 2)
+
+def compute_region_weights(mesh_obj, rules=REGION_IMPORTANCE_RULES):
+    # (N,) summed importance of the face and finger vertex groups, weighted by vertex weight
+    compiled_rules = [(re.compile(pattern, re.IGNORECASE), importance) for pattern, importance in rules]
+    group_importance = {}
+    for group in mesh_obj.vertex_groups:
+        for regex, importance in compiled_rules:
+            if regex.search(group.name):
+                group_importance[group.index] = importance
+                break
+    region_weights = np.zeros(len(mesh_obj.data.vertices), dtype=np.float64)
+    if len(group_importance) == 0:
+        return region_weights
+    for vertex in mesh_obj.data.vertices:
+        for group_element in vertex.groups:
+            if group_element.group in group_importance:
+                region_weights[vertex.index] += group_importance[group_element.group] * group_element.weight
+    return region_weights
+
+def decimate_part_mesh(mesh_obj, ratio):
+    # decimate mesh_obj in place to ratio of its triangles, returns report dict for the part
+    start_time = time.perf_counter()
+    mesh = mesh_obj.data
+    report = {"ratio": ratio, "triangles_before": 0, "triangles_after": 0}
+    # seams and regions are read before triangulation, which keeps vertex indices
+    loop_vertices, loop_uvs = read_loop_uvs(mesh)
+    seam_vertices = None
+    if loop_uvs is not None:
+        seam_vertices = find_uv_seam_vertices(loop_vertices, loop_uvs, len(mesh.vertices))
+    region_weights = compute_region_weights(mesh_obj)
+
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    bmesh.ops.triangulate(bm, faces=bm.faces[:])
+    bm.verts.index_update()
+    coords = np.array([v.co[:] for v in bm.verts], dtype=np.float64).reshape(-1, 3)
+    triangles = np.array([[v.index for v in f.verts] for f in bm.faces], dtype=np.int64).reshape(-1, 3)
+    report["triangles_before"] = len(triangles)
+    if len(triangles) == 0 or ratio >= 1.0:
+        bm.free()
+        report["triangles_after"] = len(triangles)
+        return report
+
+    importance, locked = compute_vertex_importance(coords, triangles, seam_vertices, region_weights)
+    vertex_map, new_triangles = decimate_quadric(coords, triangles, int(len(triangles) * ratio), importance, locked)
+
+    # weld removed vertices onto their kept vertex, collapsed faces are removed by the weld
+    bm.verts.ensure_lookup_table()
+    removed = np.flatnonzero(vertex_map != np.arange(len(vertex_map)))
+    targetmap = dict((bm.verts[i], bm.verts[vertex_map[i]]) for i in removed.tolist())
+    if len(targetmap) > 0:
+        bmesh.ops.weld_verts(bm, targetmap=targetmap)
+    bm.to_mesh(mesh)
+    bm.free()
+    mesh.update()
+    report["triangles_after"] = len(mesh.polygons)
+    report["vertices_removed"] = len(removed)
+    report["seconds"] = round(time.perf_counter() - start_time, 3)
+    return report
+
+def replace_decimate_modifier(mesh_obj):
+    # decimate with the ratio of the Decimate modifier on mesh_obj and remove the modifier, returns report or None
+    for mod in mesh_obj.modifiers:
+        if mod.type != "DECIMATE":
+            continue
+        ratio = mod.ratio
+        mesh_obj.modifiers.remove(mod)
+        report = decimate_part_mesh(mesh_obj, ratio)
+        _add_to_log("DEBUG: replace_decimate_modifier(): " + mesh_obj.name + ": " + str(report["triangles_before"]) + " -> " + str(report["triangles_after"]) + " triangles at ratio " + str(round(ratio, 3)))
+        return report
+    return None
+
+def replace_decimate_modifiers(mesh_obj_list):
+    # returns {part_name: report} of the parts which had a Decimate modifier
+    start_time = time.perf_counter()
+    decimate_report = {}
+    for obj in mesh_obj_list:
+        report = replace_decimate_modifier(obj)
+        if report is not None:
+            decimate_report[obj.name] = report
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: replace_decimate_modifiers(): decimated " + str(len(decimate_report)) + " parts in " + str(round(elapsed_time, 3)) + " seconds")
+    return decimate_report
+
+def write_decimate_report(decimate_report, report_path):
+    with open(report_path, "w") as file:
+        json.dump(decimate_report, file, indent=2)
+    _add_to_log("DEBUG: write_decimate_report(): wrote decimate report: " + report_path)
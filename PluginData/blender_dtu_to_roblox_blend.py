@@ -17,6 +17,47 @@ EXAMPLE:
 
 """
 do_experimental_remove_materials = True
+do_experimental_animation_retarget = True
+do_experimental_r15_skin_conversion = True
+do_experimental_skin_cleanup = True
+do_preflight_check = True
+preflight_fail_fast = True
+# Combined Head and Body UV DSF files from DazLibraryFiles, applied in Blender when not empty
+combined_uv_dsf_file_list = []
+do_experimental_python_texture_rebake = False
+do_bake_normal_strength = True
+do_roblox_pbr_texture_output = False
+do_shape_key_pruning = True
+# add Roblox dynamic head FACS poses to Head_Geo, blended from the Daz facial morphs listed in G9_FACS_mapping.json
+# the head keeps its morphs through separation because parts with shape keys are decimated by the quadric decimator,
+# independent of use_quadric_decimation
+do_experimental_facs_poses = False
+# apply the pending decimation, then weld, drop degenerate triangles and reorder each part for vertex cache locality
+# every "*_Geo" part is triangulated permanently by this stage, off by default like use_quadric_decimation
+do_experimental_mesh_optimization = False
+# replace the Decimate modifier with the importance weighted quadric decimator, keeps UV seams, part borders and face detail
+use_quadric_decimation = False
+# split arms, legs and body with cached per-figure face tables when the topology matches, tables are recorded on the first export
+use_segmentation_tables = True
+# write per-part bounds and a vertex-capped convex hull to "<name>_collision.json"
+do_collision_hull_output = True
+collision_hull_max_vertices = 64
+# load "<name>_arrays.npz" instead of the fbx when present and written from the current fbx, or write it after the fbx import
+use_array_intermediate = False
+do_write_array_intermediate = False
+# extra export variants made from the converted .blend, e.g. {"name": "low", "decimation_scale": 0.5, "texture_size": 512, "format": "fbx"}
+roblox_variant_list = []
+use_variant_workers = True
+# append input sizes, stage durations, peak memory and exit status of each run to the job metrics database
+do_record_job_metrics = True
+# job metrics database, "" uses Documents/DazToRoblox/job_metrics.sqlite, shared with blender_estimate_tools.py --db
+job_metrics_database_file = ""
+# re-read the exported fbx files outside the scene and check parts, triangles, bones, textures and scale, report in "<name>_roblox_verify.json"
+do_verify_output = True
+# export clothing and hair as separate Roblox layered clothing and accessory items, processed by background workers
+do_experimental_clothing_items = False
+# Daz_Cage_Att_Template.blend with the "CageMeshes" template, "" uses the UgcDevKit folder next to the scripts, item cages are skipped when not found
+clothing_cage_template_file = ""
 
 
 logFilename = "blender_dtu_to_roblox_blend.log"
@@ -36,6 +77,7 @@ import re
 import shutil
 try:
     import bpy
+    import bmesh
 except:
     print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
 
@@ -46,6 +88,139 @@ except:
     sys.path.append(script_dir)
     import blender_tools
 
+try:
+    import blender_retarget_tools
+    blender_retarget_tools.logFilename = logFilename
+except:
+    sys.path.append(script_dir)
+    import blender_retarget_tools
+
+try:
+    import blender_weight_tools
+    blender_weight_tools.logFilename = logFilename
+except:
+    sys.path.append(script_dir)
+    import blender_weight_tools
+
+try:
+    import blender_cage_tools
+    blender_cage_tools.logFilename = logFilename
+except:
+    sys.path.append(script_dir)
+    import blender_cage_tools
+
+try:
+    import blender_preflight_tools
+    blender_preflight_tools.logFilename = logFilename
+except:
+    sys.path.append(script_dir)
+    import blender_preflight_tools
+
+try:
+    import blender_uv_tools
+    blender_uv_tools.logFilename = logFilename
+except:
+    sys.path.append(script_dir)
+    import blender_uv_tools
+
+try:
+    import blender_texture_tools
+    blender_texture_tools.logFilename = logFilename
+except:
+    sys.path.append(script_dir)
+    import blender_texture_tools
+
+try:
+    import blender_shape_key_tools
+    blender_shape_key_tools.logFilename = logFilename
+except:
+    sys.path.append(script_dir)
+    import blender_shape_key_tools
+
+try:
+    import blender_mesh_tools
+    blender_mesh_tools.logFilename = logFilename
+except:
+    sys.path.append(script_dir)
+    import blender_mesh_tools
+
+try:
+    import blender_scene_tools
+    blender_scene_tools.logFilename = logFilename
+except:
+    sys.path.append(script_dir)
+    import blender_scene_tools
+
+try:
+    import blender_array_tools
+    blender_array_tools.logFilename = logFilename
+except:
+    sys.path.append(script_dir)
+    import blender_array_tools
+
+try:
+    import blender_variant_tools
+    blender_variant_tools.logFilename = logFilename
+except:
+    sys.path.append(script_dir)
+    import blender_variant_tools
+
+try:
+    import blender_clothing_tools
+    blender_clothing_tools.logFilename = logFilename
+except:
+    sys.path.append(script_dir)
+    import blender_clothing_tools
+
+try:
+    import blender_collision_tools
+    blender_collision_tools.logFilename = logFilename
+except:
+    sys.path.append(script_dir)
+    import blender_collision_tools
+
+try:
+    import blender_metrics_tools
+    blender_metrics_tools.logFilename = logFilename
+except:
+    sys.path.append(script_dir)
+    import blender_metrics_tools
+
+try:
+    import blender_mode_tools
+    blender_mode_tools.logFilename = logFilename
+except:
+    sys.path.append(script_dir)
+    import blender_mode_tools
+
+try:
+    import blender_decimate_tools
+    blender_decimate_tools.logFilename = logFilename
+except:
+    sys.path.append(script_dir)
+    import blender_decimate_tools
+
+try:
+    import blender_segmentation_tools
+    blender_segmentation_tools.logFilename = logFilename
+except:
+    sys.path.append(script_dir)
+    import blender_segmentation_tools
+
+try:
+    import blender_facs_tools
+    blender_facs_tools.logFilename = logFilename
+except:
+    sys.path.append(script_dir)
+    import blender_facs_tools
+
+try:
+    import blender_verify_tools
+    blender_verify_tools.logFilename = logFilename
+except:
+    sys.path.append(script_dir)
+    import blender_verify_tools
+
 def _add_to_log(sMessage):
     print(str(sMessage))
     with open(logFilename, "a") as file:
@@ -75,16 +250,47 @@ def _main(argv):
         exit(1)
         return
 
-    # load FBX
-    _add_to_log("DEBUG: main(): loading fbx file: " + str(fbxPath))
-    blender_tools.import_fbx(fbxPath)
+    if do_record_job_metrics:
+        blender_metrics_tools.start_job(fbxPath, job_metrics_database_file if job_metrics_database_file != "" else None)
+
+    # load FBX, or the bulk-array intermediate written from a previous fbx import
+    arrayArchivePath = fbxPath.replace(".fbx", blender_array_tools.ARRAY_ARCHIVE_SUFFIX)
+    useArrayArchive = use_array_intermediate and os.path.exists(arrayArchivePath)
+    if useArrayArchive and not blender_array_tools.is_array_archive_current(arrayArchivePath, fbxPath):
+        _add_to_log("DEBUG: main(): array archive is older than the fbx, ignoring it: " + str(arrayArchivePath))
+        useArrayArchive = False
+    if useArrayArchive and blender_array_tools.import_array_archive(arrayArchivePath) is not None:
+        _add_to_log("DEBUG: main(): loaded array archive: " + str(arrayArchivePath))
+    else:
+        _add_to_log("DEBUG: main(): loading fbx file: " + str(fbxPath))
+        blender_tools.import_fbx(fbxPath)
+        if do_write_array_intermediate:
+            with open(fbxPath.replace(".fbx", ".dtu"), "r") as file:
+                blender_array_tools.export_scene_to_array_archive(arrayArchivePath, json.load(file), source_path=fbxPath)
     blender_tools.fix_eyes()
     blender_tools.fix_scalp()
 
     blender_tools.center_all_viewports()
+    blender_metrics_tools.mark_stage("import")
     jsonPath = fbxPath.replace(".fbx", ".dtu")
     _add_to_log("DEBUG: main(): loading json file: " + str(jsonPath))
     dtu_dict = blender_tools.process_dtu(jsonPath)
+    if do_record_job_metrics:
+        blender_metrics_tools.current_job.set_input_stats(blender_metrics_tools.collect_scene_stats(dtu_dict))
+    blender_metrics_tools.mark_stage("materials")
+
+    bone_mapping = blender_tools.load_r15_bone_mapping()
+
+    # validate Roblox limits before running the expensive stages
+    if do_preflight_check:
+        preflight_report = blender_preflight_tools.run_preflight(dtu_dict, bone_mapping)
+        blender_preflight_tools.write_preflight_report(preflight_report, fbxPath.replace(".fbx", "_preflight.json"))
+        if not preflight_report["passed"] and preflight_fail_fast:
+            _add_to_log("ERROR: main(): preflight check failed: " + json.dumps(preflight_report["errors"]))
+            exit(1)
+            return
+
+    blender_metrics_tools.mark_stage("preflight")
 
     if "Has Animation" in dtu_dict:
         bHasAnimation = dtu_dict["Has Animation"]
@@ -92,11 +298,56 @@ def _main(argv):
     else:
         bHasAnimation = False
 
+    # Roblox ignores the Normal Map node, so bake its strength into the normal textures
+    if do_bake_normal_strength:
+        blender_texture_tools.bake_all_normal_strengths()
+
+    # switch figure to the Roblox UV layout without a Daz Studio round trip
+    if len(combined_uv_dsf_file_list) > 0:
+        combined_uv_obj_list = blender_uv_tools.apply_combined_uv_sets(combined_uv_dsf_file_list)
+        # modesty overlay, re-bake, combine and assign, replaces the Daz Studio texture scripts
+        if do_experimental_python_texture_rebake:
+            map_transfer_folder = os.path.join(os.path.dirname(fbxPath), "MapTransfer").replace("\\","/")
+            asset_type = dtu_dict.get("Asset Type", "R15")
+            texture_parts = {}
+            for obj in combined_uv_obj_list:
+                if asset_type != "R15Z":
+                    blender_texture_tools.apply_modesty_overlays(obj, map_transfer_folder, use_male_overlay=(asset_type == "R15M"))
+                source_uv_name = obj.data.uv_layers[0].name
+                target_uv_name = obj.data.uv_layers.active.name
+                baked_parts = blender_texture_tools.rebake_mesh_textures(obj, source_uv_name, target_uv_name, map_transfer_folder)
+                for map_name, part_list in baked_parts.items():
+                    texture_parts.setdefault(map_name, []).extend(part_list)
+            combined_paths = blender_texture_tools.combine_texture_parts(texture_parts, map_transfer_folder)
+            for obj in combined_uv_obj_list:
+                blender_texture_tools.assign_combined_textures(obj, combined_paths)
+
+    blender_metrics_tools.mark_stage("textures")
+
+    # retarget and bake armature animation onto R15 bones
+    retargeted_armature_list = []
+    if bHasAnimation and do_experimental_animation_retarget:
+        print("DEBUG: main(): retargeting animation to R15")
+        for obj in bpy.data.objects:
+            if obj.type == 'ARMATURE' and obj.animation_data and obj.animation_data.action:
+                r15_action = blender_retarget_tools.retarget_animation_to_r15(obj, bone_mapping)
+                if r15_action is not None:
+                    retargeted_armature_list.append(obj)
+
+    # convert Genesis bones and vertex groups to R15, skipped if already done by bone_converter.dsa
+    if do_experimental_r15_skin_conversion:
+        print("DEBUG: main(): converting skin weights to R15")
+        for obj in bpy.data.objects:
+            if obj.type == 'ARMATURE':
+                blender_weight_tools.convert_genesis_skin_to_r15(obj, bone_mapping)
 
     # clear all animation data
     # Iterate over all objects
     print("DEBUG: main(): clearing animation data")
     for obj in bpy.data.objects:
+        # keep baked R15 animation
+        if obj in retargeted_armature_list:
+            continue
         # Check if the object has animation data
         if obj.animation_data:
             # Clear all animation data
@@ -106,8 +357,11 @@ def _main(argv):
     # move root node to origin
     print("DEBUG: main(): moving root node to origin")
     move_root_node_to_origin()
+    blender_metrics_tools.mark_stage("skin_conversion")
 
     daz_generation = dtu_dict["Asset Id"]
+    # classify objects once, the separation stages keep the index up to date
+    scene_index = blender_scene_tools.SceneIndex(blender_scene_tools.get_material_role_rules(daz_generation)).build()
     if (bHasAnimation == False):
         # if ("Genesis8" in daz_generation):
         #     blender_tools.apply_tpose_for_g8_g9()
@@ -115,22 +369,89 @@ def _main(argv):
         #     blender_tools.apply_tpose_for_g8_g9()
         apply_i_pose()
 
+    blender_metrics_tools.mark_stage("pose")
+
+    # move clothing and hair out of the body pipeline, items convert in background workers while the body continues
+    clothing_worker_pool = None
+    if do_experimental_clothing_items:
+        clothing_folder = os.path.join(os.path.dirname(fbxPath), "ClothingItems").replace("\\","/")
+        clothing_output_folder = dtu_dict["Output Folder"].replace("\\","/")
+        if (not os.path.exists(clothing_output_folder)):
+            os.makedirs(clothing_output_folder)
+        clothing_job_list, cached_item_list = blender_clothing_tools.extract_clothing_items(scene_index, dtu_dict, clothing_folder, clothing_output_folder, os.path.basename(fbxPath), clothing_cage_template_file)
+        clothing_worker_pool = blender_clothing_tools.start_item_workers(clothing_job_list)
+        blender_metrics_tools.mark_stage("clothing_extraction")
+
     # add decimate modifier
-    add_decimate_modifier()
+    add_decimate_modifier(scene_index)
+
+    # mode switches, active object changes and deletes of the separation stages
+    mode_manager = blender_mode_tools.ModeManager()
 
     # separate by materials
-    separate_by_materials()
+    separate_by_materials(scene_index, mode_manager)
+
+    # split base figure meshes with segmentation tables, the others take the dynamic path below
+    segmented_names = []
+    segmentation_tagged_list = []
+    if use_segmentation_tables:
+        segmented_names, segmentation_tagged_list = blender_segmentation_tools.apply_segmentation_tables(scene_index, mode_manager, daz_generation)
 
     # separate by loose parts
-    separate_by_loose_parts()
+    separate_by_loose_parts(scene_index, mode_manager, segmented_names)
 
     # separate by bone influence
-    separate_by_bone_influence()
+    separate_by_bone_influence(scene_index, mode_manager, segmented_names)
+    blender_segmentation_tools.write_segmentation_tables(scene_index, segmentation_tagged_list)
+    mode_manager.log_counts("separation")
+    blender_metrics_tools.mark_stage("separation")
+
+    # bounds and simplified collision hull of each part
+    if do_collision_hull_output:
+        collision_report = blender_collision_tools.compute_collision_data([obj for obj in scene_index.mesh_objects() if obj.name.endswith("_Geo")], collision_hull_max_vertices)
+        blender_collision_tools.write_collision_report(collision_report, fbxPath.replace(".fbx", "_collision.json"))
+
+    # decimate the remaining parts, including parts with shape keys which the Decimate modifier can not apply
+    if use_quadric_decimation:
+        decimate_report = blender_decimate_tools.replace_decimate_modifiers([obj for obj in scene_index.mesh_objects() if obj.name.endswith("_Geo")])
+        blender_decimate_tools.write_decimate_report(decimate_report, fbxPath.replace(".fbx", "_decimation.json"))
+
+    # blend the Daz facial morphs into FACS pose shape keys before flat keys are pruned
+    if do_experimental_facs_poses:
+        head_obj = scene_index.get_object(blender_facs_tools.FACS_HEAD_PART)
+        if head_obj is None:
+            _add_to_log("ERROR: main(): " + blender_facs_tools.FACS_HEAD_PART + " not found, skipping FACS poses")
+        else:
+            facs_report = blender_facs_tools.generate_facs_poses(head_obj, blender_facs_tools.load_facs_mapping())
+            blender_facs_tools.write_facs_report(facs_report, fbxPath.replace(".fbx", "_facs.json"))
+
+    # delete zero-delta shape keys left on the separated parts
+    if do_shape_key_pruning:
+        shape_key_report = blender_shape_key_tools.prune_shape_keys([obj for obj in scene_index.mesh_objects() if obj.data.shape_keys is not None])
+        blender_shape_key_tools.write_shape_key_report(shape_key_report, fbxPath.replace(".fbx", "_shape_keys.json"))
+
+    # weld seams, drop degenerate triangles and reorder each part for vertex cache locality
+    if do_experimental_mesh_optimization:
+        mesh_report = blender_mesh_tools.optimize_part_meshes([obj for obj in scene_index.mesh_objects() if obj.name.endswith("_Geo")])
+        blender_mesh_tools.write_mesh_report(mesh_report, fbxPath.replace(".fbx", "_mesh_optimization.json"))
+
+    # cap bone influences and prune empty vertex groups and bones after the last geometry change, decimation blends weights
+    if do_experimental_skin_cleanup:
+        for obj in scene_index.objects_of_type('ARMATURE'):
+            blender_weight_tools.cleanup_skin_weights(obj)
+
+    blender_metrics_tools.mark_stage("part_cleanup")
 
     # prepare destination folder path
     blenderFilePath = fbxPath.replace(".fbx", ".blend")
     intermediate_folder_path = os.path.dirname(fbxPath)
 
+    # write Roblox SurfaceAppearance metalness/roughness maps before images are packed
+    texture_manifest = None
+    if do_roblox_pbr_texture_output:
+        roblox_pbr_folder = os.path.join(intermediate_folder_path, "RobloxPBR").replace("\\","/")
+        texture_manifest = blender_texture_tools.convert_materials_to_roblox_pbr(roblox_pbr_folder)
+
     # remove missing or unused images
     print("DEBUG: deleting missing or unused images...")
     for image in bpy.data.images:
@@ -155,6 +476,15 @@ def _main(argv):
     print("DEBUG: main(): packing all images...")
     bpy.ops.file.pack_all()
 
+    # oversized source maps are only warnings in the preflight, fail on the images which are exported
+    if do_preflight_check:
+        if not blender_preflight_tools.check_export_textures(preflight_report):
+            blender_preflight_tools.write_preflight_report(preflight_report, fbxPath.replace(".fbx", "_preflight.json"))
+            if preflight_fail_fast:
+                _add_to_log("ERROR: main(): exported texture size check failed: " + json.dumps(preflight_report["errors"]))
+                exit(1)
+                return
+
     # select all objects
     bpy.ops.object.select_all(action="SELECT")
     # set active object
@@ -163,6 +493,7 @@ def _main(argv):
     # switch to object mode before saving
     bpy.ops.object.mode_set(mode="OBJECT")
     bpy.ops.wm.save_as_mainfile(filepath=blenderFilePath)
+    blender_metrics_tools.mark_stage("save_blend")
     
     # export to fbx
     roblox_asset_name = dtu_dict["Asset Name"]
@@ -175,17 +506,38 @@ def _main(argv):
     fbx_output_file_path = os.path.join(destinationPath, fbx_output_name).replace("\\","/")
     _add_to_log("DEBUG: saving Roblox FBX file to destination: " + fbx_output_file_path)
     try:
-        bpy.ops.export_scene.fbx(filepath=fbx_output_file_path, 
-                                 global_scale = 0.0333,
-                                 add_leaf_bones = False,
-                                 path_mode = "COPY",
-                                 embed_textures = True,
-                                 )
+        bpy.ops.export_scene.fbx(filepath=fbx_output_file_path, **blender_variant_tools.ROBLOX_FBX_EXPORT_SETTINGS)
         _add_to_log("DEBUG: save completed.")
+        if blender_metrics_tools.current_job is not None:
+            blender_metrics_tools.current_job.add_output(fbx_output_file_path)
+        if texture_manifest is not None:
+            blender_texture_tools.write_texture_manifest(texture_manifest, fbx_output_file_path.replace(".fbx", "_textures.json"))
     except Exception as e:
         _add_to_log("ERROR: unable to save Roblox FBX file: " + fbx_output_file_path)
         _add_to_log("EXCEPTION: " + str(e))
 
+    blender_metrics_tools.mark_stage("export")
+
+    # fan out extra variants from the saved .blend instead of re-running the conversion
+    if len(roblox_variant_list) > 0:
+        variant_list = [dict({"optimize_mesh": do_experimental_mesh_optimization}, **variant) for variant in roblox_variant_list]
+        blender_variant_tools.export_variants(blenderFilePath, variant_list, destinationPath, fbx_base_name, use_variant_workers)
+
+    if clothing_worker_pool is not None:
+        blender_clothing_tools.wait_for_item_workers(clothing_worker_pool)
+    blender_metrics_tools.mark_stage("variants_and_items")
+
+    # check the written fbx files, variants are verified together with the main output
+    if do_verify_output and os.path.exists(fbx_output_file_path):
+        verify_path_list = [fbx_output_file_path]
+        for variant in roblox_variant_list:
+            variant_settings = blender_variant_tools.get_variant_settings(variant)
+            variant_path = blender_variant_tools.get_variant_output_path(variant_settings, destinationPath, fbx_base_name)
+            if variant_settings["format"] == "fbx" and os.path.exists(variant_path):
+                verify_path_list.append(variant_path)
+        verify_report = blender_verify_tools.verify_outputs(verify_path_list)
+        blender_verify_tools.write_verify_report(verify_report, fbx_output_file_path.replace(".fbx", "_verify.json"))
+        blender_metrics_tools.mark_stage("verification")
 
     _add_to_log("DEBUG: main(): completed conversion for: " + str(fbxPath))
 
@@ -344,26 +696,44 @@ def move_root_node_to_origin():
             bpy.ops.object.transform_apply(location=True, rotation=False, scale=False)
 
 
-def add_decimate_modifier():
+def add_decimate_modifier(scene_index):
     # add decimate modifier
-    for obj in bpy.data.objects:
-        if obj.type == 'MESH':
-            bpy.context.view_layer.objects.active = obj
-            bpy.ops.object.modifier_add(type='DECIMATE')
-            bpy.context.object.modifiers["Decimate"].ratio = 0.2
+    for obj in scene_index.mesh_objects():
+        bpy.context.view_layer.objects.active = obj
+        bpy.ops.object.modifier_add(type='DECIMATE')
+        bpy.context.object.modifiers["Decimate"].ratio = blender_scene_tools.DEFAULT_DECIMATION_RATIO
+
+def apply_decimate_ratio(obj, ratio):
+    # change decimate ratio and apply the decimate modifier
+    decimate_modifier = None
+    for mod in obj.modifiers:
+        if mod.type == "DECIMATE":
+            decimate_modifier = mod
+            break
+    if decimate_modifier is not None:
+        decimate_modifier.ratio = ratio
+        # modifier_apply refuses meshes with shape keys, the quadric decimator keeps them, e.g. the facial morphs of the FACS stage
+        if use_quadric_decimation or obj.data.shape_keys is not None:
+            if not use_quadric_decimation:
+                _add_to_log("DEBUG: apply_decimate_ratio(): " + obj.name + " has shape keys, decimating with the quadric decimator")
+            blender_decimate_tools.replace_decimate_modifier(obj)
+            return
+        bpy.ops.object.select_all(action='DESELECT')
+        obj.select_set(True)
+        bpy.context.view_layer.objects.active = obj
+        bpy.ops.object.modifier_apply(modifier=decimate_modifier.name)
 
-def separate_by_materials():
-    # separate by materials
-    bpy.ops.object.mode_set(mode="OBJECT")
-    for obj in bpy.data.objects:
-        if obj.type == 'MESH':
-            bpy.context.view_layer.objects.active = obj
-            bpy.ops.object.mode_set(mode="EDIT")
-            bpy.ops.mesh.separate(type='MATERIAL')
-            bpy.ops.object.mode_set(mode="OBJECT")
+def separate_by_materials(scene_index, mode_manager):
+    # separate by materials, all meshes in one edit mode session
+    mesh_list = scene_index.mesh_objects()
+    before_list = set(bpy.context.scene.objects)
+    with mode_manager.edit_objects(mesh_list):
+        bpy.ops.mesh.separate(type='MATERIAL')
+    # reclassify the separated objects and the source objects
+    scene_index.add_objects(mesh_list + [obj for obj in bpy.context.scene.objects if obj not in before_list])
 
     # clean up unwanted materials
-    bpy.ops.object.mode_set(mode="OBJECT")
+    mode_manager.set_mode("OBJECT")
     fingernail_obj = None
     arms_obj = None
     toenails_obj = None
@@ -371,132 +741,53 @@ def separate_by_materials():
     eyes_list = []
     head_obj = None
     mouth_list = []
-    for obj in bpy.data.objects:
-        # query for material names of each obj
-        if obj.type == 'MESH':
-            obj_materials = obj.data.materials
-            # if only one material, then rename object to material.name + "_Geo"
-            if len(obj_materials) == 1:
-                obj.name = obj_materials[0].name.replace(" ","") + "_Geo"
-            for mat in obj_materials:
-                # if "Tear" in mat.name or "moisture" in mat.name.lower() or "eyebrows" in mat.name.lower() or "eyelashes" in mat.name.lower() or "teeth" in mat.name.lower() or "mouth" in mat.name.lower():
-                if "Tear" in mat.name or "moisture" in mat.name.lower() or "eyebrows" in mat.name.lower() or "eyelashes" in mat.name.lower():
-                    # remove obj
-                    print("DEBUG: Removing object " + obj.name + " with material: " + mat.name)
-                    # delete heirarchy of object
-                    descendents = obj.children
-                    bpy.ops.object.select_all(action='DESELECT')
-                    for ob in descendents:
-                        ob.select_set(True)
-                    bpy.ops.object.delete()
-                    obj.select_set(True)
-                    bpy.ops.object.delete()
-                    break
-                if "head" in mat.name.lower():
-                    head_obj = obj
-                    # get decimation modifier
-                    decimate_modifier = None
-                    for mod in obj.modifiers:
-                        if mod.type == "DECIMATE":
-                            decimate_modifier = mod
-                            break
-                    if decimate_modifier is not None:
-                        # change decimate ratio to 0.36
-                        decimate_modifier.ratio = 0.36
-                        # apply decimate modifier
-                        bpy.ops.object.select_all(action='DESELECT')
-                        obj.select_set(True)
-                        bpy.context.view_layer.objects.active = obj
-                        bpy.ops.object.modifier_apply(modifier=decimate_modifier.name)
-
-                if "eye" in mat.name.lower():
-                    eyes_list.append(obj)
-                    # get decimation modifier
-                    decimate_modifier = None
-                    for mod in obj.modifiers:
-                        if mod.type == "DECIMATE":
-                            decimate_modifier = mod
-                            break
-                    if decimate_modifier is not None:
-                        # change decimate ratio to 0.09
-                        decimate_modifier.ratio = 0.09
-                        # apply decimate modifier
-                        bpy.ops.object.select_all(action='DESELECT')
-                        obj.select_set(True)
-                        bpy.context.view_layer.objects.active = obj
-                        bpy.ops.object.modifier_apply(modifier=decimate_modifier.name)
-                if "teeth" in mat.name.lower():
-                    mouth_list.append(obj)
-                    # get decimation modifier
-                    decimate_modifier = None
-                    for mod in obj.modifiers:
-                        if mod.type == "DECIMATE":
-                            decimate_modifier = mod
-                            break
-                    if decimate_modifier is not None:
-                        # change decimate ratio to 0.09
-                        decimate_modifier.ratio = 0.09
-                        # apply decimate modifier
-                        bpy.ops.object.select_all(action='DESELECT')
-                        obj.select_set(True)
-                        bpy.context.view_layer.objects.active = obj
-                        bpy.ops.object.modifier_apply(modifier=decimate_modifier.name)
-                if "mouth cavity" in mat.name.lower():
-                    mouth_list.append(obj)
-                    # get decimation modifier
-                    decimate_modifier = None
-                    for mod in obj.modifiers:
-                        if mod.type == "DECIMATE":
-                            decimate_modifier = mod
-                            break
-                    if decimate_modifier is not None:
-                        # change decimate ratio to 0.068
-                        decimate_modifier.ratio = 0.068
-                        # apply decimate modifier
-                        bpy.ops.object.select_all(action='DESELECT')
-                        obj.select_set(True)
-                        bpy.context.view_layer.objects.active = obj
-                        bpy.ops.object.modifier_apply(modifier=decimate_modifier.name)
-                elif "mouth" in mat.name.lower():
-                    mouth_list.append(obj)
-                    # get decimation modifier
-                    decimate_modifier = None
-                    for mod in obj.modifiers:
-                        if mod.type == "DECIMATE":
-                            decimate_modifier = mod
-                            break
-                    if decimate_modifier is not None:
-                        # change decimate ratio to 0.036
-                        decimate_modifier.ratio = 0.036
-                        # apply decimate modifier
-                        bpy.ops.object.select_all(action='DESELECT')
-                        obj.select_set(True)
-                        bpy.context.view_layer.objects.active = obj
-                        bpy.ops.object.modifier_apply(modifier=decimate_modifier.name)
-                
-                if "fingernails" in mat.name.lower():
-                    fingernail_obj = obj
-                if "arms" in mat.name.lower():
-                    arms_obj = obj
-                if "toenails" in mat.name.lower():
-                    toenails_obj = obj
-                if "legs" in mat.name.lower():
-                    legs_obj = obj
+    for obj_name in [obj.name for obj in scene_index.mesh_objects()]:
+        # children of removed objects are already gone
+        obj = scene_index.get_object(obj_name)
+        if obj is None:
+            continue
+        obj_materials = obj.data.materials
+        # if only one material, then rename object to material.name + "_Geo"
+        if len(obj_materials) == 1:
+            scene_index.rename_object(obj, obj_materials[0].name.replace(" ","") + "_Geo")
+        roles = scene_index.get_roles(obj)
+        if "remove" in roles:
+            # remove obj
+            print("DEBUG: Removing object " + obj.name + " with roles: " + str(roles))
+            # delete heirarchy of object
+            descendents = obj.children
+            removed_names = [ob.name for ob in descendents] + [obj.name]
+            mode_manager.batch_remove(list(descendents) + [obj])
+            scene_index.remove_objects(removed_names)
+            continue
+        # head, eyes, teeth and mouth parts are decimated by the ratio of their first role
+        if "head" in roles or "eye" in roles or "teeth" in roles or "mouth_cavity" in roles or "mouth" in roles:
+            apply_decimate_ratio(obj, scene_index.get_decimation_ratio(obj))
+        if "head" in roles:
+            head_obj = obj
+        if "eye" in roles:
+            eyes_list.append(obj)
+        if "teeth" in roles or "mouth_cavity" in roles or "mouth" in roles:
+            mouth_list.append(obj)
+        if "fingernails" in roles:
+            fingernail_obj = obj
+        if "arms" in roles:
+            arms_obj = obj
+        if "toenails" in roles:
+            toenails_obj = obj
+        if "legs" in roles:
+            legs_obj = obj
     
     # merge objects
     print("DEBUG: merging objects...")
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.view_layer.objects.active = bpy.data.objects[0]
-    bpy.ops.object.mode_set(mode="OBJECT")
+    mode_manager.set_mode("OBJECT")
     if fingernail_obj is not None and arms_obj is not None:
-        # deselect all objects
-        bpy.ops.object.select_all(action='DESELECT')
-        arms_obj.select_set(True)
-        fingernail_obj.select_set(True)
-        bpy.context.view_layer.objects.active = arms_obj
+        mode_manager.select_only([arms_obj, fingernail_obj])
+        joined_names = [fingernail_obj.name]
         bpy.ops.object.join()
+        scene_index.remove_objects(joined_names)
         if do_experimental_remove_materials:
-            bpy.context.view_layer.objects.active = arms_obj
+            mode_manager.set_active(arms_obj)
             # remove material named "Fingernails"
             material_name = "Fingernails"
             material_slot = next((slot for slot in arms_obj.material_slots if slot.name == material_name), None)
@@ -504,16 +795,15 @@ def separate_by_materials():
             if material_slot:
                 bpy.context.object.active_material_index = arms_obj.material_slots.find(material_name)
                 bpy.ops.object.material_slot_remove()
+        scene_index.add_object(arms_obj)
 
     if toenails_obj is not None and legs_obj is not None:
-        # deselect all objects
-        bpy.ops.object.select_all(action='DESELECT')
-        legs_obj.select_set(True)
-        toenails_obj.select_set(True)
-        bpy.context.view_layer.objects.active = legs_obj
+        mode_manager.select_only([legs_obj, toenails_obj])
+        joined_names = [toenails_obj.name]
         bpy.ops.object.join()
+        scene_index.remove_objects(joined_names)
         if do_experimental_remove_materials:
-            bpy.context.view_layer.objects.active = legs_obj
+            mode_manager.set_active(legs_obj)
             # remove material named "Toenails"
             material_name = "Toenails"
             material_slot = next((slot for slot in legs_obj.material_slots if slot.name == material_name), None)
@@ -521,19 +811,17 @@ def separate_by_materials():
             if material_slot:
                 bpy.context.object.active_material_index = legs_obj.material_slots.find(material_name)
                 bpy.ops.object.material_slot_remove()
+        scene_index.add_object(legs_obj)
 
     if len(eyes_list) > 0 and head_obj is not None:
         # merge eyes
         print("DEBUG: merging eyes...")
-        bpy.ops.object.select_all(action='DESELECT')
-        head_obj.select_set(True)
-        for obj in eyes_list:
-            obj.select_set(True)
-        bpy.context.view_layer.objects.active = head_obj
-        bpy.ops.object.mode_set(mode="OBJECT")
+        mode_manager.select_only([head_obj] + eyes_list)
+        joined_names = [obj.name for obj in eyes_list if obj != head_obj]
         bpy.ops.object.join()
+        scene_index.remove_objects(joined_names)
         if do_experimental_remove_materials:
-            bpy.context.view_layer.objects.active = head_obj
+            mode_manager.set_active(head_obj)
             # remove material named "Eye Left" and "Eye Right"
             material_name = "Eye Left"
             material_slot = next((slot for slot in head_obj.material_slots if slot.name == material_name), None)
@@ -551,15 +839,12 @@ def separate_by_materials():
     if len(mouth_list) > 0 and head_obj is not None:
         # merge mouth, mouth cavity, and teeth
         print("DEBUG: merging mouth, mouth cavity, and teeth...")
-        bpy.ops.object.select_all(action='DESELECT')
-        head_obj.select_set(True)
-        for obj in mouth_list:
-            obj.select_set(True)
-        bpy.context.view_layer.objects.active = head_obj
-        bpy.ops.object.mode_set(mode="OBJECT")
+        mode_manager.select_only([head_obj] + mouth_list)
+        joined_names = [obj.name for obj in mouth_list if obj != head_obj]
         bpy.ops.object.join()
+        scene_index.remove_objects(joined_names)
         if do_experimental_remove_materials:
-            bpy.context.view_layer.objects.active = head_obj
+            mode_manager.set_active(head_obj)
             # remove material named "Mouth Cavity" and "Teeth"
             material_name = "Mouth Cavity"
             material_slot = next((slot for slot in head_obj.material_slots if slot.name == material_name), None)
@@ -583,15 +868,16 @@ def separate_by_materials():
 
     print("DEBUG: done separating by materials")
 
-def separate_by_loose_parts():
+def separate_by_loose_parts(scene_index, mode_manager, skip_names=None):
     print("DEBUG: separate_by_loose_parts()")
-    # separate by loose parts
-    for obj in bpy.data.objects:
-        if obj.type == 'MESH':
-            bpy.context.view_layer.objects.active = obj
-            bpy.ops.object.mode_set(mode="EDIT")
-            bpy.ops.mesh.separate(type='LOOSE')
-            bpy.ops.object.mode_set(mode="OBJECT")
+    if skip_names is None:
+        skip_names = []
+    # separate by loose parts, all meshes in one edit mode session, parts already split by segmentation tables are skipped
+    mesh_list = [obj for obj in scene_index.mesh_objects() if obj.name not in skip_names]
+    before_list = set(bpy.context.scene.objects)
+    with mode_manager.edit_objects(mesh_list):
+        bpy.ops.mesh.separate(type='LOOSE')
+    scene_index.add_objects(mesh_list + [obj for obj in bpy.context.scene.objects if obj not in before_list])
 
     # clean up loose parts
     right_arm = []
@@ -599,106 +885,80 @@ def separate_by_loose_parts():
     right_leg = []
     left_leg = []
     head_list = []
-    for obj in bpy.data.objects:
-        if obj.type == 'MESH':
-            obj_materials = obj.data.materials
-            for mat in obj_materials:
-                if "Head" in mat.name:
-                    head_list.append(obj)
-                    # break to next obj
-                    break
-                if "Arms" in mat.name:
-                    # check vertices of obj, if x position is less than 0 then collect into right_arm array to merge together
-                    for v in obj.data.vertices:
-                        if v.co.x > 0:
-                            left_arm.append(obj)
-                            break
-                        else:
-                            right_arm.append(obj)
-                            break
-                    # break to next obj
-                    break
-                if "Legs" in mat.name:
-                    # check vertices of obj, if x position is less than 0 then collect into right_leg array to merge together
-                    for v in obj.data.vertices:
-                        if v.co.x > 0:
-                            left_leg.append(obj)
-                            break
-                        else:
-                            right_leg.append(obj)
-                            break
-                    # break to next obj
-                    break
+    for obj in scene_index.mesh_objects():
+        if obj.name in skip_names:
+            continue
+        roles = scene_index.get_roles(obj)
+        if "head" in roles:
+            head_list.append(obj)
+        elif "arms" in roles:
+            # check first vertex of obj, if x position is less than 0 then collect into right_arm array to merge together
+            if len(obj.data.vertices) > 0 and obj.data.vertices[0].co.x > 0:
+                left_arm.append(obj)
+            else:
+                right_arm.append(obj)
+        elif "legs" in roles:
+            # check first vertex of obj, if x position is less than 0 then collect into right_leg array to merge together
+            if len(obj.data.vertices) > 0 and obj.data.vertices[0].co.x > 0:
+                left_leg.append(obj)
+            else:
+                right_leg.append(obj)
 
     # merge right_arm
     print("DEBUG: merging right_arm...")
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.view_layer.objects.active = bpy.data.objects[0]
-    bpy.ops.object.mode_set(mode="OBJECT")
+    mode_manager.set_mode("OBJECT")
     if len(right_arm) > 0:
-        bpy.ops.object.select_all(action='DESELECT')
-        for obj in right_arm:
-            obj.select_set(True)
-        bpy.context.view_layer.objects.active = right_arm[0]
+        mode_manager.select_only(right_arm)
+        joined_names = [obj.name for obj in right_arm[1:]]
         bpy.ops.object.join()
-        right_arm[0].name = "RightArm_Geo"
+        scene_index.remove_objects(joined_names)
+        scene_index.rename_object(right_arm[0], "RightArm_Geo")
     # merge left_arm
     print("DEBUG: merging left_arm...")
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.view_layer.objects.active = bpy.data.objects[0]
-    bpy.ops.object.mode_set(mode="OBJECT")
+    mode_manager.set_mode("OBJECT")
     if len(left_arm) > 0:
-        bpy.ops.object.select_all(action='DESELECT')
-        for obj in left_arm:
-            obj.select_set(True)
-        bpy.context.view_layer.objects.active = left_arm[0]
+        mode_manager.select_only(left_arm)
+        joined_names = [obj.name for obj in left_arm[1:]]
         bpy.ops.object.join()
-        left_arm[0].name = "LeftArm_Geo"
+        scene_index.remove_objects(joined_names)
+        scene_index.rename_object(left_arm[0], "LeftArm_Geo")
     # merge right_leg
     print("DEBUG: merging right_leg...")
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.view_layer.objects.active = bpy.data.objects[0]
-    bpy.ops.object.mode_set(mode="OBJECT")
+    mode_manager.set_mode("OBJECT")
     if len(right_leg) > 0:
-        bpy.ops.object.select_all(action='DESELECT')
-        for obj in right_leg:
-            obj.select_set(True)
-        bpy.context.view_layer.objects.active = right_leg[0]
+        mode_manager.select_only(right_leg)
+        joined_names = [obj.name for obj in right_leg[1:]]
         bpy.ops.object.join()
-        right_leg[0].name = "RightLeg_Geo"
+        scene_index.remove_objects(joined_names)
+        scene_index.rename_object(right_leg[0], "RightLeg_Geo")
     # merge left_leg
     print("DEBUG: merging left_leg...")
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.view_layer.objects.active = bpy.data.objects[0]
-    bpy.ops.object.mode_set(mode="OBJECT")
+    mode_manager.set_mode("OBJECT")
     if len(left_leg) > 0:
-        bpy.ops.object.select_all(action='DESELECT')
-        for obj in left_leg:
-            obj.select_set(True)
-        bpy.context.view_layer.objects.active = left_leg[0]
+        mode_manager.select_only(left_leg)
+        joined_names = [obj.name for obj in left_leg[1:]]
         bpy.ops.object.join()
-        left_leg[0].name = "LeftLeg_Geo"
+        scene_index.remove_objects(joined_names)
+        scene_index.rename_object(left_leg[0], "LeftLeg_Geo")
 
     # merge head
     print("DEBUG: merging head...")
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.view_layer.objects.active = bpy.data.objects[0]
-    bpy.ops.object.mode_set(mode="OBJECT")
+    mode_manager.set_mode("OBJECT")
     if len(head_list) > 0:
-        bpy.ops.object.select_all(action='DESELECT')
-        for obj in head_list:
-            obj.select_set(True)
-        bpy.context.view_layer.objects.active = head_list[0]
+        mode_manager.select_only(head_list)
+        joined_names = [obj.name for obj in head_list[1:]]
         bpy.ops.object.join()
-        head_list[0].name = "Head_Geo"
+        scene_index.remove_objects(joined_names)
+        scene_index.rename_object(head_list[0], "Head_Geo")
 
     print("DEBUG: done separating by loose parts")
 
 
-def separate_by_bone_influence():
+def separate_by_bone_influence(scene_index, mode_manager, skip_names=None):
     print("DEBUG: separate_by_bone_influence()")
+    if skip_names is None:
+        skip_names = []
     # separate by bone influence
-    bpy.ops.object.mode_set(mode="OBJECT")
     bone_table = {
         "RightArm_Geo": ["RightHand", "RightLowerArm", "RightUpperArm"],
         "LeftArm_Geo": ["LeftHand", "LeftLowerArm", "LeftUpperArm"],
@@ -706,68 +966,71 @@ def separate_by_bone_influence():
         "LeftLeg_Geo": ["LeftFoot", "LeftLowerLeg", "LeftUpperLeg"],
         "Body_Geo": ["UpperTorso", "LowerTorso"]
     }
-    # deselect all
-    bpy.ops.object.select_all(action='DESELECT')
-    for obj in bpy.data.objects:
-        if obj.type == 'MESH' and obj.name in bone_table:
-            bone_list = bone_table[obj.name]
-            bpy.context.view_layer.objects.active = obj
-            for bone_name in bone_list:
+    for part_name in bone_table:
+        obj = scene_index.get_object(part_name)
+        if obj is None or part_name in skip_names:
+            continue
+        # one edit mode session per part, bone groups are selected on the edit BMesh
+        with mode_manager.edit_objects([obj]):
+            for bone_name in bone_table[part_name]:
                 print("DEBUG: beginning vertex separation for bone_name=" + bone_name)
-                bpy.ops.object.mode_set(mode="EDIT")
-                # deselect all vertices
-                bpy.ops.mesh.select_all(action='DESELECT')
-                bpy.ops.object.mode_set(mode="OBJECT")
+                group = obj.vertex_groups.get(bone_name)
+                if group is None:
+                    print("ERROR: vertex group not found: " + bone_name + " in " + obj.name)
+                    continue
+                # select vertices by bone group, the BMesh is re-read after each separation
+                bm = bmesh.from_edit_mesh(obj.data)
+                bm.select_mode = {'VERT'}
+                deform_layer = bm.verts.layers.deform.verify()
+                for vert in bm.verts:
+                    vert.select_set(group.index in vert[deform_layer])
+                bm.select_flush_mode()
                 # get list of all objects before separation operation
                 before_list = set(bpy.context.scene.objects)
-                # select vertices by bone group
-                group = obj.vertex_groups.get(bone_name)
-                for v in obj.data.vertices:
-                    for g in v.groups:
-                        if g.group == group.index:
-                            v.select = True                
-                bpy.ops.object.mode_set(mode="EDIT")
                 # separate by selection
                 bpy.ops.mesh.separate(type='SELECTED')
-                # rename newly separated object
                 # find the new object
-                # get list of all objects after separation operation
-                after_list = set(bpy.context.scene.objects)
                 new_obj = None
-                for obj_temp in after_list:
+                for obj_temp in bpy.context.scene.objects:
                     if obj_temp not in before_list:
                         new_obj = obj_temp
                         break
-                # Switch to object mode
-                bpy.ops.object.mode_set(mode='OBJECT')
-                # The newly created object is the active object
-                if new_obj == obj:
-                    print("ERROR: new_obj.name=" + new_obj.name + " is the same as " + obj.name)
+                if new_obj is None:
+                    print("ERROR: no vertices separated from " + obj.name + " for bone_name=" + bone_name)
                 else:
-                    # Select the new object
                     print("DEBUG: new_obj.name=" + new_obj.name + " renamed to " + bone_name + "_Geo")
-                    new_obj.name = bone_name + "_Geo"
-                    # deselect all objects
-                    bpy.ops.object.select_all(action='DESELECT')
-                    bpy.context.view_layer.objects.active = obj
+                    scene_index.rename_object(new_obj, bone_name + "_Geo")
 
     # clean up empty objects without vertices
-    for obj in bpy.data.objects:
-        if obj.type == 'MESH' and len(obj.data.vertices) == 0:
-            print("DEBUG: Removing empty object: " + obj.name)
-            bpy.ops.object.select_all(action='DESELECT')
-            obj.select_set(True)
-            bpy.ops.object.delete()
+    empty_list = [obj for obj in scene_index.mesh_objects() if len(obj.data.vertices) == 0]
+    removed_names = [obj.name for obj in empty_list]
+    for obj_name in removed_names:
+        print("DEBUG: Removing empty object: " + obj_name)
+    mode_manager.batch_remove(empty_list)
+    scene_index.remove_objects(removed_names)
 
 
-def load_and_merge_cage_meshes_from_template_file(template_filepath_blend):
+def load_and_merge_cage_meshes_from_template_file(template_filepath_blend, fit_to_character=True):
+    # collect character meshes before the template cage is appended
+    character_objs = blender_cage_tools.get_character_mesh_objects()
     # load and merge cage meshes from template file
     bpy.ops.wm.append(filename="CageMeshes", directory=template_filepath_blend + "/Object/")
     bpy.ops.object.select_all(action='DESELECT')
+    cage_obj = None
     for obj in bpy.data.objects:
         if obj.type == 'MESH' and "CageMesh" in obj.name:
             obj.select_set(True)
+            cage_obj = obj
+    if cage_obj is None:
+        _add_to_log("ERROR: load_and_merge_cage_meshes_from_template_file(): no cage meshes found in: " + template_filepath_blend)
+        return None
+    bpy.context.view_layer.objects.active = cage_obj
     bpy.ops.object.join()
+    cage_obj = bpy.context.view_layer.objects.active
+    # wrap template cage onto the character surface
+    if fit_to_character:
+        blender_cage_tools.fit_cage_mesh_to_character(cage_obj, character_objs)
+    return cage_obj
 
 def load_and_merge_attachments_from_template_file(template_filepath_blend):
     # load and merge attachments from template file
@@ -782,6 +1045,14 @@ def load_and_merge_attachments_from_template_file(template_filepath_blend):
 if __name__=='__main__':
     print("Starting script...")
     _add_to_log("Starting script... DEBUG: sys.argv=" + str(sys.argv))
-    _main(sys.argv[4:])
+    try:
+        _main(sys.argv[4:])
+    except SystemExit as e:
+        blender_metrics_tools.finish_job("exit " + str(e.code))
+        raise
+    except Exception as e:
+        blender_metrics_tools.finish_job("exception", str(e))
+        raise
+    blender_metrics_tools.finish_job("completed")
     print("script completed.")
     exit(0)
@@ -0,0 +1,161 @@
+"""Blender Estimate Tools module
+
+Python module to predict the wall time and peak memory of a conversion before
+it is queued. Input statistics are read from the FBX/DTU pair without starting
+Blender: file size, vertex, face and shape key counts from the binary FBX node
+tree, material count, and the count, bytes and pixels of the textures
+referenced by the DTU "Materials". A least-squares linear model per
+stage is fitted on the completed jobs in the job metrics database, using the
+statistics that are known for both the new input and the past runs.
+
+Command line usage:
+
+    python blender_estimate_tools.py [--db <database>] [--script-version <version>] <fbx file> [<fbx file> ...]
+
+Requirements:
+    - Python 3+
+    - NumPy
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_estimate_tools.log"
+
+## Do not modify below
+import sys, os, json, argparse
+import numpy as np
+
+try:
+    import blender_metrics_tools
+except:
+    sys.path.append(script_dir)
+    import blender_metrics_tools
+
+try:
+    import blender_fbx_tools
+except:
+    sys.path.append(script_dir)
+    import blender_fbx_tools
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+# candidate model inputs in priority order, a feature is used when known for the input and enough past runs
+ESTIMATE_FEATURES = ["input_bytes", "vertices", "faces", "materials", "shape_keys", "texture_bytes", "texture_pixels"]
+# past runs needed per model coefficient
+MIN_RUNS_PER_COEFFICIENT = 2
+
+
+def collect_input_stats(fbx_path):
+    # statistics of the FBX/DTU pair which are available without importing the fbx
+    stats = {"input_bytes": os.path.getsize(fbx_path)}
+    try:
+        stats.update(blender_fbx_tools.get_fbx_input_stats(fbx_path))
+    except ValueError as e:
+        # ascii fbx, the geometry features are left out of the model
+        _add_to_log("ERROR: collect_input_stats(): " + str(e))
+    dtu_path = fbx_path.replace(".fbx", ".dtu")
+    if os.path.exists(dtu_path):
+        with open(dtu_path, "r") as file:
+            dtu_dict = json.load(file)
+        stats["materials"] = len(dtu_dict.get("Materials", []))
+        stats.update(blender_metrics_tools.get_dtu_texture_stats(dtu_dict))
+    return stats
+
+def load_training_runs(connection, script_version=None):
+    # returns list of dicts with the features, "stages" {stage: seconds}, "total_seconds" and "peak_memory_bytes" of completed jobs
+    query = "SELECT id, total_seconds, peak_memory_bytes, " + ", ".join(ESTIMATE_FEATURES) + " FROM jobs WHERE exit_status = 'completed'"
+    parameters = ()
+    if script_version is not None:
+        query += " AND script_version = ?"
+        parameters = (script_version,)
+    run_dict = {}
+    for row in connection.execute(query, parameters):
+        run = {"total_seconds": row[1], "peak_memory_bytes": row[2], "stages": {}}
+        run.update(zip(ESTIMATE_FEATURES, row[3:]))
+        run_dict[row[0]] = run
+    for job_id, stage, seconds in connection.execute("SELECT job_id, stage, seconds FROM stages"):
+        if job_id in run_dict:
+            run_dict[job_id]["stages"][stage] = run_dict[job_id]["stages"].get(stage, 0.0) + seconds
+    return list(run_dict.values())
+
+def select_features(stats, run_list):
+    # greedily add features in priority order while enough past runs have all of them
+    feature_list = []
+    for feature in ESTIMATE_FEATURES:
+        if stats.get(feature) is None:
+            continue
+        candidate_list = feature_list + [feature]
+        usable_runs = [run for run in run_list if all(run.get(name) is not None for name in candidate_list)]
+        if len(usable_runs) >= (len(candidate_list) + 1) * MIN_RUNS_PER_COEFFICIENT:
+            feature_list = candidate_list
+    return feature_list
+
+def fit_linear_model(feature_matrix, targets):
+    # least squares with an intercept, columns scaled to [0,1] for conditioning, returns (coefficients, scale)
+    scale = np.abs(feature_matrix).max(axis=0).clip(1e-12)
+    design = np.hstack([np.ones((len(feature_matrix), 1)), feature_matrix / scale])
+    coefficients = np.linalg.lstsq(design, targets, rcond=None)[0]
+    return coefficients, scale
+
+def predict_linear_model(model, feature_vector):
+    coefficients, scale = model
+    return float(max(0.0, coefficients[0] + np.dot(coefficients[1:], feature_vector / scale)))
+
+def estimate_job(stats, run_list):
+    # returns {"stages", "total_seconds", "peak_memory_bytes", "features", "runs"}, None without past runs
+    feature_list = select_features(stats, run_list)
+    usable_runs = [run for run in run_list if all(run.get(name) is not None for name in feature_list)]
+    if len(usable_runs) == 0:
+        return None
+    feature_matrix = np.array([[run[name] for name in feature_list] for run in usable_runs], dtype=np.float64).reshape(len(usable_runs), len(feature_list))
+    feature_vector = np.array([stats[name] for name in feature_list], dtype=np.float64)
+
+    # every stage target in one least squares solve, stages missing from a run took no time
+    stage_names = sorted(set(stage for run in usable_runs for stage in run["stages"]))
+    stage_targets = np.array([[run["stages"].get(stage, 0.0) for stage in stage_names] + [run["total_seconds"]] for run in usable_runs], dtype=np.float64)
+    stage_model = fit_linear_model(feature_matrix, stage_targets)
+    coefficients, scale = stage_model
+    predictions = [predict_linear_model((coefficients[:,index], scale), feature_vector) for index in range(len(stage_names) + 1)]
+    estimate = {
+        "stages": dict((stage, round(seconds, 3)) for stage, seconds in zip(stage_names, predictions)),
+        "total_seconds": round(predictions[-1], 3),
+        "peak_memory_bytes": None,
+        "features": feature_list,
+        "runs": len(usable_runs),
+    }
+    memory_runs = [index for index, run in enumerate(usable_runs) if run["peak_memory_bytes"] is not None]
+    if len(memory_runs) > 0:
+        memory_model = fit_linear_model(feature_matrix[memory_runs], np.array([usable_runs[index]["peak_memory_bytes"] for index in memory_runs], dtype=np.float64))
+        estimate["peak_memory_bytes"] = int(predict_linear_model(memory_model, feature_vector))
+    return estimate
+
+def estimate_inputs(fbx_path_list, db_path=None, script_version=None):
+    connection = blender_metrics_tools.open_database(db_path)
+    run_list = load_training_runs(connection, script_version)
+    connection.close()
+    result_list = []
+    for fbx_path in fbx_path_list:
+        stats = collect_input_stats(fbx_path)
+        result_list.append({"input": fbx_path, "stats": stats, "estimate": estimate_job(stats, run_list)})
+    return result_list
+
+
+def _main(argv):
+    parser = argparse.ArgumentParser(description="Estimate DazToRoblox conversion time and memory from past jobs.")
+    parser.add_argument("--db", default=blender_metrics_tools.METRICS_DATABASE_PATH, help="job metrics database path")
+    parser.add_argument("--script-version", default=None, help="only fit on jobs of this script version")
+    parser.add_argument("fbx_files", nargs="+")
+    args = parser.parse_args(argv)
+    result_list = estimate_inputs(args.fbx_files, args.db, args.script_version)
+    print(json.dumps(result_list, indent=2))
+    return 0 if all(result["estimate"] is not None for result in result_list) else 1
+
+
+# Execute main()
+if __name__=='__main__':
+    exit(_main(sys.argv[1:]))
@@ -0,0 +1,159 @@
+"""Blender FACS Tools module
+
+Blender python module to generate the FACS poses of a Roblox dynamic head from
+the Genesis facial morphs exported as shape keys on the head mesh. Each FACS
+pose is a weighted blend of Daz morphs, optionally limited to one side of the
+face, as listed in G9_FACS_mapping.json. The source morph deltas are bulk-read
+with foreach_get(), reduced to the vertices any of them moves, and every pose
+is blended in one NumPy pass before the pose keys are written back with
+foreach_set().
+
+Requirements:
+    - Python 3+
+    - Blender 3.6+ (uses the NumPy bundled with Blender)
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_facs_tools.log"
+
+## Do not modify below
+import sys, os, json, time
+import numpy as np
+try:
+    import bpy
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+# Roblox FACS pose -> {"morphs": {Daz morph: weight}, "side": "left" or "right"}, Genesis 8.1 uses the same morph names
+FACS_MAPPING_FILENAME = "G9_FACS_mapping.json"
+FACS_HEAD_PART = "Head_Geo"
+# vertices which no source morph moves further than this are left out of the blend, in scene units
+FACS_DELTA_THRESHOLD = 1e-6
+# width of the left/right blend across the face midline, as a fraction of the moved region width
+FACS_SIDE_BLEND_FRACTION = 0.05
+# Daz morphs used by the FACS poses are deleted once the poses are written
+REMOVE_SOURCE_MORPHS = True
+
+
+def load_facs_mapping(mapping_folder=None):
+    if mapping_folder is None:
+        mapping_folder = script_dir
+    mapping_path = os.path.join(mapping_folder, FACS_MAPPING_FILENAME).replace("\\","/")
+    if not os.path.exists(mapping_path):
+        _add_to_log("ERROR: load_facs_mapping(): mapping file not found: " + mapping_path)
+        return {}
+    with open(mapping_path, "r") as file:
+        return json.load(file)
+
+def normalize_morph_name(morph_name):
+    # exported shape keys may carry a "<figure>__" prefix, and Genesis 8.1 morphs a "_div2" suffix
+    morph_name = morph_name.split("__")[-1].lower()
+    if morph_name.endswith("_div2"):
+        morph_name = morph_name[:-len("_div2")]
+    return morph_name
+
+def resolve_source_morphs(facs_mapping, key_name_list):
+    # returns {mapping morph name: shape key name} for the morphs found on the mesh
+    key_lookup = dict((normalize_morph_name(key_name), key_name) for key_name in key_name_list)
+    resolved = {}
+    for pose_entry in facs_mapping.values():
+        for morph_name in pose_entry["morphs"]:
+            key_name = key_lookup.get(normalize_morph_name(morph_name))
+            if key_name is not None:
+                resolved[morph_name] = key_name
+    return resolved
+
+def compute_side_weights(x_coords, side_list):
+    # (P, M) per-pose vertex weights, 1.0 for poses without a side, a smooth step across x = 0 otherwise
+    side_weights = np.ones((len(side_list), len(x_coords)), dtype=np.float32)
+    if len(x_coords) == 0:
+        return side_weights
+    blend_width = max(float(x_coords.max() - x_coords.min()) * FACS_SIDE_BLEND_FRACTION, 1e-9)
+    # the character's left is +x, same as the loose part separation
+    left_weights = np.clip(0.5 + x_coords / blend_width, 0.0, 1.0)
+    for pose_index, side in enumerate(side_list):
+        if side == "left":
+            side_weights[pose_index] = left_weights
+        elif side == "right":
+            side_weights[pose_index] = 1.0 - left_weights
+    return side_weights
+
+def synthesize_facs_deltas(source_deltas, blend_weights, side_weights):
+    # (K, M, 3) morph deltas, (P, K) pose weights and (P, M) side weights -> (P, M, 3) pose deltas
+    return np.einsum("pk,kmc->pmc", blend_weights, source_deltas) * side_weights[:, :, np.newaxis]
+
+def read_key_coords(key_block, num_vertices):
+    coords = np.empty(num_vertices * 3, dtype=np.float32)
+    key_block.data.foreach_get("co", coords)
+    return coords.reshape(-1, 3)
+
+def generate_facs_poses(head_obj, facs_mapping):
+    # add or overwrite one shape key per FACS pose on head_obj, returns report dict
+    start_time = time.perf_counter()
+    report = {"poses": [], "missing_poses": [], "source_morphs": [], "vertices": 0, "source_morphs_removed": 0}
+    if head_obj.data.shape_keys is None:
+        _add_to_log("ERROR: generate_facs_poses(): no shape keys on " + head_obj.name)
+        report["missing_poses"] = list(facs_mapping.keys())
+        return report
+    key_blocks = head_obj.data.shape_keys.key_blocks
+    reference_key = head_obj.data.shape_keys.reference_key
+    num_vertices = len(head_obj.data.vertices)
+    resolved = resolve_source_morphs(facs_mapping, [key_block.name for key_block in key_blocks if key_block.name != reference_key.name])
+    pose_names = [pose for pose, pose_entry in facs_mapping.items() if any(morph_name in resolved for morph_name in pose_entry["morphs"])]
+    report["missing_poses"] = [pose for pose in facs_mapping if pose not in pose_names]
+    if len(pose_names) == 0:
+        _add_to_log("ERROR: generate_facs_poses(): no FACS source morphs found on " + head_obj.name)
+        return report
+
+    # sparse source deltas: only the vertices any source morph moves
+    source_names = sorted(set(resolved[morph_name] for pose in pose_names for morph_name in facs_mapping[pose]["morphs"] if morph_name in resolved))
+    source_index = dict((key_name, index) for index, key_name in enumerate(source_names))
+    basis_coords = read_key_coords(reference_key, num_vertices)
+    source_deltas = np.stack([read_key_coords(key_blocks[key_name], num_vertices) - read_key_coords(key_blocks[key_name].relative_key, num_vertices) for key_name in source_names])
+    moved_vertices = np.flatnonzero(np.abs(source_deltas).max(axis=(0, 2)) > FACS_DELTA_THRESHOLD)
+    source_deltas = source_deltas[:, moved_vertices]
+
+    blend_weights = np.zeros((len(pose_names), len(source_names)), dtype=np.float32)
+    for pose_index, pose in enumerate(pose_names):
+        for morph_name, weight in facs_mapping[pose]["morphs"].items():
+            if morph_name in resolved:
+                blend_weights[pose_index, source_index[resolved[morph_name]]] += weight
+    side_weights = compute_side_weights(basis_coords[moved_vertices, 0], [facs_mapping[pose].get("side") for pose in pose_names])
+    pose_deltas = synthesize_facs_deltas(source_deltas, blend_weights, side_weights)
+
+    # write every pose relative to the basis
+    for pose_index, pose in enumerate(pose_names):
+        key_block = key_blocks.get(pose)
+        if key_block is None:
+            key_block = head_obj.shape_key_add(name=pose, from_mix=False)
+        key_block.relative_key = reference_key
+        coords = basis_coords.copy()
+        coords[moved_vertices] += pose_deltas[pose_index]
+        key_block.data.foreach_set("co", coords.ravel())
+
+    if REMOVE_SOURCE_MORPHS:
+        for key_name in source_names:
+            if key_name not in pose_names:
+                head_obj.shape_key_remove(key_blocks[key_name])
+                report["source_morphs_removed"] += 1
+    head_obj.data.update()
+
+    report["poses"] = pose_names
+    report["source_morphs"] = source_names
+    report["vertices"] = int(len(moved_vertices))
+    _add_to_log("DEBUG: generate_facs_poses(): " + head_obj.name + ": " + str(len(pose_names)) + " poses from " + str(len(source_names)) + " morphs over " + str(len(moved_vertices)) + " vertices, "
+                + str(len(report["missing_poses"])) + " poses missing, " + str(round(time.perf_counter() - start_time, 3)) + " seconds")
+    return report
+
+def write_facs_report(facs_report, report_path):
+    with open(report_path, "w") as file:
+        json.dump(facs_report, file, indent=2)
+    _add_to_log("DEBUG: write_facs_report(): wrote FACS report: " + report_path)
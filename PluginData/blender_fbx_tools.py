@@ -0,0 +1,219 @@
+"""Blender FBX Tools module
+
+Python module to read facts from a binary FBX file without Blender. The file is
+memory-mapped and the node tree is walked lazily: only node headers are read
+while searching, and property lists are decoded only for the requested nodes.
+Geometry array sizes come from the array headers without decompressing, and
+uncompressed arrays are returned as zero-copy NumPy views of the mapped file.
+Used for cache keys, preflight checks and cost estimates outside Blender.
+
+Command line usage:
+
+    python blender_fbx_tools.py <fbx file>
+
+Requirements:
+    - Python 3+
+    - NumPy
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_fbx_tools.log"
+
+## Do not modify below
+import sys, os, json, mmap, zlib, struct
+from collections import namedtuple
+import numpy as np
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+FBX_BINARY_MAGIC = b"Kaydara FBX Binary  \x00"
+FBX_HEADER_SIZE = 27
+# node record offsets and counts are 64-bit from this version on
+FBX_VERSION_64BIT = 7500
+FBX_ARRAY_DTYPES = {"f": np.dtype("<f4"), "d": np.dtype("<f8"), "l": np.dtype("<i8"), "i": np.dtype("<i4"), "b": np.dtype("u1")}
+FBX_SCALAR_FORMATS = {"Y": "<h", "C": "<?", "I": "<i", "F": "<f", "D": "<d", "L": "<q"}
+# separator between object name and class in binary FBX names, e.g. "Body\x00\x01Model"
+FBX_NAME_SEPARATOR = "\x00\x01"
+
+FbxNode = namedtuple("FbxNode", ["name", "offset", "end_offset", "num_properties", "properties_offset", "children_offset"])
+FbxArray = namedtuple("FbxArray", ["type_code", "length", "encoding", "data_offset", "data_length"])
+
+
+class FbxScanner():
+    """Lazy reader for the node tree of a memory-mapped binary FBX file."""
+
+    def __init__(self, fbx_path):
+        self.fbx_path = fbx_path
+        self.file = open(fbx_path, "rb")
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[:len(FBX_BINARY_MAGIC)] != FBX_BINARY_MAGIC:
+            self.close()
+            raise ValueError("not a binary FBX file: " + fbx_path)
+        self.version = struct.unpack_from("<I", self.buffer, 23)[0]
+        if self.version >= FBX_VERSION_64BIT:
+            self.record_format = "<QQQB"
+        else:
+            self.record_format = "<IIIB"
+        self.record_size = struct.calcsize(self.record_format)
+
+    def close(self):
+        # views returned by read_array() must be released before closing
+        self.buffer.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def read_node(self, offset):
+        # node header at offset, None for the null record which ends a node list
+        end_offset, num_properties, properties_length, name_length = struct.unpack_from(self.record_format, self.buffer, offset)
+        if end_offset == 0:
+            return None
+        name_offset = offset + self.record_size
+        name = self.buffer[name_offset:name_offset + name_length].decode("ascii", "replace")
+        properties_offset = name_offset + name_length
+        return FbxNode(name, offset, end_offset, num_properties, properties_offset, properties_offset + properties_length)
+
+    def iter_children(self, node=None):
+        # direct children of node, or the top level nodes
+        offset = FBX_HEADER_SIZE if node is None else node.children_offset
+        end_offset = len(self.buffer) if node is None else node.end_offset
+        while offset + self.record_size <= end_offset:
+            child = self.read_node(offset)
+            if child is None:
+                return
+            yield child
+            offset = child.end_offset
+
+    def find_child(self, node, name):
+        for child in self.iter_children(node):
+            if child.name == name:
+                return child
+        return None
+
+    def find_path(self, path_list):
+        # e.g. ["Objects"], returns None if any node along the path is missing
+        node = None
+        for name in path_list:
+            node = self.find_child(node, name)
+            if node is None:
+                return None
+        return node
+
+    def read_properties(self, node):
+        # scalars and strings are decoded, arrays are returned as FbxArray references for read_array()
+        property_list = []
+        offset = node.properties_offset
+        for index in range(node.num_properties):
+            type_code = chr(self.buffer[offset])
+            offset += 1
+            if type_code in FBX_SCALAR_FORMATS:
+                property_format = FBX_SCALAR_FORMATS[type_code]
+                property_list.append(struct.unpack_from(property_format, self.buffer, offset)[0])
+                offset += struct.calcsize(property_format)
+            elif type_code in FBX_ARRAY_DTYPES:
+                length, encoding, data_length = struct.unpack_from("<III", self.buffer, offset)
+                property_list.append(FbxArray(type_code, length, encoding, offset + 12, data_length))
+                offset += 12 + data_length
+            elif type_code in ("S", "R"):
+                data_length = struct.unpack_from("<I", self.buffer, offset)[0]
+                data = self.buffer[offset + 4:offset + 4 + data_length]
+                property_list.append(data.decode("utf-8", "replace") if type_code == "S" else data)
+                offset += 4 + data_length
+            else:
+                raise ValueError("unknown FBX property type '" + type_code + "' in node " + node.name)
+        return property_list
+
+    def read_array(self, array):
+        # zero-copy view for uncompressed arrays, decompressed copy otherwise
+        dtype = FBX_ARRAY_DTYPES[array.type_code]
+        if array.encoding == 0:
+            return np.frombuffer(self.buffer, dtype=dtype, count=array.length, offset=array.data_offset)
+        data = zlib.decompress(self.buffer[array.data_offset:array.data_offset + array.data_length])
+        return np.frombuffer(data, dtype=dtype, count=array.length)
+
+    def read_child_property(self, node, name, index=0):
+        child = self.find_child(node, name)
+        if child is None or child.num_properties <= index:
+            return None
+        return self.read_properties(child)[index]
+
+    def iter_objects(self, object_type=None):
+        # (node, object id, name, class) of every "Objects" child, optionally only nodes named object_type
+        objects_node = self.find_path(["Objects"])
+        if objects_node is None:
+            return
+        for node in self.iter_children(objects_node):
+            if object_type is not None and node.name != object_type:
+                continue
+            property_list = self.read_properties(node)
+            if len(property_list) < 3:
+                continue
+            yield node, property_list[0], split_object_name(property_list[1]), property_list[2]
+
+
+def split_object_name(fbx_name):
+    return fbx_name.split(FBX_NAME_SEPARATOR)[0]
+
+def count_polygons(polygon_vertex_index):
+    # the last vertex of each polygon is stored as (-index - 1)
+    return int(np.count_nonzero(polygon_vertex_index < 0))
+
+def scan_fbx(fbx_path, count_faces=True):
+    # summary of geometry sizes and object names, count_faces decompresses the polygon index arrays
+    summary = {"version": 0, "geometries": [], "models": [], "bones": [], "materials": [], "deformers": {}, "embedded_textures": 0, "embedded_texture_bytes": 0}
+    with FbxScanner(fbx_path) as scanner:
+        summary["version"] = scanner.version
+        for node, object_id, name, object_class in scanner.iter_objects():
+            if node.name == "Geometry":
+                geometry = {"name": name, "class": object_class}
+                vertices = scanner.read_child_property(node, "Vertices")
+                geometry["vertices"] = vertices.length // 3 if vertices is not None else 0
+                polygon_vertex_index = scanner.read_child_property(node, "PolygonVertexIndex")
+                if polygon_vertex_index is not None:
+                    geometry["polygon_vertex_indices"] = polygon_vertex_index.length
+                    if count_faces:
+                        geometry["faces"] = count_polygons(scanner.read_array(polygon_vertex_index))
+                summary["geometries"].append(geometry)
+            elif node.name == "Model":
+                summary["models"].append({"name": name, "class": object_class})
+                if object_class == "LimbNode":
+                    summary["bones"].append(name)
+            elif node.name == "Material":
+                summary["materials"].append(name)
+            elif node.name == "Deformer":
+                summary["deformers"].setdefault(object_class, []).append(name)
+            elif node.name == "Video":
+                content = scanner.read_child_property(node, "Content")
+                if isinstance(content, bytes) and len(content) > 0:
+                    summary["embedded_textures"] += 1
+                    summary["embedded_texture_bytes"] += len(content)
+    return summary
+
+def get_fbx_input_stats(fbx_path):
+    # vertex, face and shape key totals over the mesh geometries, as recorded in the job metrics
+    summary = scan_fbx(fbx_path)
+    mesh_geometries = [geometry for geometry in summary["geometries"] if geometry["class"] == "Mesh"]
+    return {
+        "vertices": sum(geometry["vertices"] for geometry in mesh_geometries),
+        "faces": sum(geometry.get("faces", 0) for geometry in mesh_geometries),
+        "shape_keys": len(summary["deformers"].get("BlendShapeChannel", [])),
+    }
+
+
+# Execute main()
+if __name__=='__main__':
+    if len(sys.argv) < 2:
+        print("\nUSAGE: python blender_fbx_tools.py <fbx file>\n")
+        exit(1)
+    print(json.dumps(scan_fbx(sys.argv[1]), indent=2))
+    exit(0)
@@ -0,0 +1,306 @@
+"""Blender Mesh Tools module
+
+Blender python module to clean up and optimize the separated Roblox "*_Geo"
+parts before export. Vertex positions and triangles are pulled into NumPy
+arrays: coincident vertices are found with a spatial hash and welded, unless
+they move apart in any shape key, degenerate and zero-area triangles are removed, then triangles are reordered
+with Tipsify (Sander et al. 2007) for post-transform vertex cache locality and
+vertices are renumbered in first-use order. Edits are applied through bmesh so
+UVs, vertex groups and shape keys follow the new order. ACMR (average cache
+miss ratio) is reported before and after. Parts are triangulated permanently,
+and a pending Decimate modifier is applied first, through the quadric
+decimator for parts with shape keys, so the exported order is the optimized one.
+
+Requirements:
+    - Python 3+
+    - Blender 3.6+ (uses the NumPy bundled with Blender)
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_mesh_tools.log"
+
+## Do not modify below
+import sys, os, json, time
+import numpy as np
+try:
+    import bpy
+    import bmesh
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+try:
+    import blender_decimate_tools
+except:
+    sys.path.append(script_dir)
+    import blender_decimate_tools
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+# vertices closer than this are welded, in scene units
+MERGE_DISTANCE = 1e-5
+# triangles with a smaller area are removed, in squared scene units
+DEGENERATE_AREA = 1e-12
+# simulated post-transform vertex cache size, used for Tipsify and ACMR
+VERTEX_CACHE_SIZE = 16
+
+
+## Array operations
+def find_merge_groups(coords, merge_distance=MERGE_DISTANCE):
+    # spatial hash weld, returns (N,) index of the vertex each vertex merges into (itself if kept)
+    num_vertices = len(coords)
+    if num_vertices == 0:
+        return np.zeros(0, dtype=np.int64)
+    cells = np.floor(coords / merge_distance).astype(np.int64)
+    cells -= cells.min(axis=0) - 1
+    dims = cells.max(axis=0) + 2
+    keys = (cells[:,0] * dims[1] + cells[:,1]) * dims[2] + cells[:,2]
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    first_pairs = []
+    second_pairs = []
+    # self cell plus half of the 26 neighbor cells, so every cell pair is visited once
+    offsets = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1) if (dx, dy, dz) >= (0, 0, 0)]
+    for dx, dy, dz in offsets:
+        neighbor_keys = keys + (dx * dims[1] + dy) * dims[2] + dz
+        start = np.searchsorted(sorted_keys, neighbor_keys, side="left")
+        end = np.searchsorted(sorted_keys, neighbor_keys, side="right")
+        max_count = int((end - start).max(initial=0))
+        for j in range(max_count):
+            has_candidate = start + j < end
+            first = np.flatnonzero(has_candidate)
+            second = order[start[first] + j]
+            if (dx, dy, dz) == (0, 0, 0):
+                keep = second > first
+                first = first[keep]
+                second = second[keep]
+            close = np.linalg.norm(coords[first] - coords[second], axis=1) <= merge_distance
+            first_pairs.append(first[close])
+            second_pairs.append(second[close])
+    labels = np.arange(num_vertices, dtype=np.int64)
+    if len(first_pairs) == 0:
+        return labels
+    first = np.concatenate(first_pairs)
+    second = np.concatenate(second_pairs)
+    # union-find by min-label propagation with pointer jumping
+    while len(first) > 0:
+        lowest = np.minimum(labels[first], labels[second])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, first, lowest)
+        np.minimum.at(new_labels, second, lowest)
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    return labels
+
+def keep_shape_key_seams(labels, key_coords, merge_distance=MERGE_DISTANCE):
+    # undo merges of vertices which are further apart than merge_distance in any shape key, key_coords is (N,K,3)
+    merged = np.flatnonzero(labels != np.arange(len(labels)))
+    if len(merged) == 0 or key_coords.shape[1] == 0:
+        return labels
+    key_distance = np.linalg.norm(key_coords[merged] - key_coords[labels[merged]], axis=2).max(axis=1)
+    labels = labels.copy()
+    split = merged[key_distance > merge_distance]
+    labels[split] = split
+    return labels
+
+def find_degenerate_triangles(coords, triangles, min_area=DEGENERATE_AREA):
+    # boolean (T,) mask of triangles with repeated vertices or zero area
+    repeated = (triangles[:,0] == triangles[:,1]) | (triangles[:,1] == triangles[:,2]) | (triangles[:,0] == triangles[:,2])
+    corners = coords[triangles]
+    doubled_area = np.linalg.norm(np.cross(corners[:,1] - corners[:,0], corners[:,2] - corners[:,0]), axis=1)
+    return repeated | (doubled_area * 0.5 < min_area)
+
+def compute_acmr(triangles, cache_size=VERTEX_CACHE_SIZE):
+    # average cache miss ratio of a FIFO post-transform cache, lower is better, 0.5 is the ideal for large meshes
+    if len(triangles) == 0:
+        return 0.0
+    cache = [-1] * cache_size
+    cache_set = set()
+    cache_head = 0
+    misses = 0
+    for vertex in triangles.ravel().tolist():
+        if vertex in cache_set:
+            continue
+        misses += 1
+        cache_set.discard(cache[cache_head])
+        cache[cache_head] = vertex
+        cache_set.add(vertex)
+        cache_head = (cache_head + 1) % cache_size
+    return misses / len(triangles)
+
+def build_vertex_triangle_adjacency(triangles, num_vertices):
+    # CSR adjacency: triangles of vertex v are adjacency[offsets[v]:offsets[v+1]]
+    flat = triangles.ravel()
+    order = np.argsort(flat, kind="stable")
+    counts = np.bincount(flat, minlength=num_vertices)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    return order // 3, offsets, counts
+
+def tipsify(triangles, num_vertices, cache_size=VERTEX_CACHE_SIZE):
+    # returns triangle order for vertex cache locality, see "Fast Triangle Reordering for Vertex Locality and Reduced Overdraw"
+    num_triangles = len(triangles)
+    adjacency, offsets, counts = build_vertex_triangle_adjacency(triangles, num_vertices)
+    adjacency = adjacency.tolist()
+    offsets = offsets.tolist()
+    live = counts.tolist()
+    triangle_list = triangles.tolist()
+    cache_time = [0] * num_vertices
+    emitted = [False] * num_triangles
+    dead_end = []
+    output = []
+    time_stamp = cache_size + 1
+    cursor = 0
+    fan_vertex = 0
+    while fan_vertex >= 0:
+        candidates = []
+        for triangle in adjacency[offsets[fan_vertex]:offsets[fan_vertex + 1]]:
+            if emitted[triangle]:
+                continue
+            output.append(triangle)
+            emitted[triangle] = True
+            for vertex in triangle_list[triangle]:
+                dead_end.append(vertex)
+                candidates.append(vertex)
+                live[vertex] -= 1
+                if time_stamp - cache_time[vertex] > cache_size:
+                    cache_time[vertex] = time_stamp
+                    time_stamp += 1
+        # next fanning vertex: the candidate that stays in cache longest after its remaining fan
+        fan_vertex = -1
+        best_priority = -1
+        for vertex in candidates:
+            if live[vertex] <= 0:
+                continue
+            priority = 0
+            if time_stamp - cache_time[vertex] + 2 * live[vertex] <= cache_size:
+                priority = time_stamp - cache_time[vertex]
+            if priority > best_priority:
+                best_priority = priority
+                fan_vertex = vertex
+        if fan_vertex == -1:
+            while len(dead_end) > 0:
+                vertex = dead_end.pop()
+                if live[vertex] > 0:
+                    fan_vertex = vertex
+                    break
+        if fan_vertex == -1:
+            while cursor < num_vertices:
+                if live[cursor] > 0:
+                    fan_vertex = cursor
+                    break
+                cursor += 1
+    return np.array(output, dtype=np.int64)
+
+def compute_vertex_order(triangles, num_vertices):
+    # vertex rank in first-use order of the index buffer, unused vertices go last
+    first_use = np.full(num_vertices, len(triangles) * 3, dtype=np.int64)
+    flat = triangles.ravel()
+    np.minimum.at(first_use, flat, np.arange(len(flat)))
+    vertex_order = np.argsort(first_use, kind="stable")
+    vertex_rank = np.empty(num_vertices, dtype=np.int64)
+    vertex_rank[vertex_order] = np.arange(num_vertices)
+    return vertex_rank
+
+
+## Mesh level
+def read_bmesh_arrays(bm):
+    bm.verts.index_update()
+    bm.faces.index_update()
+    coords = np.array([v.co[:] for v in bm.verts], dtype=np.float64).reshape(-1, 3)
+    triangles = np.array([[v.index for v in f.verts] for f in bm.faces], dtype=np.int64).reshape(-1, 3)
+    return coords, triangles
+
+def read_bmesh_shape_coords(bm):
+    # (N,K,3) vertex coordinates of every shape key layer of bm
+    layers = list(bm.verts.layers.shape.values())
+    key_coords = np.empty((len(bm.verts), len(layers), 3), dtype=np.float64)
+    for layer_index, layer in enumerate(layers):
+        key_coords[:,layer_index] = [v[layer][:] for v in bm.verts]
+    return key_coords
+
+def apply_decimate_modifier(mesh_obj):
+    # the part meshes are only decimated at export, apply it so the optimized order is what gets exported
+    for mod in mesh_obj.modifiers:
+        if mod.type != "DECIMATE":
+            continue
+        if mesh_obj.data.shape_keys is not None:
+            # modifier_apply refuses meshes with shape keys, the quadric decimator keeps them
+            _add_to_log("DEBUG: apply_decimate_modifier(): " + mesh_obj.name + " has shape keys, decimating with the quadric decimator")
+            return blender_decimate_tools.replace_decimate_modifier(mesh_obj) is not None
+        bpy.ops.object.mode_set(mode="OBJECT")
+        bpy.context.view_layer.objects.active = mesh_obj
+        bpy.ops.object.modifier_apply(modifier=mod.name)
+        return True
+    return False
+
+def optimize_part_mesh(mesh_obj, merge_distance=MERGE_DISTANCE, cache_size=VERTEX_CACHE_SIZE):
+    # weld, remove degenerates and reorder mesh_obj in place, returns report dict for the part
+    apply_decimate_modifier(mesh_obj)
+    mesh = mesh_obj.data
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    bmesh.ops.triangulate(bm, faces=bm.faces[:])
+    coords, triangles = read_bmesh_arrays(bm)
+    report = {"vertices_before": len(coords), "triangles_before": len(triangles), "acmr_before": compute_acmr(triangles, cache_size)}
+
+    labels = find_merge_groups(coords, merge_distance)
+    if mesh.shape_keys is not None:
+        # weld_verts keeps the target position in every shape key, vertices which only touch at rest stay apart
+        labels = keep_shape_key_seams(labels, read_bmesh_shape_coords(bm), merge_distance)
+    merged = np.flatnonzero(labels != np.arange(len(labels)))
+    if len(merged) > 0:
+        bm.verts.ensure_lookup_table()
+        targetmap = dict((bm.verts[i], bm.verts[labels[i]]) for i in merged.tolist())
+        bmesh.ops.weld_verts(bm, targetmap=targetmap)
+        coords, triangles = read_bmesh_arrays(bm)
+    report["vertices_merged"] = len(merged)
+
+    degenerate = np.flatnonzero(find_degenerate_triangles(coords, triangles))
+    if len(degenerate) > 0:
+        bm.faces.ensure_lookup_table()
+        bmesh.ops.delete(bm, geom=[bm.faces[i] for i in degenerate.tolist()], context="FACES")
+        coords, triangles = read_bmesh_arrays(bm)
+    report["triangles_removed"] = len(degenerate)
+
+    triangle_order = tipsify(triangles, len(coords), cache_size)
+    triangle_rank = np.empty(len(triangles), dtype=np.int64)
+    triangle_rank[triangle_order] = np.arange(len(triangles))
+    vertex_rank = compute_vertex_order(triangles[triangle_order], len(coords))
+    triangle_rank = triangle_rank.tolist()
+    vertex_rank = vertex_rank.tolist()
+    bm.faces.sort(key=lambda f: triangle_rank[f.index])
+    bm.verts.sort(key=lambda v: vertex_rank[v.index])
+    coords, triangles = read_bmesh_arrays(bm)
+    bm.to_mesh(mesh)
+    bm.free()
+    mesh.update()
+    report["vertices_after"] = len(coords)
+    report["triangles_after"] = len(triangles)
+    report["acmr_after"] = compute_acmr(triangles, cache_size)
+    return report
+
+def optimize_part_meshes(mesh_obj_list=None, merge_distance=MERGE_DISTANCE, cache_size=VERTEX_CACHE_SIZE):
+    # optimize every "*_Geo" part, returns {part_name: report}
+    start_time = time.perf_counter()
+    if mesh_obj_list is None:
+        mesh_obj_list = [obj for obj in bpy.data.objects if obj.type == 'MESH' and obj.name.endswith("_Geo")]
+    mesh_report = {}
+    for obj in mesh_obj_list:
+        report = optimize_part_mesh(obj, merge_distance, cache_size)
+        mesh_report[obj.name] = report
+        _add_to_log("DEBUG: optimize_part_meshes(): " + obj.name + ": merged " + str(report["vertices_merged"]) + " vertices, removed " + str(report["triangles_removed"]) + " triangles, ACMR " + str(round(report["acmr_before"], 3)) + " -> " + str(round(report["acmr_after"], 3)))
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: optimize_part_meshes(): optimized " + str(len(mesh_report)) + " parts in " + str(round(elapsed_time, 3)) + " seconds")
+    return mesh_report
+
+def write_mesh_report(mesh_report, report_path):
+    with open(report_path, "w") as file:
+        json.dump(mesh_report, file, indent=2)
+    _add_to_log("DEBUG: write_mesh_report(): wrote mesh report: " + report_path)
@@ -0,0 +1,331 @@
+"""Blender Metrics Tools module
+
+Python module to keep a history of conversion jobs in a local SQLite database.
+Each pipeline run records its input sizes, per-stage durations, peak memory,
+output sizes and exit status, tagged with a hash of the pipeline scripts, so
+timings can be compared across script versions. Runs inside Blender to record
+jobs, and as a command line tool without Blender to query them.
+
+Command line usage:
+
+    python blender_metrics_tools.py [--db <database>] list [--limit N]
+    python blender_metrics_tools.py [--db <database>] percentiles [--stage <stage>]
+    python blender_metrics_tools.py [--db <database>] trends [--stage <stage>]
+    python blender_metrics_tools.py [--db <database>] regressions [--threshold 1.2]
+
+Requirements:
+    - Python 3+
+    - Blender 3.6+ (optional, for recording jobs)
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_metrics_tools.log"
+
+## Do not modify below
+import sys, os, json, time, sqlite3, hashlib, argparse
+try:
+    import bpy
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+try:
+    import blender_tools
+except:
+    sys.path.append(script_dir)
+    import blender_tools
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+# kept in the DazToRoblox documents folder, the default intermediate folder of the bridge, so OS temp cleanup does not erase the job history
+METRICS_DATABASE_PATH = os.path.join(os.path.expanduser("~"), "Documents", "DazToRoblox", "job_metrics.sqlite").replace("\\","/")
+METRICS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL,
+    script_version TEXT,
+    input_path TEXT,
+    input_bytes INTEGER,
+    vertices INTEGER,
+    faces INTEGER,
+    materials INTEGER,
+    shape_keys INTEGER,
+    texture_bytes INTEGER,
+    texture_pixels INTEGER,
+    peak_memory_bytes INTEGER,
+    output_bytes INTEGER,
+    total_seconds REAL,
+    exit_status TEXT,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS stages (
+    job_id INTEGER,
+    stage_order INTEGER,
+    stage TEXT,
+    seconds REAL
+);
+CREATE INDEX IF NOT EXISTS stages_by_stage ON stages (stage, job_id);
+"""
+# columns added after the first schema, added to older databases on open
+METRICS_ADDED_COLUMNS = [("texture_pixels", "INTEGER")]
+# total job time is reported as this stage in the queries
+TOTAL_STAGE = "total"
+
+current_job = None
+
+
+def get_script_version():
+    # short hash over all pipeline scripts, changes whenever any script is edited
+    hasher = hashlib.sha1()
+    for filename in sorted(os.listdir(script_dir)):
+        if filename.endswith(".py"):
+            with open(os.path.join(script_dir, filename), "rb") as file:
+                hasher.update(file.read())
+    return hasher.hexdigest()[:12]
+
+def get_peak_memory_bytes():
+    # peak resident memory of this process, None if not available
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                            ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                            ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb)
+            return int(counters.PeakWorkingSetSize)
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on linux, bytes on macOS
+        return int(max_rss if sys.platform == "darwin" else max_rss * 1024)
+    except Exception as e:
+        _add_to_log("ERROR: get_peak_memory_bytes(): " + str(e))
+        return None
+
+def get_dtu_texture_stats(dtu_dict):
+    # count, total file size and total pixels of the distinct textures referenced by the DTU materials
+    stats = {"textures": 0, "texture_bytes": 0, "texture_pixels": 0}
+    for texture_path in blender_tools.get_dtu_texture_paths(dtu_dict):
+        if not os.path.exists(texture_path):
+            continue
+        stats["textures"] += 1
+        stats["texture_bytes"] += os.path.getsize(texture_path)
+        try:
+            image_size = blender_tools.read_image_dimensions(texture_path)
+        except Exception as e:
+            _add_to_log("ERROR: get_dtu_texture_stats(): unable to read image header: " + texture_path + ", " + str(e))
+            image_size = None
+        if image_size is not None:
+            stats["texture_pixels"] += image_size[0] * image_size[1]
+    return stats
+
+def collect_scene_stats(dtu_dict):
+    # input sizes of the imported scene, called once after import
+    stats = {"vertices": 0, "faces": 0, "shape_keys": 0, "materials": len(dtu_dict.get("Materials", []))}
+    for obj in bpy.data.objects:
+        if obj.type != 'MESH':
+            continue
+        stats["vertices"] += len(obj.data.vertices)
+        stats["faces"] += len(obj.data.polygons)
+        if obj.data.shape_keys is not None:
+            stats["shape_keys"] += len(obj.data.shape_keys.key_blocks) - 1
+    texture_stats = get_dtu_texture_stats(dtu_dict)
+    stats["texture_bytes"] = texture_stats["texture_bytes"]
+    stats["texture_pixels"] = texture_stats["texture_pixels"]
+    return stats
+
+def open_database(db_path=None):
+    if db_path is None:
+        db_path = METRICS_DATABASE_PATH
+    db_folder = os.path.dirname(db_path)
+    if db_folder != "" and not os.path.exists(db_folder):
+        os.makedirs(db_folder)
+    connection = sqlite3.connect(db_path, timeout=30)
+    connection.executescript(METRICS_SCHEMA)
+    job_columns = [row[1] for row in connection.execute("PRAGMA table_info(jobs)")]
+    for column_name, column_type in METRICS_ADDED_COLUMNS:
+        if column_name not in job_columns:
+            connection.execute("ALTER TABLE jobs ADD COLUMN " + column_name + " " + column_type)
+    return connection
+
+
+class JobRecorder():
+    """Collects the metrics of one pipeline run and writes them when the job finishes."""
+
+    def __init__(self, input_path, db_path=None):
+        self.db_path = db_path
+        self.input_path = input_path
+        self.started_at = time.time()
+        self.start_time = time.perf_counter()
+        self.last_mark = self.start_time
+        self.stage_list = []
+        self.stats = {}
+        self.output_paths = []
+
+    def mark_stage(self, stage_name):
+        # time since the previous mark is booked to stage_name
+        now = time.perf_counter()
+        self.stage_list.append((stage_name, now - self.last_mark))
+        self.last_mark = now
+
+    def set_input_stats(self, stats):
+        self.stats.update(stats)
+
+    def add_output(self, output_path):
+        self.output_paths.append(output_path)
+
+    def finish(self, exit_status, error=None):
+        total_seconds = time.perf_counter() - self.start_time
+        input_bytes = os.path.getsize(self.input_path) if os.path.exists(self.input_path) else None
+        output_bytes = sum(os.path.getsize(path) for path in self.output_paths if os.path.exists(path))
+        connection = open_database(self.db_path)
+        with connection:
+            cursor = connection.execute(
+                "INSERT INTO jobs (started_at, script_version, input_path, input_bytes, vertices, faces, materials, shape_keys, texture_bytes, texture_pixels, peak_memory_bytes, output_bytes, total_seconds, exit_status, error) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                (self.started_at, get_script_version(), self.input_path, input_bytes, self.stats.get("vertices"), self.stats.get("faces"), self.stats.get("materials"), self.stats.get("shape_keys"), self.stats.get("texture_bytes"), self.stats.get("texture_pixels"),
+                 get_peak_memory_bytes(), output_bytes, total_seconds, exit_status, error))
+            job_id = cursor.lastrowid
+            connection.executemany("INSERT INTO stages (job_id, stage_order, stage, seconds) VALUES (?,?,?,?)",
+                [(job_id, stage_order, stage, seconds) for stage_order, (stage, seconds) in enumerate(self.stage_list)])
+        connection.close()
+        _add_to_log("DEBUG: JobRecorder.finish(): recorded job " + str(job_id) + " (" + exit_status + ") in " + str(round(total_seconds, 3)) + " seconds")
+        return job_id
+
+
+# module level recorder, so stages and the script entry point can reach the running job
+def start_job(input_path, db_path=None):
+    global current_job
+    current_job = JobRecorder(input_path, db_path)
+    return current_job
+
+def mark_stage(stage_name):
+    if current_job is not None:
+        current_job.mark_stage(stage_name)
+
+def finish_job(exit_status, error=None):
+    global current_job
+    if current_job is None:
+        return None
+    try:
+        job_id = current_job.finish(exit_status, error)
+    except Exception as e:
+        _add_to_log("ERROR: finish_job(): unable to record job metrics: " + str(e))
+        job_id = None
+    current_job = None
+    return job_id
+
+
+def percentile(sorted_values, fraction):
+    # linear interpolation between closest ranks
+    if len(sorted_values) == 0:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def query_stage_seconds(connection, stage=None):
+    # returns list of (script_version, started_at, stage, seconds) for completed jobs, including the job total
+    rows = connection.execute(
+        "SELECT jobs.script_version, jobs.started_at, stages.stage, stages.seconds FROM stages JOIN jobs ON jobs.id = stages.job_id WHERE jobs.exit_status = 'completed'"
+        " UNION ALL SELECT script_version, started_at, ?, total_seconds FROM jobs WHERE exit_status = 'completed'", (TOTAL_STAGE,)).fetchall()
+    if stage is not None:
+        rows = [row for row in rows if row[2] == stage]
+    return rows
+
+def group_seconds(rows, key_index):
+    groups = {}
+    for row in rows:
+        groups.setdefault(row[key_index], []).append(row[3])
+    return dict((key, sorted(values)) for key, values in groups.items())
+
+def get_version_order(connection):
+    # script versions ordered by their first run
+    return [row[0] for row in connection.execute("SELECT script_version, MIN(started_at) AS first_run FROM jobs GROUP BY script_version ORDER BY first_run")]
+
+def summarize_seconds(values):
+    return {"runs": len(values), "p50": percentile(values, 0.5), "p90": percentile(values, 0.9), "p99": percentile(values, 0.99), "max": values[-1]}
+
+def get_stage_percentiles(connection, stage=None):
+    return dict((stage_name, summarize_seconds(values)) for stage_name, values in group_seconds(query_stage_seconds(connection, stage), 2).items())
+
+def get_stage_trends(connection, stage=TOTAL_STAGE):
+    # per script version summary of one stage, oldest version first
+    rows = query_stage_seconds(connection, stage)
+    version_groups = group_seconds(rows, 0)
+    return [(version, summarize_seconds(version_groups[version])) for version in get_version_order(connection) if version in version_groups]
+
+def find_regressions(connection, threshold=1.2):
+    # stages whose median in the latest script version is slower than threshold times the previous version
+    version_order = get_version_order(connection)
+    if len(version_order) < 2:
+        return []
+    previous_version, latest_version = version_order[-2], version_order[-1]
+    rows = query_stage_seconds(connection)
+    regression_list = []
+    for stage_name in sorted(set(row[2] for row in rows)):
+        previous = sorted(row[3] for row in rows if row[2] == stage_name and row[0] == previous_version)
+        latest = sorted(row[3] for row in rows if row[2] == stage_name and row[0] == latest_version)
+        if len(previous) == 0 or len(latest) == 0:
+            continue
+        previous_median = percentile(previous, 0.5)
+        latest_median = percentile(latest, 0.5)
+        if previous_median > 0 and latest_median / previous_median > threshold:
+            regression_list.append({"stage": stage_name, "previous_version": previous_version, "latest_version": latest_version,
+                                    "previous_p50": previous_median, "latest_p50": latest_median, "ratio": latest_median / previous_median})
+    return regression_list
+
+
+def _format_seconds(value):
+    return "-" if value is None else str(round(value, 3))
+
+def _main(argv):
+    parser = argparse.ArgumentParser(description="Query the DazToRoblox job metrics database.")
+    parser.add_argument("--db", default=METRICS_DATABASE_PATH, help="database path")
+    subparsers = parser.add_subparsers(dest="command")
+    list_parser = subparsers.add_parser("list", help="most recent jobs")
+    list_parser.add_argument("--limit", type=int, default=20)
+    percentile_parser = subparsers.add_parser("percentiles", help="stage duration percentiles over completed jobs")
+    percentile_parser.add_argument("--stage", default=None)
+    trend_parser = subparsers.add_parser("trends", help="stage duration per script version")
+    trend_parser.add_argument("--stage", default=TOTAL_STAGE)
+    regression_parser = subparsers.add_parser("regressions", help="stages slower in the latest script version")
+    regression_parser.add_argument("--threshold", type=float, default=1.2)
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 1
+
+    connection = open_database(args.db)
+    if args.command == "list":
+        for row in connection.execute("SELECT id, datetime(started_at, 'unixepoch', 'localtime'), script_version, exit_status, total_seconds, vertices, peak_memory_bytes, input_path FROM jobs ORDER BY id DESC LIMIT ?", (args.limit,)):
+            print(str(row[0]) + "\t" + str(row[1]) + "\t" + str(row[2]) + "\t" + str(row[3]) + "\t" + _format_seconds(row[4]) + "s\t" + str(row[5]) + " vertices\t" + str(row[6]) + " bytes\t" + str(row[7]))
+    elif args.command == "percentiles":
+        for stage_name, summary in sorted(get_stage_percentiles(connection, args.stage).items()):
+            print(stage_name + "\truns=" + str(summary["runs"]) + "\tp50=" + _format_seconds(summary["p50"]) + "\tp90=" + _format_seconds(summary["p90"]) + "\tp99=" + _format_seconds(summary["p99"]) + "\tmax=" + _format_seconds(summary["max"]))
+    elif args.command == "trends":
+        for version, summary in get_stage_trends(connection, args.stage):
+            print(version + "\truns=" + str(summary["runs"]) + "\tp50=" + _format_seconds(summary["p50"]) + "\tp90=" + _format_seconds(summary["p90"]))
+    elif args.command == "regressions":
+        regression_list = find_regressions(connection, args.threshold)
+        for regression in regression_list:
+            print("REGRESSION: " + regression["stage"] + ": p50 " + _format_seconds(regression["previous_p50"]) + "s -> " + _format_seconds(regression["latest_p50"]) + "s (x" + str(round(regression["ratio"], 2)) + ") in " + regression["latest_version"])
+        connection.close()
+        return 1 if len(regression_list) > 0 else 0
+    connection.close()
+    return 0
+
+
+# Execute main()
+if __name__=='__main__':
+    exit(_main(sys.argv[1:]))
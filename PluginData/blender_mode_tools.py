@@ -0,0 +1,103 @@
+"""Blender Mode Tools module
+
+Blender python module to route the object/edit mode switches, active object
+changes and object deletes of the separation stages through one place. Mode
+and active object changes are skipped when the scene is already in the
+requested state, since every edit mode entry converts the whole mesh to BMesh
+and back. Edit mode work is batched: several objects enter edit mode together
+and stay there while all their operations run. Objects are deleted in bulk with
+bpy.data.batch_remove() instead of one bpy.ops.object.delete() per object.
+
+Requirements:
+    - Python 3+
+    - Blender 3.6+
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_mode_tools.log"
+
+## Do not modify below
+import sys, os, time
+from contextlib import contextmanager
+try:
+    import bpy
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+class ModeManager():
+    """Skips redundant mode and active object changes, and counts the switches made and avoided."""
+
+    def __init__(self):
+        self.mode_switches = 0
+        self.mode_switches_avoided = 0
+        self.active_changes_avoided = 0
+        self.objects_removed = 0
+        self.edit_seconds = 0.0
+
+    def get_mode(self):
+        # object mode of the active object, "OBJECT" without an active object
+        active_obj = bpy.context.view_layer.objects.active
+        if active_obj is None:
+            return "OBJECT"
+        return active_obj.mode
+
+    def set_mode(self, mode):
+        if self.get_mode() == mode:
+            self.mode_switches_avoided += 1
+            return
+        bpy.ops.object.mode_set(mode=mode)
+        self.mode_switches += 1
+
+    def set_active(self, obj):
+        # the active object can only change in object mode
+        if bpy.context.view_layer.objects.active == obj:
+            self.active_changes_avoided += 1
+            return
+        self.set_mode("OBJECT")
+        bpy.context.view_layer.objects.active = obj
+
+    def select_only(self, obj_list, active_obj=None):
+        self.set_mode("OBJECT")
+        bpy.ops.object.select_all(action='DESELECT')
+        for obj in obj_list:
+            obj.select_set(True)
+        if active_obj is None and len(obj_list) > 0:
+            active_obj = obj_list[0]
+        if active_obj is not None:
+            self.set_active(active_obj)
+
+    @contextmanager
+    def edit_objects(self, obj_list):
+        # enter edit mode once for every object in obj_list, back to object mode on exit
+        if len(obj_list) == 0:
+            yield
+            return
+        start_time = time.perf_counter()
+        self.select_only(obj_list)
+        self.set_mode("EDIT")
+        try:
+            yield
+        finally:
+            self.set_mode("OBJECT")
+            self.edit_seconds += time.perf_counter() - start_time
+
+    def batch_remove(self, obj_list):
+        # delete objects without going through the delete operator, mesh data is purged with the orphans later
+        obj_list = [obj for obj in obj_list if obj is not None]
+        if len(obj_list) == 0:
+            return
+        self.set_mode("OBJECT")
+        bpy.data.batch_remove(ids=obj_list)
+        self.objects_removed += len(obj_list)
+
+    def log_counts(self, stage_name):
+        _add_to_log("DEBUG: ModeManager.log_counts(): " + stage_name + ": " + str(self.mode_switches) + " mode switches, " + str(self.mode_switches_avoided) + " avoided, "
+                    + str(self.active_changes_avoided) + " active object changes avoided, " + str(self.objects_removed) + " objects batch removed, " + str(round(self.edit_seconds, 3)) + " seconds in edit mode")
@@ -0,0 +1,243 @@
+"""Blender Preflight Tools module
+
+Blender python module to validate a freshly imported Genesis figure against
+Roblox limits before the expensive decimation, segmentation and packing
+stages run. Mesh statistics are gathered with bulk foreach_get() reads and
+NumPy, texture dimensions are read from image file headers without decoding
+the pixels. The result is a machine-readable report which is written next to
+the intermediate FBX file.
+
+Requirements:
+    - Python 3+
+    - Blender 3.6+ (uses the NumPy bundled with Blender)
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_preflight_tools.log"
+
+## Do not modify below
+import sys, os, json, time
+import numpy as np
+try:
+    import bpy
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+try:
+    import blender_tools
+except:
+    sys.path.append(script_dir)
+    import blender_tools
+
+try:
+    import blender_weight_tools
+except:
+    sys.path.append(script_dir)
+    import blender_weight_tools
+
+try:
+    import blender_scene_tools
+except:
+    sys.path.append(script_dir)
+    import blender_scene_tools
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+# Roblox limits checked by the preflight, None disables a check
+ROBLOX_LIMITS = {
+    "max_part_triangles": 20000,
+    "max_texture_size": 1024,
+    "max_bone_influences": blender_weight_tools.ROBLOX_MAX_BONE_INFLUENCES,
+    "max_part_bones": None,
+}
+
+# Roblox avatar triangle budgets per body region, exceeding them is a warning
+ROBLOX_BODY_TRIANGLE_BUDGETS = {
+    "Head": (["Head"], 4000),
+    "Torso": (["UpperTorso", "LowerTorso"], 1750),
+    "LeftArm": (["LeftUpperArm", "LeftLowerArm", "LeftHand"], 1248),
+    "RightArm": (["RightUpperArm", "RightLowerArm", "RightHand"], 1248),
+    "LeftLeg": (["LeftUpperLeg", "LeftLowerLeg", "LeftFoot"], 1248),
+    "RightLeg": (["RightUpperLeg", "RightLowerLeg", "RightFoot"], 1248),
+}
+
+# decimation ratios come from the scene role rules used by add_decimate_modifier() and separate_by_materials()
+DEFAULT_DECIMATION_RATIO = blender_scene_tools.DEFAULT_DECIMATION_RATIO
+
+
+def get_decimation_ratio(material_name):
+    return blender_scene_tools.get_decimation_ratio(material_name)
+
+def build_bone_part_table(armature_obj, bone_mapping):
+    # returns {bone_name: R15 body part name or None} for every bone in the armature
+    part_table = {}
+    for bone in armature_obj.data.bones:
+        current = bone
+        while current is not None and bone_mapping.get(current.name, current.name) not in blender_weight_tools.R15_BODY_BONE_NAMES:
+            current = current.parent
+        part_table[bone.name] = None if current is None else bone_mapping.get(current.name, current.name)
+    return part_table
+
+
+def analyze_mesh(mesh_obj, part_table):
+    # returns {part_name: {"triangles", "bones", "max_influences"}} predicted for one mesh
+    mesh = mesh_obj.data
+    num_polygons = len(mesh.polygons)
+    num_vertices = len(mesh.vertices)
+    loop_totals = np.empty(num_polygons, dtype=np.int32)
+    loop_starts = np.empty(num_polygons, dtype=np.int32)
+    material_indices = np.empty(num_polygons, dtype=np.int32)
+    loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    mesh.polygons.foreach_get("loop_start", loop_starts)
+    mesh.polygons.foreach_get("material_index", material_indices)
+    mesh.loops.foreach_get("vertex_index", loop_vertices)
+
+    # dominant R15 part per vertex from the skin weights
+    vertex_group_parts = [part_table.get(vg.name) for vg in mesh_obj.vertex_groups]
+    part_names = sorted(set(name for name in vertex_group_parts if name is not None))
+    part_lookup = dict((name, index) for index, name in enumerate(part_names))
+    is_bone_group = np.array([vg.name in part_table for vg in mesh_obj.vertex_groups] + [False], dtype=bool)
+    group_to_part = np.array([part_lookup[name] if name is not None else -1 for name in vertex_group_parts] + [-1], dtype=np.int64)
+    vertex_indices, group_indices, weights = blender_weight_tools.read_vertex_group_weights(mesh_obj)
+    vertex_parts = np.full(num_vertices, -1, dtype=np.int64)
+    influence_counts = np.bincount(vertex_indices, minlength=num_vertices)
+    if len(part_names) > 0 and len(weights) > 0:
+        part_weights = np.zeros((num_vertices, len(part_names)), dtype=np.float32)
+        weighted_parts = group_to_part[group_indices]
+        valid = weighted_parts >= 0
+        np.add.at(part_weights, (vertex_indices[valid], weighted_parts[valid]), weights[valid])
+        has_part = part_weights.max(axis=1) > 0
+        vertex_parts[has_part] = np.argmax(part_weights[has_part], axis=1)
+
+    # predicted triangles per polygon after decimation, assigned to the part of its first vertex
+    material_ratios = np.array([get_decimation_ratio(mat.name) if mat is not None else DEFAULT_DECIMATION_RATIO for mat in mesh.materials] + [DEFAULT_DECIMATION_RATIO], dtype=np.float64)
+    material_indices = np.minimum(material_indices, len(material_ratios) - 1)
+    predicted_triangles = (loop_totals - 2) * material_ratios[material_indices]
+    polygon_parts = vertex_parts[loop_vertices[loop_starts]] if num_polygons > 0 else np.empty(0, dtype=np.int64)
+
+    result = {}
+    for part_index, part_name in enumerate(part_names):
+        part_vertex_mask = vertex_parts == part_index
+        part_groups = np.unique(group_indices[part_vertex_mask[vertex_indices]])
+        part_groups = part_groups[is_bone_group[part_groups]]
+        result[part_name] = {
+            "triangles": float(predicted_triangles[polygon_parts == part_index].sum()),
+            "bones": len(part_groups),
+            "max_influences": int(influence_counts[part_vertex_mask].max()) if np.any(part_vertex_mask) else 0,
+        }
+    return result
+
+def analyze_textures(dtu_dict):
+    # returns list of {"path", "width", "height", "bytes", "missing"} for the DTU texture references, materials removed by the pipeline are skipped
+    compiled_rules = blender_scene_tools.compile_role_rules(blender_scene_tools.get_material_role_rules(dtu_dict.get("Asset Id")))
+    texture_paths = blender_tools.get_dtu_texture_paths(dtu_dict, lambda mat: "remove" in blender_scene_tools.classify_material_name(mat.get("Material Name", ""), compiled_rules))
+    texture_list = []
+    for texture_path in texture_paths:
+        texture_info = {"path": texture_path, "width": None, "height": None, "bytes": 0, "missing": False}
+        if not os.path.exists(texture_path):
+            texture_info["missing"] = True
+        else:
+            texture_info["bytes"] = os.path.getsize(texture_path)
+            try:
+                dimensions = blender_tools.read_image_dimensions(texture_path)
+            except Exception as e:
+                _add_to_log("ERROR: analyze_textures(): unable to read image header: " + texture_path + ", " + str(e))
+                dimensions = None
+            if dimensions is not None:
+                texture_info["width"], texture_info["height"] = int(dimensions[0]), int(dimensions[1])
+        texture_list.append(texture_info)
+    return texture_list
+
+def run_preflight(dtu_dict, bone_mapping, limits=ROBLOX_LIMITS):
+    # returns report dict, report["passed"] is False when any error was found
+    start_time = time.perf_counter()
+    report = {"passed": True, "errors": [], "warnings": [], "parts": {}, "textures": []}
+
+    armature_obj = None
+    for obj in bpy.data.objects:
+        if obj.type == 'ARMATURE':
+            armature_obj = obj
+            break
+    if armature_obj is None:
+        report["errors"].append({"check": "armature", "message": "no armature found"})
+    else:
+        part_table = build_bone_part_table(armature_obj, bone_mapping)
+        found_parts = set(part_name for part_name in part_table.values() if part_name is not None)
+        missing_parts = [part_name for part_name in blender_weight_tools.R15_BODY_BONE_NAMES if part_name not in found_parts]
+        if len(missing_parts) > 0:
+            report["errors"].append({"check": "r15_bones", "message": "R15 bones missing from armature", "bones": missing_parts})
+        for obj in bpy.data.objects:
+            if obj.type != 'MESH':
+                continue
+            for part_name, part_stats in analyze_mesh(obj, part_table).items():
+                if part_name not in report["parts"]:
+                    report["parts"][part_name] = {"triangles": 0.0, "bones": 0, "max_influences": 0}
+                part_report = report["parts"][part_name]
+                part_report["triangles"] += part_stats["triangles"]
+                part_report["bones"] = max(part_report["bones"], part_stats["bones"])
+                part_report["max_influences"] = max(part_report["max_influences"], part_stats["max_influences"])
+
+    for part_name, part_report in report["parts"].items():
+        part_report["triangles"] = int(round(part_report["triangles"]))
+        if limits["max_part_triangles"] is not None and part_report["triangles"] > limits["max_part_triangles"]:
+            report["errors"].append({"check": "part_triangles", "part": part_name, "value": part_report["triangles"], "limit": limits["max_part_triangles"]})
+        if limits["max_part_bones"] is not None and part_report["bones"] > limits["max_part_bones"]:
+            report["errors"].append({"check": "part_bones", "part": part_name, "value": part_report["bones"], "limit": limits["max_part_bones"]})
+        if limits["max_bone_influences"] is not None and part_report["max_influences"] > limits["max_bone_influences"]:
+            # capped later by the skin cleanup stage
+            report["warnings"].append({"check": "bone_influences", "part": part_name, "value": part_report["max_influences"], "limit": limits["max_bone_influences"]})
+    for budget_name, (budget_parts, budget) in ROBLOX_BODY_TRIANGLE_BUDGETS.items():
+        budget_triangles = sum(report["parts"].get(part_name, {}).get("triangles", 0) for part_name in budget_parts)
+        if budget_triangles > budget:
+            report["warnings"].append({"check": "body_triangle_budget", "part": budget_name, "value": budget_triangles, "limit": budget})
+
+    report["textures"] = analyze_textures(dtu_dict)
+    for texture_info in report["textures"]:
+        if texture_info["missing"]:
+            report["warnings"].append({"check": "missing_texture", "path": texture_info["path"]})
+        elif limits["max_texture_size"] is not None and texture_info["width"] is not None:
+            # source maps are downscaled by the texture stages, the exported images are checked by check_export_textures()
+            if max(texture_info["width"], texture_info["height"]) > limits["max_texture_size"]:
+                report["warnings"].append({"check": "source_texture_size", "path": texture_info["path"], "value": [texture_info["width"], texture_info["height"]], "limit": limits["max_texture_size"]})
+
+    report["passed"] = len(report["errors"]) == 0
+    report["elapsed_seconds"] = round(time.perf_counter() - start_time, 4)
+    _add_to_log("DEBUG: run_preflight(): passed=" + str(report["passed"]) + ", errors=" + str(len(report["errors"])) + ", warnings=" + str(len(report["warnings"])) + ", elapsed=" + str(report["elapsed_seconds"]) + " seconds")
+    return report
+
+def check_export_textures(report, limits=ROBLOX_LIMITS):
+    # texture size check on the images which will be exported, called after the images are packed
+    # adds the errors to report, returns False when any exported image is too large
+    if limits["max_texture_size"] is None:
+        return True
+    export_images = set()
+    for obj in bpy.data.objects:
+        if obj.type != 'MESH':
+            continue
+        for mat in obj.data.materials:
+            if mat is None or mat.node_tree is None:
+                continue
+            for node in mat.node_tree.nodes:
+                if node.type == 'TEX_IMAGE' and node.image is not None:
+                    export_images.add(node.image)
+    passed = True
+    for image in sorted(export_images, key=lambda image: image.name):
+        width, height = image.size[0], image.size[1]
+        if max(width, height) > limits["max_texture_size"]:
+            report["errors"].append({"check": "texture_size", "image": image.name, "value": [width, height], "limit": limits["max_texture_size"]})
+            passed = False
+    report["passed"] = report["passed"] and passed
+    _add_to_log("DEBUG: check_export_textures(): checked " + str(len(export_images)) + " exported images, passed=" + str(passed))
+    return passed
+
+def write_preflight_report(report, report_path):
+    with open(report_path, "w") as file:
+        json.dump(report, file, indent=4)
+    _add_to_log("DEBUG: write_preflight_report(): report written to: " + report_path)
@@ -0,0 +1,267 @@
+"""Blender Retarget Tools module
+
+Blender python module to retarget and bake Genesis 8/9 skeletal animation onto
+the R15 bone set. Bones are matched with the G9_R15_bone_mapping.json and
+G8_R15_bone_mapping.json tables. Pose matrices for every frame are computed in
+batched NumPy operations directly from the fcurve keyframe arrays, so the scene
+frame is never changed and the result is written back with foreach_set().
+
+Requirements:
+    - Python 3+
+    - Blender 3.6+ (uses the NumPy bundled with Blender)
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_retarget_tools.log"
+
+## Do not modify below
+import sys, os, time
+import numpy as np
+try:
+    import bpy
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+# keyframe interpolation enum value for LINEAR (CONSTANT=0, LINEAR=1, BEZIER=2)
+KEYFRAME_INTERPOLATION_LINEAR = 1
+
+
+def quaternion_to_matrix(quat):
+    # quat: (N,4) array in w,x,y,z order -> (N,3,3) rotation matrices
+    quat = quat / np.linalg.norm(quat, axis=1, keepdims=True).clip(1e-12)
+    w, x, y, z = quat[:,0], quat[:,1], quat[:,2], quat[:,3]
+    mat = np.empty((len(quat), 3, 3))
+    mat[:,0,0] = 1 - 2*(y*y + z*z)
+    mat[:,0,1] = 2*(x*y - z*w)
+    mat[:,0,2] = 2*(x*z + y*w)
+    mat[:,1,0] = 2*(x*y + z*w)
+    mat[:,1,1] = 1 - 2*(x*x + z*z)
+    mat[:,1,2] = 2*(y*z - x*w)
+    mat[:,2,0] = 2*(x*z - y*w)
+    mat[:,2,1] = 2*(y*z + x*w)
+    mat[:,2,2] = 1 - 2*(x*x + y*y)
+    return mat
+
+def axis_angle_to_matrix(axis_angle):
+    # axis_angle: (N,4) array in angle,x,y,z order (Blender rotation_axis_angle)
+    angle = axis_angle[:,0]
+    axis = axis_angle[:,1:4] / np.linalg.norm(axis_angle[:,1:4], axis=1, keepdims=True).clip(1e-12)
+    quat = np.empty((len(axis_angle), 4))
+    quat[:,0] = np.cos(angle * 0.5)
+    quat[:,1:4] = axis * np.sin(angle * 0.5)[:,None]
+    return quaternion_to_matrix(quat)
+
+def euler_to_matrix(euler, order="XYZ"):
+    # euler: (N,3) array, order uses Blender convention ("XYZ" applies X first)
+    n = len(euler)
+    axis_matrices = {}
+    for axis_index, axis_name in enumerate("XYZ"):
+        c = np.cos(euler[:,axis_index])
+        s = np.sin(euler[:,axis_index])
+        mat = np.zeros((n, 3, 3))
+        i, j = [(1, 2), (2, 0), (0, 1)][axis_index]
+        mat[:,axis_index,axis_index] = 1.0
+        mat[:,i,i] = c
+        mat[:,j,j] = c
+        mat[:,i,j] = -s
+        mat[:,j,i] = s
+        axis_matrices[axis_name] = mat
+    result = axis_matrices[order[0]]
+    for axis_name in order[1:]:
+        result = np.matmul(axis_matrices[axis_name], result)
+    return result
+
+def matrix_to_quaternion(mat):
+    # mat: (N,3,3) rotation matrices -> (N,4) quaternions in w,x,y,z order
+    m00, m01, m02 = mat[:,0,0], mat[:,0,1], mat[:,0,2]
+    m10, m11, m12 = mat[:,1,0], mat[:,1,1], mat[:,1,2]
+    m20, m21, m22 = mat[:,2,0], mat[:,2,1], mat[:,2,2]
+    trace = m00 + m11 + m22
+    # pick the numerically largest of w,x,y,z per matrix and solve the others from it
+    case = np.argmax(np.stack([trace, m00, m11, m22], axis=1), axis=1)
+    quat = np.empty((len(mat), 4))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = np.sqrt(np.maximum(1.0 + trace, 1e-12)) * 2
+        candidate = np.stack([0.25 * s, (m21 - m12) / s, (m02 - m20) / s, (m10 - m01) / s], axis=1)
+        quat[case == 0] = candidate[case == 0]
+        s = np.sqrt(np.maximum(1.0 + m00 - m11 - m22, 1e-12)) * 2
+        candidate = np.stack([(m21 - m12) / s, 0.25 * s, (m01 + m10) / s, (m02 + m20) / s], axis=1)
+        quat[case == 1] = candidate[case == 1]
+        s = np.sqrt(np.maximum(1.0 + m11 - m00 - m22, 1e-12)) * 2
+        candidate = np.stack([(m02 - m20) / s, (m01 + m10) / s, 0.25 * s, (m12 + m21) / s], axis=1)
+        quat[case == 2] = candidate[case == 2]
+        s = np.sqrt(np.maximum(1.0 + m22 - m00 - m11, 1e-12)) * 2
+        candidate = np.stack([(m10 - m01) / s, (m02 + m20) / s, (m12 + m21) / s, 0.25 * s], axis=1)
+        quat[case == 3] = candidate[case == 3]
+    quat /= np.linalg.norm(quat, axis=1, keepdims=True).clip(1e-12)
+    return quat
+
+def make_quaternions_continuous(quat):
+    # flip signs so that consecutive keys never take the long way around
+    dots = np.einsum("ij,ij->i", quat[1:], quat[:-1])
+    signs = np.concatenate([[1.0], np.cumprod(np.where(dots < 0, -1.0, 1.0))])
+    return quat * signs[:,None]
+
+def compose_matrices(location, rotation, scale):
+    # location (N,3), rotation (N,3,3), scale (N,3) -> (N,4,4) = T @ R @ S
+    mat = np.zeros((len(location), 4, 4))
+    mat[:,:3,:3] = rotation * scale[:,None,:]
+    mat[:,:3,3] = location
+    mat[:,3,3] = 1.0
+    return mat
+
+def decompose_matrices(mat):
+    # (N,4,4) -> location (N,3), quaternion (N,4), scale (N,3)
+    location = mat[:,:3,3].copy()
+    scale = np.linalg.norm(mat[:,:3,:3], axis=1)
+    rotation = mat[:,:3,:3] / scale[:,None,:].clip(1e-12)
+    return location, matrix_to_quaternion(rotation), scale
+
+
+def sample_fcurve(fcurve, frames):
+    # value of the fcurve at the requested frames, honoring key interpolation, handles, extrapolation and modifiers
+    num_keys = len(fcurve.keyframe_points)
+    is_linear = all(keyframe.interpolation == 'LINEAR' for keyframe in fcurve.keyframe_points[:-1])
+    if is_linear and len(fcurve.modifiers) == 0 and fcurve.extrapolation == 'CONSTANT':
+        # plain linear curves: bulk read keyframe coordinates and interpolate in one pass
+        co = np.empty(num_keys * 2, dtype=np.float32)
+        fcurve.keyframe_points.foreach_get("co", co)
+        return np.interp(frames, co[0::2], co[1::2])
+    return np.array([fcurve.evaluate(frame) for frame in frames])
+
+def sample_channel(fcurve_table, data_path, frames, default_value):
+    # returns (F, len(default_value)) array, filling missing array indices with the default
+    values = np.empty((len(frames), len(default_value)))
+    for index, default in enumerate(default_value):
+        fcurve = fcurve_table.get((data_path, index))
+        if fcurve is not None and len(fcurve.keyframe_points) > 0:
+            values[:,index] = sample_fcurve(fcurve, frames)
+        else:
+            values[:,index] = default
+    return values
+
+def compute_pose_basis_matrices(pose_bone, fcurve_table, frames):
+    # evaluate loc/rot/scale channels of one pose bone for every frame -> (F,4,4)
+    bone_path = 'pose.bones["%s"].' % pose_bone.name
+    location = sample_channel(fcurve_table, bone_path + "location", frames, pose_bone.location)
+    scale = sample_channel(fcurve_table, bone_path + "scale", frames, pose_bone.scale)
+    rotation_mode = pose_bone.rotation_mode
+    if rotation_mode == "QUATERNION":
+        quat = sample_channel(fcurve_table, bone_path + "rotation_quaternion", frames, pose_bone.rotation_quaternion)
+        rotation = quaternion_to_matrix(quat)
+    elif rotation_mode == "AXIS_ANGLE":
+        axis_angle = sample_channel(fcurve_table, bone_path + "rotation_axis_angle", frames, pose_bone.rotation_axis_angle)
+        rotation = axis_angle_to_matrix(axis_angle)
+    else:
+        euler = sample_channel(fcurve_table, bone_path + "rotation_euler", frames, pose_bone.rotation_euler)
+        rotation = euler_to_matrix(euler, rotation_mode)
+    return compose_matrices(location, rotation, scale)
+
+
+def compute_retargeted_channels(armature_obj, action, bone_mapping, frames):
+    # returns {r15_bone_name: (location, quaternion, scale)} arrays for every frame
+    fcurve_table = {}
+    for fcurve in action.fcurves:
+        fcurve_table[(fcurve.data_path, fcurve.array_index)] = fcurve
+    r15_bone_names = set(bone_mapping.values())
+
+    # armature-space pose matrices for every bone, parents before children
+    rest_matrices = {}
+    pose_matrices = {}
+    mapped_parent = {}
+    for bone in armature_obj.data.bones:
+        # data.bones is not guaranteed to be in hierarchy order, so walk from each root
+        if bone.parent is not None:
+            continue
+        bone_stack = [bone]
+        while len(bone_stack) > 0:
+            current = bone_stack.pop()
+            rest = np.array(current.matrix_local, dtype=np.float64)
+            rest_matrices[current.name] = rest
+            basis = compute_pose_basis_matrices(armature_obj.pose.bones[current.name], fcurve_table, frames)
+            parent = current.parent
+            if parent is None:
+                pose_matrices[current.name] = np.matmul(rest, basis)
+                mapped_parent[current.name] = None
+            else:
+                parent_to_child = np.linalg.inv(rest_matrices[parent.name]) @ rest
+                pose_matrices[current.name] = np.matmul(pose_matrices[parent.name], np.matmul(parent_to_child, basis))
+                # nearest ancestor which survives the R15 conversion
+                if parent.name in bone_mapping or parent.name in r15_bone_names:
+                    mapped_parent[current.name] = parent.name
+                else:
+                    mapped_parent[current.name] = mapped_parent[parent.name]
+            bone_stack.extend(current.children)
+
+    # express each surviving bone relative to its nearest surviving ancestor, which
+    # folds the motion of unmapped bones (twist, intermediate spine, etc) into R15 bones
+    retargeted_channels = {}
+    for bone_name, pose_matrix in pose_matrices.items():
+        if bone_name not in bone_mapping and bone_name not in r15_bone_names:
+            continue
+        rest = rest_matrices[bone_name]
+        parent_name = mapped_parent[bone_name]
+        if parent_name is None:
+            basis = np.matmul(np.linalg.inv(rest), pose_matrix)
+        else:
+            parent_rest = rest_matrices[parent_name]
+            relative_pose = np.matmul(np.linalg.inv(pose_matrices[parent_name]), pose_matrix)
+            basis = np.matmul(np.linalg.inv(rest) @ parent_rest, relative_pose)
+        location, quat, scale = decompose_matrices(basis)
+        retargeted_channels[bone_mapping.get(bone_name, bone_name)] = (location, make_quaternions_continuous(quat), scale)
+    return retargeted_channels
+
+
+def write_action_keyframes(action, frames, retargeted_channels):
+    # create one fcurve per channel and write all keyframes with foreach_set
+    num_frames = len(frames)
+    co = np.empty(num_frames * 2, dtype=np.float32)
+    co[0::2] = frames
+    interpolation = np.full(num_frames, KEYFRAME_INTERPOLATION_LINEAR, dtype=np.int32)
+    for bone_name, (location, quat, scale) in retargeted_channels.items():
+        bone_path = 'pose.bones["%s"].' % bone_name
+        for property_name, values in (("location", location), ("rotation_quaternion", quat), ("scale", scale)):
+            for index in range(values.shape[1]):
+                fcurve = action.fcurves.new(bone_path + property_name, index=index, action_group=bone_name)
+                fcurve.keyframe_points.add(num_frames)
+                co[1::2] = values[:,index]
+                fcurve.keyframe_points.foreach_set("co", co)
+                fcurve.keyframe_points.foreach_set("interpolation", interpolation)
+                fcurve.update()
+
+def retarget_animation_to_r15(armature_obj, bone_mapping):
+    # bake the active action of armature_obj onto R15 bones, returns the new action
+    if armature_obj.animation_data is None or armature_obj.animation_data.action is None:
+        _add_to_log("DEBUG: retarget_animation_to_r15(): no action found on " + armature_obj.name + ", skipping...")
+        return None
+    start_time = time.perf_counter()
+    source_action = armature_obj.animation_data.action
+    frame_start, frame_end = source_action.frame_range
+    frames = np.arange(int(round(frame_start)), int(round(frame_end)) + 1, dtype=np.float64)
+    _add_to_log("DEBUG: retarget_animation_to_r15(): retargeting action " + source_action.name + ", frames=" + str(len(frames)))
+
+    retargeted_channels = compute_retargeted_channels(armature_obj, source_action, bone_mapping, frames)
+
+    r15_action = bpy.data.actions.new(source_action.name + "_R15")
+    write_action_keyframes(r15_action, frames, retargeted_channels)
+    for bone_name in retargeted_channels:
+        pose_bone = armature_obj.pose.bones.get(bone_name)
+        if pose_bone is not None:
+            pose_bone.rotation_mode = "QUATERNION"
+    armature_obj.animation_data.action = r15_action
+
+    # FBX export bakes the scene frame range
+    bpy.context.scene.frame_start = int(frames[0])
+    bpy.context.scene.frame_end = int(frames[-1])
+
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: retarget_animation_to_r15(): baked " + str(len(retargeted_channels)) + " R15 bones x " + str(len(frames)) + " frames in " + str(round(elapsed_time, 3)) + " seconds")
+    return r15_action
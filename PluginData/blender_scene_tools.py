@@ -0,0 +1,176 @@
+"""Blender Scene Tools module
+
+Blender python module with a scene role index for the Roblox conversion
+stages. Every object is classified once after import from a compiled table of
+material name rules, e.g. "head", "eye", "mouth cavity" or "remove", and the
+index is updated as stages separate, join, rename or delete objects, so each
+stage looks up the objects it needs instead of rescanning bpy.data.objects and
+re-matching material names. The rule table is keyed by figure generation.
+
+Requirements:
+    - Python 3+
+    - Blender 3.6+
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_scene_tools.log"
+
+## Do not modify below
+import sys, os, re
+try:
+    import bpy
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+# material name rules per figure generation, ordered (role, regex), case-insensitive unless scoped with (?-i:...)
+# a material gets every role whose rule matches, earlier rules take priority for decimation
+GENESIS9_MATERIAL_ROLE_RULES = [
+    ("remove", r"(?-i:Tear)|moisture|eyebrows|eyelashes"),
+    ("head", r"head"),
+    ("eye", r"eye"),
+    ("teeth", r"teeth"),
+    ("mouth_cavity", r"mouth cavity"),
+    ("mouth", r"mouth(?! cavity)"),
+    ("fingernails", r"fingernails"),
+    ("arms", r"arms"),
+    ("toenails", r"toenails"),
+    ("legs", r"legs"),
+]
+MATERIAL_ROLE_RULES = {
+    "Genesis9": GENESIS9_MATERIAL_ROLE_RULES,
+    "Genesis8": GENESIS9_MATERIAL_ROLE_RULES,
+}
+DEFAULT_GENERATION = "Genesis9"
+
+# decimate ratio for each role, 0.0 marks materials which are removed
+ROLE_DECIMATION_RATIOS = {
+    "remove": 0.0,
+    "head": 0.36,
+    "eye": 0.09,
+    "teeth": 0.09,
+    "mouth_cavity": 0.068,
+    "mouth": 0.036,
+}
+DEFAULT_DECIMATION_RATIO = 0.2
+
+
+def get_material_role_rules(asset_id=None):
+    # returns the rule table for the figure generation named in the DTU "Asset Id"
+    if asset_id is not None:
+        for generation, role_rules in MATERIAL_ROLE_RULES.items():
+            if generation in asset_id:
+                return role_rules
+    return MATERIAL_ROLE_RULES[DEFAULT_GENERATION]
+
+def compile_role_rules(role_rules):
+    return [(role, re.compile(pattern, re.IGNORECASE)) for role, pattern in role_rules]
+
+def classify_material_name(material_name, compiled_rules):
+    # returns list of roles in rule order
+    return [role for role, regex in compiled_rules if regex.search(material_name)]
+
+def get_decimation_ratio(material_name, role_rules=None):
+    if role_rules is None:
+        role_rules = MATERIAL_ROLE_RULES[DEFAULT_GENERATION]
+    for role in classify_material_name(material_name, compile_role_rules(role_rules)):
+        if role in ROLE_DECIMATION_RATIOS:
+            return ROLE_DECIMATION_RATIOS[role]
+    return DEFAULT_DECIMATION_RATIO
+
+
+class SceneIndex():
+    """Object name -> (object type, material roles) index of the current scene."""
+
+    def __init__(self, role_rules=None):
+        if role_rules is None:
+            role_rules = MATERIAL_ROLE_RULES[DEFAULT_GENERATION]
+        self.compiled_rules = compile_role_rules(role_rules)
+        self.material_roles = {}
+        self.object_entries = {}
+
+    def build(self):
+        # classify every object in the scene, called once after import
+        self.object_entries = {}
+        for obj in bpy.data.objects:
+            self.add_object(obj)
+        _add_to_log("DEBUG: SceneIndex.build(): indexed " + str(len(self.object_entries)) + " objects, " + str(len(self.material_roles)) + " materials")
+        return self
+
+    def classify_material(self, material_name):
+        if material_name not in self.material_roles:
+            self.material_roles[material_name] = classify_material_name(material_name, self.compiled_rules)
+        return self.material_roles[material_name]
+
+    def add_object(self, obj):
+        # (re)classify obj, also used after its materials change
+        roles = []
+        if obj.type == 'MESH':
+            for mat in obj.data.materials:
+                if mat is None:
+                    continue
+                for role in self.classify_material(mat.name):
+                    if role not in roles:
+                        roles.append(role)
+        self.object_entries[obj.name] = (obj.type, roles)
+
+    def add_objects(self, obj_list):
+        for obj in obj_list:
+            self.add_object(obj)
+
+    def remove_objects(self, obj_name_list):
+        # call with names captured before the objects were deleted or joined away
+        for obj_name in obj_name_list:
+            self.object_entries.pop(obj_name, None)
+
+    def rename_object(self, obj, new_name):
+        old_name = obj.name
+        obj.name = new_name
+        if old_name in self.object_entries:
+            self.object_entries[obj.name] = self.object_entries.pop(old_name)
+        else:
+            self.add_object(obj)
+
+    def get_object(self, obj_name):
+        if obj_name not in self.object_entries:
+            return None
+        return bpy.data.objects.get(obj_name)
+
+    def get_roles(self, obj):
+        if obj.name not in self.object_entries:
+            self.add_object(obj)
+        return self.object_entries[obj.name][1]
+
+    def objects_of_type(self, obj_type):
+        # sorted by name, same order as bpy.data.objects
+        obj_list = []
+        for obj_name, (entry_type, roles) in sorted(self.object_entries.items()):
+            if entry_type != obj_type:
+                continue
+            obj = bpy.data.objects.get(obj_name)
+            if obj is None:
+                # deleted outside of the index
+                self.object_entries.pop(obj_name)
+                continue
+            obj_list.append(obj)
+        return obj_list
+
+    def mesh_objects(self):
+        return self.objects_of_type('MESH')
+
+    def objects_with_role(self, role):
+        return [obj for obj in self.mesh_objects() if role in self.object_entries[obj.name][1]]
+
+    def get_decimation_ratio(self, obj):
+        # ratio of the highest priority role of obj
+        for role, regex in self.compiled_rules:
+            if role in self.get_roles(obj) and role in ROLE_DECIMATION_RATIOS:
+                return ROLE_DECIMATION_RATIOS[role]
+        return DEFAULT_DECIMATION_RATIO
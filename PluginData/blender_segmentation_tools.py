@@ -0,0 +1,216 @@
+"""Blender Segmentation Tools module
+
+Blender python module with cached face -> R15 part tables for the arms, legs
+and body meshes of Genesis base figures. Those meshes keep the base figure
+topology through the material separation, so the loose part and bone influence
+separation which follows always gives the same split for the same topology and
+skin weights. The first export of a figure runs the dynamic separation with the
+original face index stored in a face attribute, and the resulting part of each
+face is saved as a .npy table in the cache folder. Later exports with the same
+topology fingerprint load the table memory-mapped and split each mesh with one
+separate operation.
+
+Requirements:
+    - Python 3+
+    - Blender 3.6+
+    - NumPy
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_segmentation_tools.log"
+
+## Do not modify below
+import sys, os, re, json, time, hashlib
+import numpy as np
+try:
+    import bpy
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+try:
+    import blender_tools
+except:
+    sys.path.append(script_dir)
+    import blender_tools
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+# bump when the dynamic separation changes, old tables are then ignored
+SEGMENTATION_TABLE_VERSION = 1
+# face attribute holding (source ordinal << SEGMENTATION_SOURCE_SHIFT) | original face index while tables are recorded
+SEGMENTATION_FACE_ATTRIBUTE = "daz_segment_face"
+SEGMENTATION_SOURCE_SHIFT = 24
+# label of faces which are not in any part after the dynamic separation
+DISCARDED_LABEL = -1
+
+
+def get_generation_name(asset_id):
+    # DTU "Asset Id" reduced to a file name part, e.g. "Genesis9"
+    generation = re.sub(r"[^A-Za-z0-9]+", "", str(asset_id))
+    if generation == "":
+        return "Unknown"
+    return generation
+
+def find_table_sources(scene_index):
+    # (source name, object) of the meshes which keep the base topology after separate_by_materials()
+    source_dict = {}
+    for obj in scene_index.mesh_objects():
+        roles = scene_index.get_roles(obj)
+        if "arms" in roles:
+            source_name = "arms"
+        elif "legs" in roles:
+            source_name = "legs"
+        elif obj.name == "Body_Geo":
+            source_name = "body"
+        else:
+            continue
+        # duplicates are left to the dynamic path
+        if source_name not in source_dict:
+            source_dict[source_name] = obj
+    return sorted(source_dict.items())
+
+def compute_topology_fingerprint(obj):
+    # hash of the inputs of the dynamic split: polygon loops, vertex group membership and vertex sides
+    mesh = obj.data
+    num_vertices = len(mesh.vertices)
+    loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vertices)
+    loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    coords = np.empty(num_vertices * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", coords)
+    membership = np.array([(vert.index, group.group) for vert in mesh.vertices for group in vert.groups], dtype=np.int32)
+
+    hasher = hashlib.sha1()
+    hasher.update(str(SEGMENTATION_TABLE_VERSION).encode("utf-8"))
+    hasher.update(np.array([num_vertices], dtype=np.int64).tobytes())
+    hasher.update(loop_vertices.tobytes())
+    hasher.update(loop_totals.tobytes())
+    hasher.update("\n".join(group.name for group in obj.vertex_groups).encode("utf-8"))
+    hasher.update(membership.tobytes())
+    # loose parts are sorted into right and left by the sign of their first vertex
+    hasher.update(np.packbits(coords[0::3] > 0).tobytes())
+    return hasher.hexdigest()
+
+def get_table_path(generation, source_name, fingerprint):
+    # path without extension, labels in ".npy" and part names in ".json"
+    return os.path.join(blender_tools.get_cache_folder("segmentation_tables"), generation + "_" + source_name + "_" + fingerprint).replace("\\","/")
+
+def load_segmentation_table(generation, source_name, fingerprint):
+    # returns (memory-mapped face labels, part names), None if no table was recorded
+    table_path = get_table_path(generation, source_name, fingerprint)
+    if not os.path.exists(table_path + ".npy") or not os.path.exists(table_path + ".json"):
+        return None
+    with open(table_path + ".json", "r") as file:
+        part_names = json.load(file)["parts"]
+    return np.load(table_path + ".npy", mmap_mode="r"), part_names
+
+def save_segmentation_table(generation, source_name, fingerprint, face_labels, part_names):
+    # labels first, the table only counts as present once the part names are written
+    table_path = get_table_path(generation, source_name, fingerprint)
+    np.save(table_path + ".tmp.npy", face_labels)
+    os.replace(table_path + ".tmp.npy", table_path + ".npy")
+    with open(table_path + ".tmp.json", "w") as file:
+        json.dump({"version": SEGMENTATION_TABLE_VERSION, "parts": part_names}, file)
+    os.replace(table_path + ".tmp.json", table_path + ".json")
+
+def split_by_table(obj, face_labels, part_names, scene_index, mode_manager):
+    # one separate operation: each part gets a temporary material slot, original material indices are restored per part
+    mesh = obj.data
+    num_faces = len(mesh.polygons)
+    material_indices = np.empty(num_faces, dtype=np.int32)
+    mesh.polygons.foreach_get("material_index", material_indices)
+    num_slots = len(mesh.materials)
+    # discarded faces go to one extra slot after the part slots
+    discard_label = len(part_names)
+    slot_labels = np.asarray(face_labels, dtype=np.int32)
+    slot_labels = np.where(slot_labels < 0, discard_label, slot_labels)
+    temp_material = bpy.data.materials.new("DazSegmentationPart")
+    for index in range(discard_label + 1):
+        mesh.materials.append(temp_material)
+    mesh.polygons.foreach_set("material_index", num_slots + slot_labels)
+    mesh.update()
+
+    before_list = set(bpy.context.scene.objects)
+    with mode_manager.edit_objects([obj]):
+        bpy.ops.mesh.separate(type='MATERIAL')
+    part_list = [obj] + [obj_temp for obj_temp in bpy.context.scene.objects if obj_temp not in before_list]
+
+    # separate keeps the face order, so the faces of a part are the faces with its label in original order
+    part_obj_dict = {}
+    for part_obj in part_list:
+        part_mesh = part_obj.data
+        if len(part_mesh.polygons) == 0:
+            continue
+        label = part_mesh.polygons[0].material_index - num_slots
+        part_mesh.polygons.foreach_set("material_index", material_indices[slot_labels == label])
+        for index in range(discard_label + 1):
+            part_mesh.materials.pop()
+        part_mesh.update()
+        part_obj_dict[label] = part_obj
+    bpy.data.materials.remove(temp_material)
+
+    discard_obj = part_obj_dict.pop(discard_label, None)
+    if discard_obj is not None:
+        mode_manager.batch_remove([discard_obj])
+    # the source object is renamed when it holds a part, dropped from the index otherwise
+    if obj not in part_obj_dict.values():
+        scene_index.remove_objects([obj.name])
+    segmented_names = []
+    for label, part_obj in sorted(part_obj_dict.items()):
+        scene_index.rename_object(part_obj, part_names[label])
+        segmented_names.append(part_obj.name)
+    return segmented_names
+
+def apply_segmentation_tables(scene_index, mode_manager, asset_id):
+    # returns (names of the parts split by tables, sources tagged for write_segmentation_tables())
+    start_time = time.perf_counter()
+    generation = get_generation_name(asset_id)
+    segmented_names = []
+    tagged_list = []
+    for source_name, obj in find_table_sources(scene_index):
+        fingerprint = compute_topology_fingerprint(obj)
+        table = load_segmentation_table(generation, source_name, fingerprint)
+        if table is not None and len(table[0]) == len(obj.data.polygons):
+            face_labels, part_names = table
+            _add_to_log("DEBUG: apply_segmentation_tables(): splitting " + obj.name + " with table " + generation + "_" + source_name + "_" + fingerprint)
+            segmented_names += split_by_table(obj, face_labels, part_names, scene_index, mode_manager)
+            continue
+        # no table yet, record which part each face ends up in on the dynamic path
+        ordinal = len(tagged_list)
+        num_faces = len(obj.data.polygons)
+        attribute = obj.data.attributes.new(name=SEGMENTATION_FACE_ATTRIBUTE, type='INT', domain='FACE')
+        attribute.data.foreach_set("value", (ordinal << SEGMENTATION_SOURCE_SHIFT) | np.arange(num_faces, dtype=np.int32))
+        tagged_list.append({"generation": generation, "source": source_name, "fingerprint": fingerprint, "faces": num_faces})
+        _add_to_log("DEBUG: apply_segmentation_tables(): no table for " + obj.name + ", recording " + generation + "_" + source_name + "_" + fingerprint)
+    _add_to_log("DEBUG: apply_segmentation_tables(): " + str(len(segmented_names)) + " parts from tables, " + str(len(tagged_list)) + " sources recorded, " + str(round(time.perf_counter() - start_time, 3)) + " seconds")
+    return segmented_names, tagged_list
+
+def write_segmentation_tables(scene_index, tagged_list):
+    # read back the face attribute of every part after the dynamic separation, then remove the attribute
+    if len(tagged_list) == 0:
+        return
+    label_list = [np.full(tagged["faces"], DISCARDED_LABEL, dtype=np.int16) for tagged in tagged_list]
+    part_name_list = [[] for tagged in tagged_list]
+    face_mask = (1 << SEGMENTATION_SOURCE_SHIFT) - 1
+    for obj in scene_index.mesh_objects():
+        attribute = obj.data.attributes.get(SEGMENTATION_FACE_ATTRIBUTE)
+        if attribute is None:
+            continue
+        values = np.empty(len(obj.data.polygons), dtype=np.int32)
+        attribute.data.foreach_get("value", values)
+        obj.data.attributes.remove(attribute)
+        ordinals = values >> SEGMENTATION_SOURCE_SHIFT
+        for ordinal in np.unique(ordinals):
+            part_name_list[ordinal].append(obj.name)
+            label_list[ordinal][values[ordinals == ordinal] & face_mask] = len(part_name_list[ordinal]) - 1
+    for tagged, face_labels, part_names in zip(tagged_list, label_list, part_name_list):
+        save_segmentation_table(tagged["generation"], tagged["source"], tagged["fingerprint"], face_labels, part_names)
+        _add_to_log("DEBUG: write_segmentation_tables(): " + tagged["source"] + ": " + str(len(part_names)) + " parts " + str(part_names) + ", "
+                    + str(int(np.count_nonzero(face_labels == DISCARDED_LABEL))) + " faces discarded")
@@ -0,0 +1,122 @@
+"""Blender Shape Key Tools module
+
+Blender python module to prune and compress the shape keys of the separated
+Roblox parts. Key coordinates are bulk-read with foreach_get() and compared to
+their relative key in NumPy: keys with no delta above the tolerance are
+deleted, and sub-threshold per-vertex noise is snapped back to the basis so the
+FBX exporter, which only writes moved vertices, stores a sparser key.
+
+Requirements:
+    - Python 3+
+    - Blender 3.6+ (uses the NumPy bundled with Blender)
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_shape_key_tools.log"
+
+## Do not modify below
+import sys, os, json, time
+import numpy as np
+try:
+    import bpy
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+# keys whose largest vertex offset is below this are deleted, in scene units
+SHAPE_KEY_TOLERANCE = 1e-4
+# per-vertex offsets below this are snapped to the relative key
+SHAPE_KEY_NOISE_THRESHOLD = 1e-5
+# storage estimates: dense float32 xyz per vertex in the .blend,
+# index plus double precision vertex and normal deltas per moved vertex in the FBX
+DENSE_BYTES_PER_VERTEX = 12
+SPARSE_BYTES_PER_VERTEX = 52
+
+
+def read_shape_key_coords(key_block, num_vertices):
+    coords = np.empty(num_vertices * 3, dtype=np.float32)
+    key_block.data.foreach_get("co", coords)
+    return coords.reshape(-1, 3)
+
+def compute_shape_key_offsets(mesh_obj):
+    # returns {key_name: (N,) per-vertex offset length against the relative key}, and the coords of each key
+    key_blocks = mesh_obj.data.shape_keys.key_blocks
+    num_vertices = len(mesh_obj.data.vertices)
+    key_coords = dict((key_block.name, read_shape_key_coords(key_block, num_vertices)) for key_block in key_blocks)
+    reference_name = mesh_obj.data.shape_keys.reference_key.name
+    key_offsets = {}
+    for key_block in key_blocks:
+        if key_block.name == reference_name:
+            continue
+        relative_name = key_block.relative_key.name
+        key_offsets[key_block.name] = np.linalg.norm(key_coords[key_block.name] - key_coords[relative_name], axis=1)
+    return key_offsets, key_coords
+
+def prune_mesh_shape_keys(mesh_obj, tolerance=SHAPE_KEY_TOLERANCE, noise_threshold=SHAPE_KEY_NOISE_THRESHOLD):
+    # delete flat keys and snap noise on mesh_obj, returns report dict for the part
+    report = {"keys_before": 0, "keys_removed": 0, "vertices_snapped": 0, "dense_bytes_saved": 0, "sparse_bytes_saved": 0}
+    if mesh_obj.data.shape_keys is None:
+        return report
+    key_blocks = mesh_obj.data.shape_keys.key_blocks
+    num_vertices = len(mesh_obj.data.vertices)
+    report["keys_before"] = len(key_blocks) - 1
+    key_offsets, key_coords = compute_shape_key_offsets(mesh_obj)
+
+    remove_list = []
+    for key_block in key_blocks:
+        if key_block.name not in key_offsets:
+            continue
+        offsets = key_offsets[key_block.name]
+        if offsets.max(initial=0.0) < tolerance:
+            remove_list.append(key_block.name)
+            report["dense_bytes_saved"] += num_vertices * DENSE_BYTES_PER_VERTEX
+            report["sparse_bytes_saved"] += int(np.count_nonzero(offsets)) * SPARSE_BYTES_PER_VERTEX
+            continue
+        noise = (offsets > 0.0) & (offsets < noise_threshold)
+        num_noise = int(np.count_nonzero(noise))
+        if num_noise > 0:
+            coords = key_coords[key_block.name]
+            coords[noise] = key_coords[key_block.relative_key.name][noise]
+            key_block.data.foreach_set("co", coords.ravel())
+            report["vertices_snapped"] += num_noise
+            report["sparse_bytes_saved"] += num_noise * SPARSE_BYTES_PER_VERTEX
+
+    for key_name in remove_list:
+        mesh_obj.shape_key_remove(key_blocks[key_name])
+    report["keys_removed"] = len(remove_list)
+    # only the basis is left, drop the shape key block entirely
+    if mesh_obj.data.shape_keys is not None and len(mesh_obj.data.shape_keys.key_blocks) == 1:
+        mesh_obj.shape_key_clear()
+        report["dense_bytes_saved"] += num_vertices * DENSE_BYTES_PER_VERTEX
+    return report
+
+def prune_shape_keys(mesh_obj_list=None, tolerance=SHAPE_KEY_TOLERANCE, noise_threshold=SHAPE_KEY_NOISE_THRESHOLD):
+    # prune every mesh with shape keys, returns {part_name: report}
+    start_time = time.perf_counter()
+    if mesh_obj_list is None:
+        mesh_obj_list = [obj for obj in bpy.data.objects if obj.type == 'MESH' and obj.data.shape_keys is not None]
+    shape_key_report = {}
+    total_removed = 0
+    total_bytes_saved = 0
+    for obj in mesh_obj_list:
+        report = prune_mesh_shape_keys(obj, tolerance, noise_threshold)
+        shape_key_report[obj.name] = report
+        total_removed += report["keys_removed"]
+        total_bytes_saved += report["dense_bytes_saved"]
+        if report["keys_before"] > 0:
+            _add_to_log("DEBUG: prune_shape_keys(): " + obj.name + ": removed " + str(report["keys_removed"]) + " of " + str(report["keys_before"]) + " keys, saved " + str(report["dense_bytes_saved"]) + " bytes")
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: prune_shape_keys(): removed " + str(total_removed) + " shape keys, saved " + str(total_bytes_saved) + " bytes in " + str(round(elapsed_time, 3)) + " seconds")
+    return shape_key_report
+
+def write_shape_key_report(shape_key_report, report_path):
+    with open(report_path, "w") as file:
+        json.dump(shape_key_report, file, indent=2)
+    _add_to_log("DEBUG: write_shape_key_report(): wrote shape key report: " + report_path)
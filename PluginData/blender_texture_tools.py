@@ -0,0 +1,686 @@
+"""Blender Texture Tools module
+
+Blender python module for CPU texture processing with NumPy, used in place of
+the Daz Studio texture converter scripts. Images are decoded and saved through
+bpy.data.images, all per-pixel work is done on NumPy arrays so it runs on
+farm nodes without a GPU.
+
+UV-space re-baking: every triangle is rasterized in the target UV layout, each
+covered pixel is mapped back through barycentric coordinates to the source UV
+and bilinearly sampled from the source texture. Triangles are bucketed by
+bounding box size so each bucket is rasterized as one broadcast operation, and
+the triangle list is split across a thread pool (NumPy releases the GIL).
+
+Compositing: replaces combine_texture_parts.dsa and apply_modesty_overlay.dsa.
+Parts are composited with premultiplied alpha "over" and resized as array
+operations, the diffuse/normal/specular sets run in parallel, and the modesty
+overlay PNGs are decoded once into a memory-mapped cache.
+
+Normal strength: the Normal Map node strength is not exported to Roblox, so it
+is baked into the tangent-space pixels and the node is reset to 1.0.
+
+Roblox PBR output: metallic and roughness inputs are resampled to a common
+resolution and written as the grayscale MetalnessMap/RoughnessMap pair used by
+SurfaceAppearance, scalar values become small constant maps, and a texture
+manifest is written next to the exported fbx.
+
+Requirements:
+    - Python 3+
+    - Blender 3.6+ (uses the NumPy bundled with Blender)
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_texture_tools.log"
+
+## Do not modify below
+import sys, os, json, time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import bpy
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+try:
+    import blender_tools
+except:
+    sys.path.append(script_dir)
+    import blender_tools
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+# Daz map name -> Principled BSDF input, same map names as combine_texture_parts.dsa
+TEXTURE_MAP_INPUTS = {
+    "Diffuse Color": "Base Color",
+    "Normal Map": "Normal",
+    "Specular Lobe 1 Roughness": "Roughness",
+    "Dual Lobe Specular Weight": "Specular",
+}
+
+# maximum number of candidate pixels evaluated in one broadcast operation
+RASTER_BATCH_PIXELS = 4000000
+
+# combined texture sets, same output names and part order as combine_texture_parts.dsa
+# detail normals come first so they are overwritten by the main normal map
+COMBINED_TEXTURE_SETS = {
+    "diffuse": ["Diffuse Color"],
+    "normal": ["Detail Normal Map", "Normal Map"],
+    "specular": ["Specular Lobe 1 Roughness", "Dual Lobe Specular Weight"],
+}
+COMBINED_TEXTURE_SIZE = 1024
+# edge padding in pixels, grown once on each combined texture so padding never covers another part
+COMBINED_TEXTURE_PADDING = 8
+
+# Principled BSDF input -> modesty overlay image, same layers as apply_modesty_overlay.dsa
+MODESTY_OVERLAY_INPUTS = {
+    "Base Color": "genesis9_torso_modesty_overlay_d.png",
+    "Subsurface Color": "genesis9_torso_modesty_overlay_d.png",
+    "Normal": "genesis9_torso_modesty_overlay_nm.png",
+    "Roughness": "genesis9_torso_modesty_overlay_r.png",
+    "Specular": "genesis9_torso_modesty_overlay_r.png",
+}
+MODESTY_OVERLAY_DIFFUSE_M = "genesis9_torso_modesty_overlay_d_M.png"
+MODESTY_OVERLAY_SIZE = 4096
+MODESTY_OVERLAY_MATERIALS = ["Body"]
+
+# decoded overlay images, {(image_path, width, height): premultiplied float32 pixels}
+_overlay_pixel_cache = {}
+
+# Roblox SurfaceAppearance limits, constant maps are written at a tiny size
+ROBLOX_PBR_TEXTURE_SIZE = 1024
+CONSTANT_MAP_SIZE = 4
+
+# baked normal maps, {(source_path, strength): baked_path}
+_normal_strength_cache = {}
+
+
+## Image I/O
+def load_image_pixels(image_path):
+    # returns (height, width, 4) float32 RGBA array, row 0 is the bottom of the image
+    image = bpy.data.images.load(image_path, check_existing=True)
+    return get_image_pixels(image)
+
+def get_image_pixels(image):
+    width, height = image.size
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    return pixels.reshape(height, width, 4)
+
+def save_image_pixels(pixels, image_path, non_color=False):
+    # save (height, width, 4) float RGBA array as PNG, returns the bpy image
+    height, width = pixels.shape[:2]
+    image_name = os.path.basename(image_path)
+    image = bpy.data.images.get(image_name)
+    if image is not None and tuple(image.size) != (width, height):
+        bpy.data.images.remove(image)
+        image = None
+    if image is None:
+        image = bpy.data.images.new(image_name, width=width, height=height, alpha=True)
+    if non_color:
+        image.colorspace_settings.name = "Non-Color"
+    image.pixels.foreach_set(np.ascontiguousarray(pixels, dtype=np.float32).ravel())
+    image.filepath_raw = image_path
+    image.file_format = "PNG"
+    image.save()
+    return image
+
+def find_material_texture_node(mat, input_name):
+    # returns the image texture node feeding the given Principled BSDF input, looking through Normal Map nodes
+    if mat is None or mat.node_tree is None:
+        return None
+    for node in mat.node_tree.nodes:
+        if node.bl_idname != "ShaderNodeBsdfPrincipled" or input_name not in node.inputs:
+            continue
+        for link in node.inputs[input_name].links:
+            from_node = link.from_node
+            if from_node.bl_idname == "ShaderNodeNormalMap":
+                color_links = from_node.inputs["Color"].links
+                if len(color_links) == 0:
+                    continue
+                from_node = color_links[0].from_node
+            if from_node.bl_idname == "ShaderNodeTexImage" and from_node.image is not None:
+                return from_node
+    return None
+
+def find_material_texture_image(mat, input_name):
+    # returns the image feeding the given Principled BSDF input
+    texture_node = find_material_texture_node(mat, input_name)
+    if texture_node is None:
+        return None
+    return texture_node.image
+
+
+## Pixel operations
+def sample_bilinear(image_pixels, uv):
+    # sample (H,W,C) image at (N,2) uv coordinates, wrapping so UDIM tile offsets are ignored
+    height, width = image_pixels.shape[:2]
+    x = np.mod(uv[:,0], 1.0) * width - 0.5
+    y = np.mod(uv[:,1], 1.0) * height - 0.5
+    x0 = np.floor(x)
+    y0 = np.floor(y)
+    fx = (x - x0)[:,None]
+    fy = (y - y0)[:,None]
+    x0 = x0.astype(np.int64) % width
+    y0 = y0.astype(np.int64) % height
+    x1 = (x0 + 1) % width
+    y1 = (y0 + 1) % height
+    top = image_pixels[y0, x0] * (1 - fx) + image_pixels[y0, x1] * fx
+    bottom = image_pixels[y1, x0] * (1 - fx) + image_pixels[y1, x1] * fx
+    return top * (1 - fy) + bottom * fy
+
+def dilate_pixels(pixels, mask, iterations):
+    # edge padding: grow filled pixels into empty neighbors by averaging, in place
+    height, width = mask.shape
+    neighbor_offsets = ((-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+    for iteration in range(iterations):
+        # count filled neighbors on the cheap boolean mask, then only touch the border pixels
+        padded_mask = np.pad(mask, 1)
+        count = np.zeros((height, width), dtype=np.uint8)
+        for dy, dx in neighbor_offsets:
+            count += padded_mask[1 + dy:1 + dy + height, 1 + dx:1 + dx + width]
+        fill_y, fill_x = np.nonzero((~mask) & (count > 0))
+        if len(fill_y) == 0:
+            break
+        color_sum = np.zeros((len(fill_y), pixels.shape[2]), dtype=np.float32)
+        for dy, dx in neighbor_offsets:
+            neighbor_y = fill_y + dy
+            neighbor_x = fill_x + dx
+            in_bounds = (neighbor_y >= 0) & (neighbor_y < height) & (neighbor_x >= 0) & (neighbor_x < width)
+            neighbor_y = neighbor_y.clip(0, height - 1)
+            neighbor_x = neighbor_x.clip(0, width - 1)
+            weight = (in_bounds & mask[neighbor_y, neighbor_x]).astype(np.float32)
+            color_sum += pixels[neighbor_y, neighbor_x] * weight[:, None]
+        pixels[fill_y, fill_x] = color_sum / count[fill_y, fill_x, None]
+        mask[fill_y, fill_x] = True
+    return pixels, mask
+
+
+## Rasterization
+def triangulate_polygons(loop_starts, loop_totals):
+    # fan triangulation, returns (T,3) loop indices and (T,) polygon indices
+    triangle_counts = np.maximum(loop_totals - 2, 0)
+    num_triangles = int(triangle_counts.sum())
+    polygon_indices = np.repeat(np.arange(len(loop_starts)), triangle_counts)
+    first_triangle = np.cumsum(triangle_counts) - triangle_counts
+    fan_index = np.arange(num_triangles) - np.repeat(first_triangle, triangle_counts)
+    start = loop_starts[polygon_indices].astype(np.int64)
+    triangles = np.stack([start, start + fan_index + 1, start + fan_index + 2], axis=1)
+    return triangles, polygon_indices
+
+def rasterize_triangles(triangle_xy, width, height):
+    # generator of (triangle_indices, pixel_x, pixel_y, barycentric) for pixel centers inside triangles
+    # triangle_xy: (T,3,2) triangle corners in pixel units
+    x = triangle_xy[:,:,0]
+    y = triangle_xy[:,:,1]
+    x_min = np.clip(np.floor(x.min(axis=1) - 0.5), 0, width - 1).astype(np.int64)
+    x_max = np.clip(np.ceil(x.max(axis=1) - 0.5), 0, width - 1).astype(np.int64)
+    y_min = np.clip(np.floor(y.min(axis=1) - 0.5), 0, height - 1).astype(np.int64)
+    y_max = np.clip(np.ceil(y.max(axis=1) - 0.5), 0, height - 1).astype(np.int64)
+    denominator = (y[:,1] - y[:,2]) * (x[:,0] - x[:,2]) + (x[:,2] - x[:,1]) * (y[:,0] - y[:,2])
+    valid = np.abs(denominator) > 1e-12
+    # bucket by power-of-two bounding box size so every bucket is one dense broadcast
+    box_size = np.maximum(x_max - x_min, y_max - y_min) + 1
+    bucket_size = 2 ** np.ceil(np.log2(box_size)).astype(np.int64)
+    for size in np.unique(bucket_size[valid]):
+        bucket = np.flatnonzero(valid & (bucket_size == size))
+        offsets = np.arange(size * size)
+        offset_x = offsets % size
+        offset_y = offsets // size
+        chunk_length = max(1, RASTER_BATCH_PIXELS // int(size * size))
+        for chunk_start in range(0, len(bucket), chunk_length):
+            tri = bucket[chunk_start:chunk_start + chunk_length]
+            px = x_min[tri,None] + offset_x[None,:]
+            py = y_min[tri,None] + offset_y[None,:]
+            cx = px + 0.5
+            cy = py + 0.5
+            x0, x1, x2 = x[tri,0,None], x[tri,1,None], x[tri,2,None]
+            y0, y1, y2 = y[tri,0,None], y[tri,1,None], y[tri,2,None]
+            d = denominator[tri,None]
+            l0 = ((y1 - y2) * (cx - x2) + (x2 - x1) * (cy - y2)) / d
+            l1 = ((y2 - y0) * (cx - x2) + (x0 - x2) * (cy - y2)) / d
+            l2 = 1.0 - l0 - l1
+            eps = -1e-6
+            inside = (l0 >= eps) & (l1 >= eps) & (l2 >= eps) & (px <= x_max[tri,None]) & (py <= y_max[tri,None])
+            rows, cols = np.nonzero(inside)
+            if len(rows) == 0:
+                continue
+            barycentric = np.stack([l0[rows, cols], l1[rows, cols], l2[rows, cols]], axis=1)
+            yield tri[rows], px[rows, cols], py[rows, cols], barycentric
+
+def compute_normal_rotations(source_uv, target_uv):
+    # per triangle 2x2 rotation (or reflection) taking source tangent space xy to target tangent space xy
+    source_edges = np.stack([source_uv[:,1] - source_uv[:,0], source_uv[:,2] - source_uv[:,0]], axis=2)
+    target_edges = np.stack([target_uv[:,1] - target_uv[:,0], target_uv[:,2] - target_uv[:,0]], axis=2)
+    rotations = np.tile(np.eye(2), (len(source_uv), 1, 1))
+    valid = (np.abs(np.linalg.det(source_edges)) > 1e-12) & (np.abs(np.linalg.det(target_edges)) > 1e-12)
+    if np.any(valid):
+        # d(target uv)/d(source uv), keep only its orthogonal part
+        jacobian = np.matmul(target_edges[valid], np.linalg.inv(source_edges[valid]))
+        u, s, vt = np.linalg.svd(jacobian)
+        rotations[valid] = np.matmul(u, vt)
+    return rotations
+
+def bake_triangles(output_pixels, output_mask, source_pixels, triangle_indices, source_uv, target_uv, normal_rotations=None):
+    # rasterize the given triangles into output_pixels (H,W,4), sampling source_pixels through source_uv
+    height, width = output_mask.shape
+    triangle_xy = target_uv[triangle_indices] * np.array([width, height], dtype=np.float64)
+    for local_tri, px, py, barycentric in rasterize_triangles(triangle_xy, width, height):
+        tri = triangle_indices[local_tri]
+        uv = np.einsum("ij,ijk->ik", barycentric, source_uv[tri])
+        color = sample_bilinear(source_pixels, uv)
+        if normal_rotations is not None:
+            # rotate tangent space xy so islands rotated or mirrored in the new layout stay correct
+            normal = color[:,:3] * 2.0 - 1.0
+            normal[:,:2] = np.einsum("ijk,ik->ij", normal_rotations[tri], normal[:,:2])
+            normal /= np.linalg.norm(normal, axis=1, keepdims=True).clip(1e-6)
+            color[:,:3] = normal * 0.5 + 0.5
+        output_pixels[py, px] = color
+        output_mask[py, px] = True
+
+def rebake_texture(source_pixels, source_uv, target_uv, triangle_indices, resolution=1024, padding=8, is_normal_map=False, num_threads=None):
+    # returns (resolution, resolution, 4) array and coverage mask of source texture baked into target uv space
+    # padding only bleeds color, alpha stays 0 outside the baked triangles so the result composites by its coverage
+    output_pixels = np.zeros((resolution, resolution, 4), dtype=np.float32)
+    output_mask = np.zeros((resolution, resolution), dtype=bool)
+    normal_rotations = compute_normal_rotations(source_uv, target_uv) if is_normal_map else None
+    if num_threads is None:
+        num_threads = os.cpu_count() or 1
+    chunks = [chunk for chunk in np.array_split(triangle_indices, num_threads) if len(chunk) > 0]
+    with ThreadPoolExecutor(max_workers=max(1, len(chunks))) as executor:
+        futures = [executor.submit(bake_triangles, output_pixels, output_mask, source_pixels, chunk, source_uv, target_uv, normal_rotations) for chunk in chunks]
+        for future in futures:
+            future.result()
+    if padding > 0:
+        dilate_pixels(output_pixels, output_mask.copy(), padding)
+        output_pixels[~output_mask, 3] = 0.0
+    return output_pixels, output_mask
+
+
+## Mesh level re-bake
+def read_mesh_triangle_uvs(mesh_obj, source_uv_name, target_uv_name):
+    # returns (T,3,2) source uvs, (T,3,2) target uvs and (T,) material index per triangle
+    mesh = mesh_obj.data
+    num_polygons = len(mesh.polygons)
+    num_loops = len(mesh.loops)
+    loop_starts = np.empty(num_polygons, dtype=np.int32)
+    loop_totals = np.empty(num_polygons, dtype=np.int32)
+    material_indices = np.empty(num_polygons, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_start", loop_starts)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    mesh.polygons.foreach_get("material_index", material_indices)
+    source_loop_uv = np.empty(num_loops * 2, dtype=np.float32)
+    target_loop_uv = np.empty(num_loops * 2, dtype=np.float32)
+    mesh.uv_layers[source_uv_name].data.foreach_get("uv", source_loop_uv)
+    mesh.uv_layers[target_uv_name].data.foreach_get("uv", target_loop_uv)
+    triangles, polygon_indices = triangulate_polygons(loop_starts, loop_totals)
+    source_uv = source_loop_uv.reshape(-1, 2).astype(np.float64)[triangles]
+    target_uv = target_loop_uv.reshape(-1, 2).astype(np.float64)[triangles]
+    return source_uv, target_uv, material_indices[polygon_indices]
+
+def rebake_mesh_textures(mesh_obj, source_uv_name, target_uv_name, output_folder, map_name_list=None, resolution=1024, padding=0, num_threads=None):
+    # re-bake every material texture of mesh_obj into the target uv layout, unpadded since combine_texture_parts() pads the combined image
+    # returns {map_name: [(material_name, image_path), ...]} of written part textures
+    start_time = time.perf_counter()
+    if map_name_list is None:
+        map_name_list = list(TEXTURE_MAP_INPUTS.keys())
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    source_uv, target_uv, triangle_materials = read_mesh_triangle_uvs(mesh_obj, source_uv_name, target_uv_name)
+    baked_parts = dict((map_name, []) for map_name in map_name_list)
+    for material_index, mat in enumerate(mesh_obj.data.materials):
+        triangle_indices = np.flatnonzero(triangle_materials == material_index)
+        if mat is None or len(triangle_indices) == 0:
+            continue
+        for map_name in map_name_list:
+            source_image = find_material_texture_image(mat, TEXTURE_MAP_INPUTS[map_name])
+            if source_image is None:
+                continue
+            source_pixels = get_image_pixels(source_image)
+            is_normal_map = map_name == "Normal Map"
+            baked_pixels, baked_mask = rebake_texture(source_pixels, source_uv, target_uv, triangle_indices, resolution, padding, is_normal_map, num_threads)
+            image_path = os.path.join(output_folder, mat.name + " " + map_name + ".png").replace("\\","/")
+            save_image_pixels(baked_pixels, image_path, non_color=(map_name != "Diffuse Color"))
+            baked_parts[map_name].append((mat.name, image_path))
+            _add_to_log("DEBUG: rebake_mesh_textures(): baked " + mat.name + " " + map_name + " (" + str(len(triangle_indices)) + " triangles)")
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: rebake_mesh_textures(): " + mesh_obj.name + " completed in " + str(round(elapsed_time, 3)) + " seconds")
+    return baked_parts
+
+
+## Compositing
+def premultiply_alpha(pixels):
+    result = pixels.astype(np.float32, copy=True)
+    result[...,:3] *= result[...,3:4]
+    return result
+
+def unpremultiply_alpha(pixels):
+    result = pixels.astype(np.float32, copy=True)
+    alpha = result[...,3:4]
+    np.divide(result[...,:3], alpha, out=result[...,:3], where=alpha > 1e-6)
+    return result
+
+def composite_over(top_premultiplied, bottom_premultiplied, out=None):
+    # Porter-Duff "over" on premultiplied (H,W,4) arrays, same as Qt compositeOver
+    if out is None:
+        out = np.empty_like(bottom_premultiplied)
+    np.multiply(bottom_premultiplied, 1.0 - top_premultiplied[...,3:4], out=out)
+    out += top_premultiplied
+    return out
+
+def resize_pixels(pixels, width, height):
+    # smooth resize of (H,W,C) array, box filter for integer downscales, otherwise bilinear
+    source_height, source_width = pixels.shape[:2]
+    if (source_width, source_height) == (width, height):
+        return pixels
+    if source_width % width == 0 and source_height % height == 0:
+        factor_x = source_width // width
+        factor_y = source_height // height
+        return pixels.reshape(height, factor_y, width, factor_x, -1).mean(axis=(1, 3), dtype=np.float32)
+    x = (np.arange(width) + 0.5) * (source_width / width) - 0.5
+    y = (np.arange(height) + 0.5) * (source_height / height) - 0.5
+    x0 = np.floor(x).astype(np.int64).clip(0, source_width - 1)
+    y0 = np.floor(y).astype(np.int64).clip(0, source_height - 1)
+    x1 = (x0 + 1).clip(0, source_width - 1)
+    y1 = (y0 + 1).clip(0, source_height - 1)
+    fx = (x - np.floor(x)).clip(0, 1).astype(np.float32)[None,:,None]
+    fy = (y - np.floor(y)).clip(0, 1).astype(np.float32)[:,None,None]
+    rows = pixels[y0] * (1 - fy) + pixels[y1] * fy
+    return rows[:,x0] * (1 - fx) + rows[:,x1] * fx
+
+def combine_images(premultiplied_part_list, width=COMBINED_TEXTURE_SIZE, height=COMBINED_TEXTURE_SIZE, padding=COMBINED_TEXTURE_PADDING):
+    # composite parts in order over a transparent canvas by their alpha coverage, then pad the union of all parts
+    # returns straight alpha (H,W,4) array
+    combined = np.zeros((height, width, 4), dtype=np.float32)
+    for part_pixels in premultiplied_part_list:
+        composite_over(resize_pixels(part_pixels, width, height), combined, out=combined)
+    combined = unpremultiply_alpha(combined)
+    if padding > 0:
+        dilate_pixels(combined, combined[...,3] > 0, padding)
+    return combined
+
+def get_texture_part_paths(texture_parts, set_name):
+    # ordered image paths of one combined set from {map_name: [(material_name, image_path), ...]}
+    path_list = []
+    for map_name in COMBINED_TEXTURE_SETS[set_name]:
+        for material_name, image_path in texture_parts.get(map_name, []):
+            path_list.append(image_path)
+    return path_list
+
+def combine_texture_parts(texture_parts, output_folder, width=COMBINED_TEXTURE_SIZE, height=COMBINED_TEXTURE_SIZE, padding=COMBINED_TEXTURE_PADDING, num_threads=None):
+    # composite each texture set into "combined <set> test.png", returns {set_name: image_path}
+    # images are decoded and saved on the main thread, bpy is not thread safe
+    start_time = time.perf_counter()
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    set_part_pixels = {}
+    for set_name in COMBINED_TEXTURE_SETS:
+        path_list = get_texture_part_paths(texture_parts, set_name)
+        if len(path_list) > 0:
+            set_part_pixels[set_name] = [premultiply_alpha(load_image_pixels(image_path)) for image_path in path_list]
+    combined_paths = {}
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        futures = dict((set_name, executor.submit(combine_images, part_list, width, height, padding)) for set_name, part_list in set_part_pixels.items())
+        for set_name, future in futures.items():
+            image_path = os.path.join(output_folder, "combined " + set_name + " test.png").replace("\\","/")
+            save_image_pixels(future.result(), image_path, non_color=(set_name != "diffuse"))
+            combined_paths[set_name] = image_path
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: combine_texture_parts(): combined " + str(len(combined_paths)) + " texture sets in " + str(round(elapsed_time, 3)) + " seconds")
+    return combined_paths
+
+def load_overlay_pixels(image_path, width, height):
+    # decode overlay once per size, the decoded image is also kept as a memory-mapped .npy across runs
+    cache_key = (image_path, width, height)
+    if cache_key in _overlay_pixel_cache:
+        return _overlay_pixel_cache[cache_key]
+    cache_folder = blender_tools.get_cache_folder("overlay_images")
+    cache_path = os.path.join(cache_folder, blender_tools.get_file_hash(image_path) + "_" + str(width) + "x" + str(height) + ".npy").replace("\\","/")
+    if os.path.exists(cache_path):
+        overlay_pixels = np.load(cache_path, mmap_mode="r")
+    else:
+        overlay_pixels = resize_pixels(premultiply_alpha(load_image_pixels(image_path)), width, height).astype(np.float32)
+        np.save(cache_path, overlay_pixels)
+    _overlay_pixel_cache[cache_key] = overlay_pixels
+    return overlay_pixels
+
+def get_modesty_overlay_path(input_name, use_male_overlay=False):
+    if use_male_overlay and input_name in ["Base Color", "Subsurface Color"]:
+        return os.path.join(script_dir, MODESTY_OVERLAY_DIFFUSE_M).replace("\\","/")
+    return os.path.join(script_dir, MODESTY_OVERLAY_INPUTS[input_name]).replace("\\","/")
+
+def overlay_image(base_pixels, overlay_premultiplied, width, height):
+    # layered texture: base layer resized to the layer size, overlay composited over it
+    layered = premultiply_alpha(resize_pixels(base_pixels, width, height))
+    composite_over(overlay_premultiplied, layered, out=layered)
+    return unpremultiply_alpha(layered)
+
+def apply_modesty_overlay(mat, output_folder, use_male_overlay=False, size=MODESTY_OVERLAY_SIZE, num_threads=None):
+    # composite the modesty overlays onto the textures of mat and re-assign the texture nodes
+    start_time = time.perf_counter()
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    layer_jobs = []
+    for input_name in MODESTY_OVERLAY_INPUTS:
+        texture_node = find_material_texture_node(mat, input_name)
+        if texture_node is None:
+            continue
+        overlay_path = get_modesty_overlay_path(input_name, use_male_overlay)
+        if not os.path.exists(overlay_path):
+            _add_to_log("ERROR: apply_modesty_overlay(): overlay image not found: " + overlay_path)
+            continue
+        layer_jobs.append((input_name, texture_node, get_image_pixels(texture_node.image), load_overlay_pixels(overlay_path, size, size)))
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        futures = [executor.submit(overlay_image, base_pixels, overlay_pixels, size, size) for input_name, texture_node, base_pixels, overlay_pixels in layer_jobs]
+        for (input_name, texture_node, base_pixels, overlay_pixels), future in zip(layer_jobs, futures):
+            image_path = os.path.join(output_folder, "Layered " + input_name + " for " + mat.name + ".png").replace("\\","/")
+            is_non_color = texture_node.image.colorspace_settings.name == "Non-Color"
+            texture_node.image = save_image_pixels(future.result(), image_path, non_color=is_non_color)
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: apply_modesty_overlay(): applied " + str(len(layer_jobs)) + " overlays to " + mat.name + " in " + str(round(elapsed_time, 3)) + " seconds")
+
+def apply_modesty_overlays(mesh_obj, output_folder, use_male_overlay=False, size=MODESTY_OVERLAY_SIZE):
+    for mat in mesh_obj.data.materials:
+        if mat is not None and mat.name in MODESTY_OVERLAY_MATERIALS:
+            apply_modesty_overlay(mat, output_folder, use_male_overlay, size)
+
+def assign_combined_textures(mesh_obj, combined_paths):
+    # point every material of mesh_obj at the combined textures, same as assign_combined_textures.dsa
+    # specular set goes to roughness when it is mapped, otherwise to specular weight
+    input_sets = [("diffuse", ["Base Color"]), ("normal", ["Normal"]), ("specular", ["Roughness", "Specular"])]
+    for mat in mesh_obj.data.materials:
+        for set_name, input_name_list in input_sets:
+            if set_name not in combined_paths:
+                continue
+            texture_node = None
+            for input_name in input_name_list:
+                texture_node = find_material_texture_node(mat, input_name)
+                if texture_node is not None:
+                    break
+            if texture_node is None:
+                continue
+            combined_image = bpy.data.images.load(combined_paths[set_name], check_existing=True)
+            if set_name != "diffuse":
+                combined_image.colorspace_settings.name = "Non-Color"
+            texture_node.image = combined_image
+
+
+## Normal map strength
+def apply_normal_strength(pixels, strength):
+    # same as the Normal Map node in tangent space: normalize(mix((0,0,1), n, strength))
+    normal = pixels[...,:3] * 2.0 - 1.0
+    normal[...,:2] *= strength
+    normal[...,2] = 1.0 + (normal[...,2] - 1.0) * strength
+    normal[...,2] = normal[...,2].clip(1e-4, None)
+    normal /= np.linalg.norm(normal, axis=-1, keepdims=True)
+    result = pixels.astype(np.float32, copy=True)
+    result[...,:3] = normal * 0.5 + 0.5
+    return result
+
+def bake_normal_strength(image_path, strength):
+    # returns path of the normal map with strength baked in, cached by source file hash and strength
+    cache_key = (image_path, round(strength, 4))
+    if cache_key in _normal_strength_cache:
+        return _normal_strength_cache[cache_key]
+    cache_folder = blender_tools.get_cache_folder("normal_maps")
+    baked_path = os.path.join(cache_folder, blender_tools.get_file_hash(image_path) + "_" + str(round(strength, 4)) + ".png").replace("\\","/")
+    if not os.path.exists(baked_path):
+        baked_pixels = apply_normal_strength(load_image_pixels(image_path), strength)
+        save_image_pixels(baked_pixels, baked_path, non_color=True)
+    _normal_strength_cache[cache_key] = baked_path
+    return baked_path
+
+def bake_material_normal_strength(mat):
+    # bake the Normal Map node strength into its image, the node is kept since the fbx exporter finds normal maps through it
+    if mat is None or mat.node_tree is None:
+        return False
+    for node in mat.node_tree.nodes:
+        if node.bl_idname != "ShaderNodeNormalMap" or len(node.inputs["Color"].links) == 0:
+            continue
+        strength = node.inputs["Strength"].default_value
+        texture_node = node.inputs["Color"].links[0].from_node
+        if abs(strength - 1.0) < 1e-4 or texture_node.bl_idname != "ShaderNodeTexImage" or texture_node.image is None:
+            continue
+        source_path = bpy.path.abspath(texture_node.image.filepath)
+        if not os.path.exists(source_path):
+            _add_to_log("ERROR: bake_material_normal_strength(): normal map file does not exist: " + source_path)
+            continue
+        baked_image = bpy.data.images.load(bake_normal_strength(source_path, strength), check_existing=True)
+        baked_image.colorspace_settings.name = "Non-Color"
+        texture_node.image = baked_image
+        node.inputs["Strength"].default_value = 1.0
+        _add_to_log("DEBUG: bake_material_normal_strength(): baked strength " + str(round(strength, 4)) + " into normal map of " + mat.name)
+        return True
+    return False
+
+def bake_all_normal_strengths():
+    start_time = time.perf_counter()
+    num_baked = 0
+    for mat in bpy.data.materials:
+        if bake_material_normal_strength(mat):
+            num_baked += 1
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: bake_all_normal_strengths(): baked " + str(num_baked) + " normal maps in " + str(round(elapsed_time, 3)) + " seconds")
+
+
+## Roblox PBR output
+def get_input_channel_pixels(mat, input_name):
+    # returns (H,W) grayscale array of the texture on a Principled BSDF input times its scalar value, or the scalar value alone
+    scalar_value = 0.0
+    for node in mat.node_tree.nodes:
+        if node.bl_idname == "ShaderNodeBsdfPrincipled" and input_name in node.inputs:
+            scalar_value = float(node.inputs[input_name].default_value)
+            break
+    texture_node = find_material_texture_node(mat, input_name)
+    if texture_node is not None:
+        # process_material() keeps the DTU value on the input next to the texture, the output map carries both
+        return get_image_pixels(texture_node.image)[...,0] * scalar_value
+    return scalar_value
+
+def resample_channel(channel, size):
+    # resample texture channel, or fold a scalar into a constant map
+    if np.isscalar(channel):
+        return np.full((CONSTANT_MAP_SIZE, CONSTANT_MAP_SIZE), channel, dtype=np.float32)
+    return resize_pixels(channel[...,None], size, size)[...,0]
+
+def get_common_resolution(channel_list, max_size=ROBLOX_PBR_TEXTURE_SIZE):
+    size = 0
+    for channel in channel_list:
+        if not np.isscalar(channel):
+            size = max(size, channel.shape[0], channel.shape[1])
+    return min(size, max_size)
+
+def save_channel_map(channel, image_path):
+    pixels = np.empty(channel.shape + (4,), dtype=np.float32)
+    pixels[...,:3] = channel.clip(0, 1)[...,None]
+    pixels[...,3] = 1.0
+    return save_image_pixels(pixels, image_path, non_color=True)
+
+def link_image_to_input(mat, image, input_name):
+    # replace whatever feeds input_name with a single image texture node
+    nodes = mat.node_tree.nodes
+    links = mat.node_tree.links
+    for node in nodes:
+        if node.bl_idname != "ShaderNodeBsdfPrincipled":
+            continue
+        for link in list(node.inputs[input_name].links):
+            links.remove(link)
+        node_tex = nodes.new("ShaderNodeTexImage")
+        node_tex.image = image
+        links.new(node_tex.outputs["Color"], node.inputs[input_name])
+        return node_tex
+    return None
+
+def set_input_value(mat, input_name, value):
+    # the scalar of a linked input is baked into its map, reset it so it is not applied twice
+    for node in mat.node_tree.nodes:
+        if node.bl_idname == "ShaderNodeBsdfPrincipled" and input_name in node.inputs:
+            node.inputs[input_name].default_value = value
+
+def unlink_input(mat, input_name):
+    for node in mat.node_tree.nodes:
+        if node.bl_idname == "ShaderNodeBsdfPrincipled" and input_name in node.inputs:
+            for link in list(node.inputs[input_name].links):
+                mat.node_tree.links.remove(link)
+
+def convert_material_to_roblox_pbr(mat, output_folder, max_size=ROBLOX_PBR_TEXTURE_SIZE):
+    # write MetalnessMap/RoughnessMap for mat, re-link the material, returns its manifest entry
+    metalness = get_input_channel_pixels(mat, "Metallic")
+    roughness = get_input_channel_pixels(mat, "Roughness")
+    size = get_common_resolution([metalness, roughness], max_size)
+    manifest_entry = {}
+    color_image = find_material_texture_image(mat, "Base Color")
+    normal_image = find_material_texture_image(mat, "Normal")
+    manifest_entry["ColorMap"] = bpy.path.abspath(color_image.filepath) if color_image is not None else None
+    manifest_entry["NormalMap"] = bpy.path.abspath(normal_image.filepath) if normal_image is not None else None
+    for map_name, input_name, channel in [("MetalnessMap", "Metallic", metalness), ("RoughnessMap", "Roughness", roughness)]:
+        image_path = os.path.join(output_folder, mat.name + " " + map_name + ".png").replace("\\","/")
+        image = save_channel_map(resample_channel(channel, size), image_path)
+        link_image_to_input(mat, image, input_name)
+        set_input_value(mat, input_name, 1.0)
+        manifest_entry[map_name] = image_path
+        manifest_entry[map_name + " Constant"] = channel if np.isscalar(channel) else None
+        manifest_entry[map_name + " Resolution"] = [int(image.size[0]), int(image.size[1])]
+    # SurfaceAppearance has no specular input, so do not export the specular texture
+    unlink_input(mat, "Specular")
+    # drop the replaced texture nodes, their images then have no users and are not packed
+    blender_tools.remove_unlinked_shader_nodes(mat.name)
+    # size of the largest map written, constant maps stay CONSTANT_MAP_SIZE
+    manifest_entry["Resolution"] = max(manifest_entry["MetalnessMap Resolution"] + manifest_entry["RoughnessMap Resolution"])
+    return manifest_entry
+
+def convert_materials_to_roblox_pbr(output_folder, max_size=ROBLOX_PBR_TEXTURE_SIZE):
+    # returns {material_name: manifest_entry} for every material used by a mesh
+    start_time = time.perf_counter()
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    texture_manifest = {}
+    for obj in bpy.data.objects:
+        if obj.type != 'MESH':
+            continue
+        for mat in obj.data.materials:
+            if mat is None or mat.node_tree is None or mat.name in texture_manifest:
+                continue
+            texture_manifest[mat.name] = convert_material_to_roblox_pbr(mat, output_folder, max_size)
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: convert_materials_to_roblox_pbr(): converted " + str(len(texture_manifest)) + " materials in " + str(round(elapsed_time, 3)) + " seconds")
+    return texture_manifest
+
+def write_texture_manifest(texture_manifest, manifest_path):
+    # image paths are reduced to file names, matching the textures embedded in the fbx
+    output_dict = {}
+    for mat_name, manifest_entry in texture_manifest.items():
+        output_entry = {}
+        for key, value in manifest_entry.items():
+            if isinstance(value, str) and os.path.isabs(value):
+                value = os.path.basename(value)
+            output_entry[key] = value
+        output_dict[mat_name] = output_entry
+    with open(manifest_path, "w") as file:
+        json.dump(output_dict, file, indent=2)
+    _add_to_log("DEBUG: write_texture_manifest(): wrote texture manifest: " + manifest_path)
@@ -16,7 +16,7 @@ script_dir = str(Path( __file__ ).parent.absolute())
 logFilename = "blender_tools.log"
 
 ## Do not modify below
-import sys, json, os
+import sys, json, os, hashlib, tempfile, struct
 try:
     import bpy
     import NodeArrange
@@ -31,6 +31,59 @@ def _add_to_log(sMessage):
 
 global_image_cache = {}
 
+def get_cache_folder(cache_name):
+    # per-user folder for cached intermediate data, shared between runs
+    cache_folder = os.path.join(tempfile.gettempdir(), "DazToRoblox", "cache", cache_name).replace("\\","/")
+    if not os.path.exists(cache_folder):
+        os.makedirs(cache_folder)
+    return cache_folder
+
+def get_file_hash(file_path, block_size=1024*1024):
+    hasher = hashlib.sha1()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def read_image_dimensions(image_path):
+    # returns (width, height) from PNG, JPEG, TGA or BMP file headers, None if unknown
+    with open(image_path, "rb") as file:
+        header = file.read(32)
+        if header[:8] == b"\x89PNG\r\n\x1a\n":
+            return struct.unpack(">II", header[16:24])
+        if header[:2] == b"BM":
+            width, height = struct.unpack("<ii", header[18:26])
+            return width, abs(height)
+        if header[:2] == b"\xff\xd8":
+            # walk JPEG segments until a start-of-frame marker
+            file.seek(2)
+            while True:
+                marker = file.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    return None
+                if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+                    continue
+                segment_length = struct.unpack(">H", file.read(2))[0]
+                if marker[1] in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+                    height, width = struct.unpack(">xHH", file.read(5))
+                    return width, height
+                file.seek(segment_length - 2, 1)
+        if image_path.lower().endswith(".tga") and len(header) >= 16:
+            return struct.unpack("<HH", header[12:16])
+    return None
+
+def get_dtu_texture_paths(dtu_dict, skip_material=None):
+    # distinct texture paths of the DTU material properties in file order, materials for which skip_material(mat) is True are left out
+    texture_paths = []
+    for mat in dtu_dict.get("Materials", []):
+        if skip_material is not None and skip_material(mat):
+            continue
+        for property in mat.get("Properties", []):
+            texture_path = property.get("Texture", "")
+            if texture_path != "" and texture_path not in texture_paths:
+                texture_paths.append(texture_path)
+    return texture_paths
+
 def scalar_to_vec3(i):
     return [i, i, i]
 
@@ -284,6 +337,19 @@ def apply_tpose_for_g8_g9():
     bpy.ops.object.select_all(action="SELECT")
 
 
+def load_r15_bone_mapping(mapping_folder=None):
+    # load Genesis to R15 bone mapping tables, merged in the same order as bone_converter.dsa
+    if mapping_folder is None:
+        mapping_folder = script_dir
+    bone_mapping = {}
+    for mapping_filename in ["G9_R15_bone_mapping.json", "G8_R15_bone_mapping.json"]:
+        mapping_path = os.path.join(mapping_folder, mapping_filename).replace("\\","/")
+        if not os.path.exists(mapping_path):
+            _add_to_log("ERROR: load_r15_bone_mapping(): mapping file not found: " + mapping_path)
+            continue
+        with open(mapping_path, "r") as file:
+            bone_mapping.update(json.load(file))
+    return bone_mapping
 
 
 def process_material(mat, lowres_mode=None):
@@ -0,0 +1,134 @@
+"""Blender UV Tools module
+
+Blender python module to load Daz Studio DSF UV set assets, such as the
+"Combined Head And Body" UV set installed from DazLibraryFiles, and apply them
+directly to the imported Genesis meshes. The DSF UV arrays and the
+polygon-vertex override list are parsed into NumPy once, then cached as
+memory-mapped .npy files keyed by the DSF file hash. The per-loop UVs are
+resolved in NumPy and written as a new UV layer with one foreach_set() call.
+
+Requirements:
+    - Python 3+
+    - Blender 3.6+ (uses the NumPy bundled with Blender)
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_uv_tools.log"
+
+## Do not modify below
+import sys, os, json, gzip, time
+import numpy as np
+try:
+    import bpy
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+try:
+    import blender_tools
+except:
+    sys.path.append(script_dir)
+    import blender_tools
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+def parse_dsf_uv_set(dsf_path):
+    # parse the first uv_set_library entry of a DSF file, which may be gzip compressed
+    with open(dsf_path, "rb") as file:
+        raw_data = file.read()
+    if raw_data[:2] == b"\x1f\x8b":
+        raw_data = gzip.decompress(raw_data)
+    dsf_dict = json.loads(raw_data)
+    uv_set = dsf_dict["uv_set_library"][0]
+    return {
+        "name": uv_set["name"],
+        "label": uv_set.get("label", uv_set["name"]),
+        "vertex_count": int(uv_set["vertex_count"]),
+        "uvs": np.array(uv_set["uvs"]["values"], dtype=np.float32).reshape(-1, 2),
+        "overrides": np.array(uv_set["polygon_vertex_indices"], dtype=np.int32).reshape(-1, 3),
+    }
+
+def load_dsf_uv_set(dsf_path, use_cache=True):
+    # returns parsed uv set dict, arrays are memory-mapped from the cache when available
+    if not use_cache:
+        return parse_dsf_uv_set(dsf_path)
+    cache_folder = blender_tools.get_cache_folder("dsf_uv_sets")
+    cache_base = os.path.join(cache_folder, blender_tools.get_file_hash(dsf_path)).replace("\\","/")
+    info_path = cache_base + "_info.json"
+    uvs_path = cache_base + "_uvs.npy"
+    overrides_path = cache_base + "_overrides.npy"
+    if os.path.exists(info_path) and os.path.exists(uvs_path) and os.path.exists(overrides_path):
+        with open(info_path, "r") as file:
+            uv_set = json.load(file)
+        uv_set["uvs"] = np.load(uvs_path, mmap_mode="r")
+        uv_set["overrides"] = np.load(overrides_path, mmap_mode="r")
+        return uv_set
+    uv_set = parse_dsf_uv_set(dsf_path)
+    np.save(uvs_path, uv_set["uvs"])
+    np.save(overrides_path, uv_set["overrides"])
+    with open(info_path, "w") as file:
+        json.dump({"name": uv_set["name"], "label": uv_set["label"], "vertex_count": uv_set["vertex_count"], "source": dsf_path}, file)
+    return uv_set
+
+def compute_loop_uvs(uv_set, loop_polygon_indices, loop_vertex_indices):
+    # each loop uses the uv of its vertex, unless (polygon, vertex) is listed in the DSF overrides
+    vertex_count = uv_set["vertex_count"]
+    overrides = np.asarray(uv_set["overrides"], dtype=np.int64)
+    uv_indices = loop_vertex_indices.astype(np.int64)
+    if len(overrides) > 0:
+        override_keys = overrides[:,0] * vertex_count + overrides[:,1]
+        order = np.argsort(override_keys)
+        sorted_keys = override_keys[order]
+        loop_keys = loop_polygon_indices.astype(np.int64) * vertex_count + uv_indices
+        positions = np.searchsorted(sorted_keys, loop_keys).clip(0, len(sorted_keys) - 1)
+        is_override = sorted_keys[positions] == loop_keys
+        uv_indices[is_override] = overrides[order[positions[is_override]], 2]
+    return np.asarray(uv_set["uvs"])[uv_indices]
+
+def apply_dsf_uv_set_to_mesh(mesh_obj, uv_set, make_active=True):
+    # create a new uv layer on mesh_obj from uv_set, returns the layer or None on topology mismatch
+    mesh = mesh_obj.data
+    num_polygons = len(mesh.polygons)
+    if len(mesh.vertices) != uv_set["vertex_count"] or (len(uv_set["overrides"]) > 0 and int(np.max(uv_set["overrides"][:,0])) >= num_polygons):
+        _add_to_log("ERROR: apply_dsf_uv_set_to_mesh(): topology of " + mesh_obj.name + " does not match uv set: " + uv_set["name"])
+        return None
+    loop_totals = np.empty(num_polygons, dtype=np.int32)
+    loop_vertex_indices = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    mesh.loops.foreach_get("vertex_index", loop_vertex_indices)
+    loop_polygon_indices = np.repeat(np.arange(num_polygons, dtype=np.int64), loop_totals)
+    loop_uvs = compute_loop_uvs(uv_set, loop_polygon_indices, loop_vertex_indices)
+
+    uv_layer = mesh.uv_layers.get(uv_set["label"])
+    if uv_layer is None:
+        uv_layer = mesh.uv_layers.new(name=uv_set["label"])
+    uv_layer.data.foreach_set("uv", loop_uvs.astype(np.float32).ravel())
+    if make_active:
+        mesh.uv_layers.active = uv_layer
+        uv_layer.active_render = True
+    return uv_layer
+
+def apply_combined_uv_sets(dsf_path_list, make_active=True):
+    # apply each DSF uv set to the mesh with a matching vertex count, returns list of updated objects
+    start_time = time.perf_counter()
+    updated_objs = []
+    for dsf_path in dsf_path_list:
+        if not os.path.exists(dsf_path):
+            _add_to_log("ERROR: apply_combined_uv_sets(): DSF file not found: " + dsf_path)
+            continue
+        uv_set = load_dsf_uv_set(dsf_path)
+        for obj in bpy.data.objects:
+            if obj.type != 'MESH' or obj in updated_objs or len(obj.data.vertices) != uv_set["vertex_count"]:
+                continue
+            if apply_dsf_uv_set_to_mesh(obj, uv_set, make_active) is not None:
+                _add_to_log("DEBUG: apply_combined_uv_sets(): applied " + uv_set["label"] + " to " + obj.name)
+                updated_objs.append(obj)
+                break
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: apply_combined_uv_sets(): updated " + str(len(updated_objs)) + " meshes in " + str(round(elapsed_time, 3)) + " seconds")
+    return updated_objs
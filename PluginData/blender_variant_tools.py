@@ -0,0 +1,172 @@
+"""Blender Variant Tools module
+
+Blender python module to fan out several export variants of one converted
+avatar, e.g. lower triangle budgets, smaller textures or glTF instead of FBX,
+without re-running the conversion. The converted scene is saved once as a
+.blend; each variant re-opens that file, applies a variant decimate modifier
+and texture downscale, and exports. Parts with shape keys are decimated with
+the quadric decimator, since the fbx exporter drops shape keys when a modifier
+changes the vertex count, and optimized parts are re-optimized after the
+decimation. Variants run in-process one after another,
+or as parallel Blender worker processes started on the shared .blend.
+
+Worker usage:
+
+    blender.exe --background <shared.blend> --python blender_variant_tools.py -- <variant json> <output folder> <fbx base name>
+
+Requirements:
+    - Python 3+
+    - Blender 3.6+
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_variant_tools.log"
+
+## Do not modify below
+import sys, os, json, time, subprocess
+try:
+    import bpy
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+try:
+    import blender_decimate_tools
+except:
+    sys.path.append(script_dir)
+    import blender_decimate_tools
+
+try:
+    import blender_mesh_tools
+except:
+    sys.path.append(script_dir)
+    import blender_mesh_tools
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+# export settings of the Roblox fbx, shared with blender_dtu_to_roblox_blend.py
+ROBLOX_FBX_EXPORT_SETTINGS = {
+    "global_scale": 0.0333,
+    "add_leaf_bones": False,
+    "path_mode": "COPY",
+    "embed_textures": True,
+}
+
+# "decimation_scale" multiplies the triangle count of every part, "texture_size" caps image width and height
+# "optimize_mesh" re-runs the part mesh optimization after decimating, set when the converted parts were optimized
+DEFAULT_VARIANT = {
+    "name": "default",
+    "decimation_scale": 1.0,
+    "texture_size": None,
+    "format": "fbx",
+    "optimize_mesh": False,
+}
+
+
+def get_variant_settings(variant):
+    settings = dict(DEFAULT_VARIANT)
+    settings.update(variant)
+    return settings
+
+def get_variant_output_path(variant, output_folder, fbx_base_name):
+    extension = ".glb" if variant["format"] == "glb" else ".fbx"
+    return os.path.join(output_folder, fbx_base_name.replace(".fbx", "_roblox_" + variant["name"] + extension)).replace("\\","/")
+
+def apply_triangle_budget(decimation_scale, optimize_mesh=False):
+    # add a second decimate modifier on every part, applied by the exporter unless the part has shape keys or is optimized
+    if decimation_scale >= 1.0:
+        return
+    for obj in bpy.data.objects:
+        if obj.type != 'MESH' or "Cage" in obj.name or "Attachment" in obj.name:
+            continue
+        mod = obj.modifiers.new(name="VariantDecimate", type="DECIMATE")
+        mod.ratio = decimation_scale
+        if optimize_mesh and obj.name.endswith("_Geo"):
+            # applies the decimation, with the quadric decimator for shape keys, then restores the vertex cache order
+            blender_mesh_tools.optimize_part_mesh(obj)
+        elif obj.data.shape_keys is not None:
+            blender_decimate_tools.replace_decimate_modifier(obj)
+
+def apply_texture_size(texture_size):
+    # downscale images larger than texture_size, keeping the aspect ratio
+    if texture_size is None:
+        return
+    for image in bpy.data.images:
+        width, height = image.size
+        if max(width, height) <= texture_size or width == 0 or height == 0:
+            continue
+        scale = texture_size / max(width, height)
+        image.scale(max(1, int(width * scale)), max(1, int(height * scale)))
+        if image.packed_file is not None:
+            image.pack()
+
+def export_variant(variant, output_path):
+    bpy.ops.object.mode_set(mode="OBJECT")
+    bpy.ops.object.select_all(action="SELECT")
+    if variant["format"] == "glb":
+        bpy.ops.export_scene.gltf(filepath=output_path, export_format="GLB")
+    else:
+        bpy.ops.export_scene.fbx(filepath=output_path, **ROBLOX_FBX_EXPORT_SETTINGS)
+
+def run_variant(variant, output_folder, fbx_base_name):
+    # apply and export one variant on the currently open scene, returns output path
+    start_time = time.perf_counter()
+    variant = get_variant_settings(variant)
+    output_path = get_variant_output_path(variant, output_folder, fbx_base_name)
+    apply_triangle_budget(variant["decimation_scale"], variant["optimize_mesh"])
+    apply_texture_size(variant["texture_size"])
+    export_variant(variant, output_path)
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: run_variant(): exported " + variant["name"] + " to " + output_path + " in " + str(round(elapsed_time, 3)) + " seconds")
+    return output_path
+
+def export_variants_in_process(blend_path, variant_list, output_folder, fbx_base_name):
+    # re-open the shared .blend before each variant, the scene is left on the last variant
+    output_list = []
+    for variant in variant_list:
+        bpy.ops.wm.open_mainfile(filepath=blend_path)
+        output_list.append(run_variant(variant, output_folder, fbx_base_name))
+    return output_list
+
+def export_variants_with_workers(blend_path, variant_list, output_folder, fbx_base_name, max_workers=None):
+    # one background Blender per variant on the shared .blend, returns list of (variant name, return code)
+    if max_workers is None:
+        max_workers = max(1, (os.cpu_count() or 2) // 2)
+    results = []
+    pending = list(variant_list)
+    running = []
+    while len(pending) > 0 or len(running) > 0:
+        while len(pending) > 0 and len(running) < max_workers:
+            variant = pending.pop(0)
+            command = [bpy.app.binary_path, "--background", blend_path, "--python", os.path.join(script_dir, "blender_variant_tools.py"), "--", json.dumps(variant), output_folder, fbx_base_name]
+            running.append((variant, subprocess.Popen(command)))
+        variant, process = running.pop(0)
+        return_code = process.wait()
+        if return_code != 0:
+            _add_to_log("ERROR: export_variants_with_workers(): variant " + str(variant.get("name")) + " failed with return code " + str(return_code))
+        results.append((variant.get("name"), return_code))
+    return results
+
+def export_variants(blend_path, variant_list, output_folder, fbx_base_name, use_workers=True, max_workers=None):
+    start_time = time.perf_counter()
+    if use_workers:
+        export_variants_with_workers(blend_path, variant_list, output_folder, fbx_base_name, max_workers)
+    else:
+        export_variants_in_process(blend_path, variant_list, output_folder, fbx_base_name)
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: export_variants(): exported " + str(len(variant_list)) + " variants in " + str(round(elapsed_time, 3)) + " seconds")
+
+
+# Execute worker
+if __name__=='__main__':
+    worker_args = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    if len(worker_args) < 3:
+        print("\nUSAGE: blender.exe --background <shared.blend> --python blender_variant_tools.py -- <variant json> <output folder> <fbx base name>\n")
+        exit(1)
+    run_variant(json.loads(worker_args[0]), worker_args[1], worker_args[2])
+    exit(0)
@@ -0,0 +1,254 @@
+"""Blender Verify Tools module
+
+Python module to check an exported Roblox FBX without importing it. The file is
+re-read with blender_fbx_tools, outside of the Blender scene, and checked for
+the R15 part meshes, a triangle budget per part, the R15 bone hierarchy,
+embedded textures, and a character size which matches the Roblox export
+global_scale. Several files are verified concurrently, and the result is a
+pass/fail report per file.
+
+Command line usage:
+
+    python blender_verify_tools.py [--report <json file>] [--workers <count>] <fbx file> [<fbx file> ...]
+
+Requirements:
+    - Python 3+
+    - NumPy
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_verify_tools.log"
+
+## Do not modify below
+import sys, os, json, time, argparse, contextlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+try:
+    import blender_fbx_tools
+except:
+    sys.path.append(script_dir)
+    import blender_fbx_tools
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+R15_PART_NAMES = [
+    "Head_Geo", "UpperTorso_Geo", "LowerTorso_Geo",
+    "RightUpperArm_Geo", "RightLowerArm_Geo", "RightHand_Geo",
+    "LeftUpperArm_Geo", "LeftLowerArm_Geo", "LeftHand_Geo",
+    "RightUpperLeg_Geo", "RightLowerLeg_Geo", "RightFoot_Geo",
+    "LeftUpperLeg_Geo", "LeftLowerLeg_Geo", "LeftFoot_Geo",
+]
+# R15 bone -> parent bone, None for the root bone
+R15_BONE_PARENTS = {
+    "LowerTorso": None,
+    "UpperTorso": "LowerTorso",
+    "Head": "UpperTorso",
+    "RightUpperArm": "UpperTorso",
+    "RightLowerArm": "RightUpperArm",
+    "RightHand": "RightLowerArm",
+    "LeftUpperArm": "UpperTorso",
+    "LeftLowerArm": "LeftUpperArm",
+    "LeftHand": "LeftLowerArm",
+    "RightUpperLeg": "LowerTorso",
+    "RightLowerLeg": "RightUpperLeg",
+    "RightFoot": "RightLowerLeg",
+    "LeftUpperLeg": "LowerTorso",
+    "LeftLowerLeg": "LeftUpperLeg",
+    "LeftFoot": "LeftLowerLeg",
+}
+# Roblox MeshPart triangle limit
+MAX_PART_TRIANGLES = 20000
+# largest bounding box side of all parts, in FBX units; a Genesis figure exported with global_scale 0.0333 is about 5-6 units tall
+CHARACTER_SIZE_RANGE = (2.0, 12.0)
+DEFAULT_VERIFY_WORKERS = 4
+
+
+def get_transform_properties(scanner, node):
+    # (translation, rotation in degrees, scaling) from the Properties70 of a Model node
+    transform = {"Lcl Translation": [0.0, 0.0, 0.0], "Lcl Rotation": [0.0, 0.0, 0.0], "Lcl Scaling": [1.0, 1.0, 1.0]}
+    properties_node = scanner.find_child(node, "Properties70")
+    if properties_node is not None:
+        for property_node in scanner.iter_children(properties_node):
+            property_list = scanner.read_properties(property_node)
+            if len(property_list) >= 7 and property_list[0] in transform:
+                transform[property_list[0]] = [float(value) for value in property_list[4:7]]
+    return transform["Lcl Translation"], transform["Lcl Rotation"], transform["Lcl Scaling"]
+
+def compose_local_matrix(translation, rotation, scaling):
+    # T * R * S with the default FBX XYZ euler order, pivots and pre-rotations are ignored
+    rx, ry, rz = np.radians(rotation)
+    rotation_x = np.array([[1, 0, 0], [0, np.cos(rx), -np.sin(rx)], [0, np.sin(rx), np.cos(rx)]])
+    rotation_y = np.array([[np.cos(ry), 0, np.sin(ry)], [0, 1, 0], [-np.sin(ry), 0, np.cos(ry)]])
+    rotation_z = np.array([[np.cos(rz), -np.sin(rz), 0], [np.sin(rz), np.cos(rz), 0], [0, 0, 1]])
+    matrix = np.identity(4)
+    matrix[:3, :3] = rotation_z @ rotation_y @ rotation_x @ np.diag(scaling)
+    matrix[:3, 3] = translation
+    return matrix
+
+def read_output_scene(fbx_path):
+    # models, geometries, parent connections and texture embedding of an exported fbx
+    scene = {"models": {}, "geometries": {}, "parents": {}, "textures": {}, "videos": {}}
+    with blender_fbx_tools.FbxScanner(fbx_path) as scanner:
+        for node, object_id, name, object_class in scanner.iter_objects():
+            if node.name == "Model":
+                translation, rotation, scaling = get_transform_properties(scanner, node)
+                scene["models"][object_id] = {"name": name, "class": object_class, "matrix": compose_local_matrix(translation, rotation, scaling)}
+            elif node.name == "Geometry" and object_class == "Mesh":
+                geometry = {"name": name, "triangles": 0, "bounds": None}
+                vertices = scanner.read_child_property(node, "Vertices")
+                if vertices is not None and vertices.length > 0:
+                    coords = scanner.read_array(vertices).reshape(-1, 3)
+                    geometry["bounds"] = (coords.min(axis=0), coords.max(axis=0))
+                polygon_vertex_index = scanner.read_child_property(node, "PolygonVertexIndex")
+                if polygon_vertex_index is not None:
+                    # a polygon with n corners is n - 2 triangles
+                    geometry["triangles"] = polygon_vertex_index.length - 2 * blender_fbx_tools.count_polygons(scanner.read_array(polygon_vertex_index))
+                scene["geometries"][object_id] = geometry
+            elif node.name == "Texture":
+                scene["textures"][object_id] = name
+            elif node.name == "Video":
+                content = scanner.read_child_property(node, "Content")
+                scene["videos"][object_id] = isinstance(content, bytes) and len(content) > 0
+        connections_node = scanner.find_path(["Connections"])
+        if connections_node is not None:
+            for connection_node in scanner.iter_children(connections_node):
+                property_list = scanner.read_properties(connection_node)
+                if len(property_list) >= 3 and property_list[0] == "OO":
+                    scene["parents"].setdefault(property_list[1], []).append(property_list[2])
+    return scene
+
+def get_model_parent(scene, object_id):
+    for parent_id in scene["parents"].get(object_id, []):
+        if parent_id in scene["models"]:
+            return parent_id
+    return None
+
+def get_world_matrix(scene, model_id):
+    matrix = np.identity(4)
+    while model_id is not None:
+        matrix = scene["models"][model_id]["matrix"] @ matrix
+        model_id = get_model_parent(scene, model_id)
+    return matrix
+
+def get_world_bounds(local_bounds, world_matrix):
+    # bounds of the 8 transformed corners of a local bounding box
+    low, high = local_bounds
+    corners = np.array([[x, y, z, 1.0] for x in (low[0], high[0]) for y in (low[1], high[1]) for z in (low[2], high[2])])
+    world_corners = (corners @ world_matrix.T)[:, :3]
+    return world_corners.min(axis=0), world_corners.max(axis=0)
+
+def make_check(passed, detail):
+    return {"passed": bool(passed), "detail": detail}
+
+def verify_fbx(fbx_path, expected_parts=None):
+    # returns {"file", "passed", "checks", "seconds"}, expected_parts defaults to the R15 parts
+    start_time = time.perf_counter()
+    result = {"file": fbx_path, "passed": False, "checks": {}, "seconds": 0.0}
+    if expected_parts is None:
+        expected_parts = R15_PART_NAMES
+    try:
+        scene = read_output_scene(fbx_path)
+    except (OSError, ValueError) as e:
+        result["checks"]["readable"] = make_check(False, str(e))
+        result["seconds"] = round(time.perf_counter() - start_time, 3)
+        return result
+    checks = result["checks"]
+
+    # part meshes with their geometry
+    part_dict = {}
+    for geometry_id, geometry in scene["geometries"].items():
+        model_id = get_model_parent(scene, geometry_id)
+        if model_id is not None:
+            part_dict[scene["models"][model_id]["name"]] = (model_id, geometry)
+    missing_parts = [part_name for part_name in expected_parts if part_name not in part_dict]
+    checks["part_names"] = make_check(len(missing_parts) == 0, {"missing": missing_parts, "parts": sorted(part_dict.keys())})
+
+    triangle_counts = dict((part_name, geometry["triangles"]) for part_name, (model_id, geometry) in part_dict.items())
+    bad_parts = [part_name for part_name in expected_parts if part_name in triangle_counts and not (0 < triangle_counts[part_name] <= MAX_PART_TRIANGLES)]
+    checks["triangle_counts"] = make_check(len(bad_parts) == 0, {"out_of_range": bad_parts, "max_part_triangles": MAX_PART_TRIANGLES, "triangles": triangle_counts})
+
+    # bone hierarchy, by Model name of each LimbNode and of its parent
+    bone_parents = {}
+    for model_id, model in scene["models"].items():
+        if model["class"] == "LimbNode":
+            parent_id = get_model_parent(scene, model_id)
+            parent_model = scene["models"].get(parent_id)
+            bone_parents[model["name"]] = parent_model["name"] if parent_model is not None and parent_model["class"] == "LimbNode" else None
+    hierarchy_errors = []
+    for bone_name, parent_name in R15_BONE_PARENTS.items():
+        if bone_name not in bone_parents:
+            hierarchy_errors.append(bone_name + " missing")
+        elif bone_parents[bone_name] != parent_name:
+            hierarchy_errors.append(bone_name + " parented to " + str(bone_parents[bone_name]) + ", expected " + str(parent_name))
+    checks["bone_hierarchy"] = make_check(len(hierarchy_errors) == 0, {"errors": hierarchy_errors, "bones": len(bone_parents)})
+
+    # every texture needs its image embedded
+    external_textures = []
+    for texture_id, texture_name in scene["textures"].items():
+        video_ids = [object_id for object_id, parent_list in scene["parents"].items() if texture_id in parent_list and object_id in scene["videos"]]
+        if not any(scene["videos"][video_id] for video_id in video_ids):
+            external_textures.append(texture_name)
+    embedded_count = sum(1 for embedded in scene["videos"].values() if embedded)
+    checks["embedded_textures"] = make_check(len(external_textures) == 0 and (embedded_count > 0 or len(scene["textures"]) == 0), {"embedded": embedded_count, "textures": len(scene["textures"]), "not_embedded": external_textures})
+
+    # world bounding box of the parts, falls back to every mesh when no part is found
+    bounds_list = [get_world_bounds(geometry["bounds"], get_world_matrix(scene, model_id)) for part_name, (model_id, geometry) in part_dict.items()
+                   if geometry["bounds"] is not None and (part_name in expected_parts or len(missing_parts) == len(expected_parts))]
+    if len(bounds_list) > 0:
+        size = np.max([bounds[1] for bounds in bounds_list], axis=0) - np.min([bounds[0] for bounds in bounds_list], axis=0)
+        character_size = float(size.max())
+        checks["bounding_box_scale"] = make_check(CHARACTER_SIZE_RANGE[0] <= character_size <= CHARACTER_SIZE_RANGE[1], {"size": [round(float(value), 4) for value in size], "range": list(CHARACTER_SIZE_RANGE)})
+    else:
+        checks["bounding_box_scale"] = make_check(False, {"size": None, "range": list(CHARACTER_SIZE_RANGE)})
+
+    result["passed"] = all(check["passed"] for check in checks.values())
+    result["seconds"] = round(time.perf_counter() - start_time, 3)
+    return result
+
+def verify_outputs(fbx_path_list, expected_parts=None, max_workers=DEFAULT_VERIFY_WORKERS):
+    # verify files concurrently, the mmap reads, zlib and NumPy work release the GIL
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(fbx_path_list)))) as executor:
+        result_list = list(executor.map(lambda fbx_path: verify_fbx(fbx_path, expected_parts), fbx_path_list))
+    for result in result_list:
+        failed_checks = [check_name for check_name, check in result["checks"].items() if not check["passed"]]
+        if result["passed"]:
+            _add_to_log("DEBUG: verify_outputs(): passed: " + result["file"])
+        else:
+            _add_to_log("ERROR: verify_outputs(): failed " + str(failed_checks) + ": " + result["file"])
+    report = {"passed": all(result["passed"] for result in result_list), "files": result_list, "seconds": round(time.perf_counter() - start_time, 3)}
+    _add_to_log("DEBUG: verify_outputs(): verified " + str(len(result_list)) + " files in " + str(report["seconds"]) + " seconds")
+    return report
+
+def write_verify_report(verify_report, report_path):
+    with open(report_path, "w") as file:
+        json.dump(verify_report, file, indent=2)
+    _add_to_log("DEBUG: write_verify_report(): wrote verification report: " + report_path)
+
+
+def _main(argv):
+    parser = argparse.ArgumentParser(description="Verify exported DazToRoblox FBX files.")
+    parser.add_argument("--report", default=None, help="write the pass/fail report to this json file")
+    parser.add_argument("--workers", type=int, default=DEFAULT_VERIFY_WORKERS, help="files verified at the same time")
+    parser.add_argument("fbx_files", nargs="+")
+    args = parser.parse_args(argv)
+    # log lines go to stderr so the report printed to stdout stays valid json
+    with contextlib.redirect_stdout(sys.stderr):
+        verify_report = verify_outputs(args.fbx_files, max_workers=args.workers)
+        if args.report is not None:
+            write_verify_report(verify_report, args.report)
+    if args.report is None:
+        print(json.dumps(verify_report, indent=2))
+    return 0 if verify_report["passed"] else 1
+
+
+# Execute main()
+if __name__=='__main__':
+    exit(_main(sys.argv[1:]))
@@ -0,0 +1,287 @@
+"""Blender Weight Tools module
+
+Blender python module to convert Genesis 8/9 skin weights to the R15 bone set
+inside Blender, replacing the Daz Studio side bone_converter.dsa step. Every
+Genesis bone is folded onto its nearest ancestor listed in the R15 bone mapping
+tables, so twist, finger and face bones hand their weight to the R15 parent.
+
+The folding matrix has exactly one non-zero per source bone, so the sparse
+product (vertex x bone) * (bone x R15) is evaluated as a single np.bincount over
+the (vertex, R15 bone) keys of all weights of the figure.
+
+Also contains the pre-export skin cleanup, which caps bone influences per
+vertex to the Roblox limit, renormalizes, and prunes empty vertex groups and
+unweighted bones left behind after the mesh is split into R15 parts.
+
+Requirements:
+    - Python 3+
+    - Blender 3.6+ (uses the NumPy bundled with Blender)
+
+"""
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+logFilename = "blender_weight_tools.log"
+
+## Do not modify below
+import sys, os, time
+import numpy as np
+try:
+    import bpy
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+def _add_to_log(sMessage):
+    print(str(sMessage))
+    with open(logFilename, "a") as file:
+        file.write(sMessage + "\n")
+
+
+# fold table markers for vertex groups which are not converted
+FOLD_KEEP = -1
+FOLD_DROP = -2
+
+
+def read_vertex_group_weights(mesh_obj):
+    # returns COO arrays (vertex_indices, group_indices, weights) for all weights of the mesh
+    weight_list = [(v.index, g.group, g.weight) for v in mesh_obj.data.vertices for g in v.groups]
+    if len(weight_list) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    weight_array = np.array(weight_list, dtype=np.float64)
+    return weight_array[:,0].astype(np.int64), weight_array[:,1].astype(np.int64), weight_array[:,2].astype(np.float32)
+
+def write_vertex_group_weights(vertex_group, vertex_indices, weights):
+    # vertex_group.add() takes one weight per call, so batch all vertices sharing a weight value
+    unique_weights, inverse = np.unique(weights, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    split_points = np.cumsum(np.bincount(inverse, minlength=len(unique_weights)))[:-1]
+    for weight, index_block in zip(unique_weights, np.split(vertex_indices[order], split_points)):
+        vertex_group.add(index_block.tolist(), float(weight), "REPLACE")
+
+
+def build_bone_folding_table(armature_obj, bone_mapping):
+    # returns {bone_name: r15_bone_name or None}, None meaning no R15 bone above it
+    r15_bone_names = set(bone_mapping.values())
+    folding_table = {}
+    for bone in armature_obj.data.bones:
+        current = bone
+        while current is not None and current.name not in bone_mapping and current.name not in r15_bone_names:
+            current = current.parent
+        if current is None:
+            folding_table[bone.name] = None
+        else:
+            folding_table[bone.name] = bone_mapping.get(current.name, current.name)
+    return folding_table
+
+def build_vertex_group_fold_index(vertex_group_names, folding_table):
+    # returns (target_names, fold_index) where fold_index[source_group] is a column of target_names
+    target_names = []
+    target_lookup = {}
+    fold_index = np.full(len(vertex_group_names), FOLD_KEEP, dtype=np.int64)
+    for group_index, group_name in enumerate(vertex_group_names):
+        if group_name not in folding_table:
+            continue
+        target_name = folding_table[group_name]
+        if target_name is None:
+            fold_index[group_index] = FOLD_DROP
+            continue
+        if target_name not in target_lookup:
+            target_lookup[target_name] = len(target_names)
+            target_names.append(target_name)
+        fold_index[group_index] = target_lookup[target_name]
+    return target_names, fold_index
+
+def fold_vertex_weights(vertex_indices, group_indices, weights, fold_index, num_targets):
+    # sparse fold of COO weights, returns COO arrays (vertex_indices, target_indices, weights)
+    target_indices = fold_index[group_indices]
+    valid = target_indices >= 0
+    keys = vertex_indices[valid] * num_targets + target_indices[valid]
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    folded_weights = np.bincount(inverse, weights=weights[valid], minlength=len(unique_keys))
+    return unique_keys // num_targets, unique_keys % num_targets, folded_weights.astype(np.float32)
+
+
+def convert_vertex_groups_to_r15(mesh_obj, folding_table):
+    # fold all bone vertex groups of mesh_obj onto R15 vertex groups, returns number of groups folded
+    vertex_group_names = [vg.name for vg in mesh_obj.vertex_groups]
+    target_names, fold_index = build_vertex_group_fold_index(vertex_group_names, folding_table)
+    is_identity = all(fold_index[i] == FOLD_KEEP or (fold_index[i] >= 0 and target_names[fold_index[i]] == name) for i, name in enumerate(vertex_group_names))
+    if is_identity:
+        _add_to_log("DEBUG: convert_vertex_groups_to_r15(): " + mesh_obj.name + " already uses R15 vertex groups, skipping...")
+        return 0
+
+    vertex_indices, group_indices, weights = read_vertex_group_weights(mesh_obj)
+    folded_vertices, folded_targets, folded_weights = fold_vertex_weights(vertex_indices, group_indices, weights, fold_index, max(len(target_names), 1))
+
+    # remove all converted source groups, then rebuild R15 groups in bulk
+    for group_index in reversed(range(len(vertex_group_names))):
+        if fold_index[group_index] != FOLD_KEEP:
+            mesh_obj.vertex_groups.remove(mesh_obj.vertex_groups[group_index])
+    for target_index, target_name in enumerate(target_names):
+        vertex_group = mesh_obj.vertex_groups.new(name=target_name)
+        mask = folded_targets == target_index
+        if np.any(mask):
+            write_vertex_group_weights(vertex_group, folded_vertices[mask], folded_weights[mask])
+    num_folded = int(np.count_nonzero(fold_index != FOLD_KEEP))
+    _add_to_log("DEBUG: convert_vertex_groups_to_r15(): " + mesh_obj.name + ": folded " + str(num_folded) + " vertex groups into " + str(len(target_names)) + " R15 vertex groups")
+    return num_folded
+
+def convert_armature_to_r15(armature_obj, bone_mapping):
+    # rename mapped bones to R15 and delete all other bones, children are reparented by Blender
+    r15_bone_names = set(bone_mapping.values())
+    bpy.ops.object.mode_set(mode="OBJECT")
+    bpy.ops.object.select_all(action="DESELECT")
+    armature_obj.select_set(True)
+    bpy.context.view_layer.objects.active = armature_obj
+    bpy.ops.object.mode_set(mode="EDIT")
+    edit_bones = armature_obj.data.edit_bones
+    mapped_bone_names = []
+    deleted_bone_count = 0
+    for edit_bone in list(edit_bones):
+        if edit_bone.name in bone_mapping or edit_bone.name in r15_bone_names:
+            mapped_bone_names.append(edit_bone.name)
+        else:
+            edit_bones.remove(edit_bone)
+            deleted_bone_count += 1
+    bpy.ops.object.mode_set(mode="OBJECT")
+    for bone_name in mapped_bone_names:
+        target_name = bone_mapping.get(bone_name, bone_name)
+        if bone_name != target_name:
+            armature_obj.data.bones[bone_name].name = target_name
+    _add_to_log("DEBUG: convert_armature_to_r15(): " + armature_obj.name + ": kept " + str(len(mapped_bone_names)) + " R15 bones, deleted " + str(deleted_bone_count) + " bones")
+
+def convert_genesis_skin_to_r15(armature_obj, bone_mapping):
+    # convert vertex groups of all meshes deformed by armature_obj, then the armature itself
+    start_time = time.perf_counter()
+    folding_table = build_bone_folding_table(armature_obj, bone_mapping)
+    if all(bone_name == target_name for bone_name, target_name in folding_table.items()):
+        _add_to_log("DEBUG: convert_genesis_skin_to_r15(): " + armature_obj.name + " is already an R15 armature, skipping...")
+        return
+    for obj in bpy.data.objects:
+        if obj.type != 'MESH':
+            continue
+        for mod in obj.modifiers:
+            if mod.type == "ARMATURE" and mod.object == armature_obj:
+                convert_vertex_groups_to_r15(obj, folding_table)
+                break
+    convert_armature_to_r15(armature_obj, bone_mapping)
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: convert_genesis_skin_to_r15(): converted " + armature_obj.name + " in " + str(round(elapsed_time, 3)) + " seconds")
+
+
+# Roblox skinned meshes support at most 4 bone influences per vertex
+ROBLOX_MAX_BONE_INFLUENCES = 4
+
+# R15 rig bones which are never pruned, even without any skin weight
+R15_BODY_BONE_NAMES = [
+    "LowerTorso", "UpperTorso", "Head",
+    "LeftUpperArm", "LeftLowerArm", "LeftHand",
+    "RightUpperArm", "RightLowerArm", "RightHand",
+    "LeftUpperLeg", "LeftLowerLeg", "LeftFoot",
+    "RightUpperLeg", "RightLowerLeg", "RightFoot",
+]
+
+
+def read_dense_vertex_weights(mesh_obj):
+    # returns (num_vertices, num_vertex_groups) float32 weight matrix
+    vertex_indices, group_indices, weights = read_vertex_group_weights(mesh_obj)
+    dense_weights = np.zeros((len(mesh_obj.data.vertices), len(mesh_obj.vertex_groups)), dtype=np.float32)
+    dense_weights[vertex_indices, group_indices] = weights
+    return dense_weights
+
+def limit_and_normalize_weights(dense_weights, bone_group_mask, max_influences=ROBLOX_MAX_BONE_INFLUENCES):
+    # keep the top max_influences bone weights per vertex and renormalize them to sum to 1.0
+    # returns (new_dense_weights, number of vertices which exceeded the limit)
+    result = dense_weights.copy()
+    bone_weights = result[:, bone_group_mask]
+    influence_counts = np.count_nonzero(bone_weights > 0, axis=1)
+    num_capped = int(np.count_nonzero(influence_counts > max_influences))
+    if bone_weights.shape[1] > max_influences and num_capped > 0:
+        top_columns = np.argpartition(-bone_weights, max_influences - 1, axis=1)[:, :max_influences]
+        keep = np.zeros(bone_weights.shape, dtype=bool)
+        keep[np.arange(len(bone_weights))[:, None], top_columns] = True
+        bone_weights = np.where(keep, bone_weights, 0.0)
+    weight_sums = bone_weights.sum(axis=1)
+    has_weight = weight_sums > 0
+    bone_weights[has_weight] /= weight_sums[has_weight, None]
+    result[:, bone_group_mask] = bone_weights
+    return result, num_capped
+
+def apply_dense_weight_changes(mesh_obj, old_weights, new_weights, tolerance=1e-6):
+    # write back only the entries which changed, one remove() and batched add() calls per group
+    changed = np.abs(new_weights - old_weights) > tolerance
+    for group_index in np.flatnonzero(np.any(changed, axis=0)):
+        vertex_group = mesh_obj.vertex_groups[int(group_index)]
+        column_changed = changed[:, group_index]
+        removed_vertices = np.flatnonzero(column_changed & (new_weights[:, group_index] == 0))
+        updated_vertices = np.flatnonzero(column_changed & (new_weights[:, group_index] > 0))
+        if len(removed_vertices) > 0:
+            vertex_group.remove(removed_vertices.tolist())
+        if len(updated_vertices) > 0:
+            write_vertex_group_weights(vertex_group, updated_vertices, new_weights[updated_vertices, group_index])
+
+def cleanup_mesh_skin_weights(mesh_obj, armature_obj, max_influences=ROBLOX_MAX_BONE_INFLUENCES):
+    # cap, normalize and prune vertex groups of one part, returns (report, names of bones still weighted)
+    vertex_group_names = [vg.name for vg in mesh_obj.vertex_groups]
+    bone_group_mask = np.array([name in armature_obj.data.bones for name in vertex_group_names], dtype=bool)
+    old_weights = read_dense_vertex_weights(mesh_obj)
+    new_weights, num_capped = limit_and_normalize_weights(old_weights, bone_group_mask, max_influences)
+    apply_dense_weight_changes(mesh_obj, old_weights, new_weights)
+
+    # drop vertex groups with zero total weight, in reverse so indices stay valid
+    group_totals = new_weights.sum(axis=0)
+    removed_group_names = []
+    for group_index in reversed(range(len(vertex_group_names))):
+        if group_totals[group_index] <= 0:
+            removed_group_names.append(vertex_group_names[group_index])
+            mesh_obj.vertex_groups.remove(mesh_obj.vertex_groups[group_index])
+    weighted_bone_names = set(name for name, total, is_bone in zip(vertex_group_names, group_totals, bone_group_mask) if is_bone and total > 0)
+    report = {
+        "vertices": len(new_weights),
+        "capped_vertices": num_capped,
+        "removed_vertex_groups": sorted(removed_group_names),
+    }
+    return report, weighted_bone_names
+
+def prune_unweighted_bones(armature_obj, weighted_bone_names):
+    # delete bones with no weight in any part unless they are R15 bones or parents of kept bones
+    keep_bone_names = set(R15_BODY_BONE_NAMES) | set(weighted_bone_names)
+    for bone in armature_obj.data.bones:
+        if bone.name in keep_bone_names:
+            parent = bone.parent
+            while parent is not None:
+                keep_bone_names.add(parent.name)
+                parent = parent.parent
+    removed_bone_names = [bone.name for bone in armature_obj.data.bones if bone.name not in keep_bone_names]
+    if len(removed_bone_names) == 0:
+        return removed_bone_names
+    bpy.ops.object.mode_set(mode="OBJECT")
+    bpy.ops.object.select_all(action="DESELECT")
+    armature_obj.select_set(True)
+    bpy.context.view_layer.objects.active = armature_obj
+    bpy.ops.object.mode_set(mode="EDIT")
+    edit_bones = armature_obj.data.edit_bones
+    for bone_name in removed_bone_names:
+        edit_bones.remove(edit_bones[bone_name])
+    bpy.ops.object.mode_set(mode="OBJECT")
+    return sorted(removed_bone_names)
+
+def cleanup_skin_weights(armature_obj, max_influences=ROBLOX_MAX_BONE_INFLUENCES):
+    # run skin cleanup on every part deformed by armature_obj, returns report dict
+    start_time = time.perf_counter()
+    report = {"parts": {}, "removed_bones": []}
+    weighted_bone_names = set()
+    for obj in bpy.data.objects:
+        if obj.type != 'MESH':
+            continue
+        for mod in obj.modifiers:
+            if mod.type == "ARMATURE" and mod.object == armature_obj:
+                part_report, part_bone_names = cleanup_mesh_skin_weights(obj, armature_obj, max_influences)
+                report["parts"][obj.name] = part_report
+                weighted_bone_names |= part_bone_names
+                _add_to_log("DEBUG: cleanup_skin_weights(): " + obj.name + ": capped " + str(part_report["capped_vertices"]) + " vertices, removed vertex groups: " + str(part_report["removed_vertex_groups"]))
+                break
+    report["removed_bones"] = prune_unweighted_bones(armature_obj, weighted_bone_names)
+    elapsed_time = time.perf_counter() - start_time
+    _add_to_log("DEBUG: cleanup_skin_weights(): removed bones: " + str(report["removed_bones"]) + ", completed in " + str(round(elapsed_time, 3)) + " seconds")
+    return report